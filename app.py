@@ -1,25 +1,26 @@
-import os
-from quart import Quart
-from gino import Gino
-
-# Initialize the Gino database instance
-db = Gino()
+import time
+from quart import Quart, g, request
+from extensions import db  # The single Gino instance shared by models and routes
+from db_pool import DB_USER, DB_PASSWORD, DB_HOST, DB_PORT, DB_DATABASE, database_dsn, pool_settings, warm_pool
 
 def create_app():
     app = Quart(__name__)
 
-    # Fetch environment variables from .env file or set default values
-    app.config['DB_USER'] = os.getenv('DB_USER', 'yourusername')
-    app.config['DB_PASSWORD'] = os.getenv('DB_PASSWORD', 'yourpassword')
-    app.config['DB_HOST'] = os.getenv('DB_HOST', 'localhost')
-    app.config['DB_PORT'] = os.getenv('DB_PORT', 5432)  # Default Postgres port
-    app.config['DB_DATABASE'] = os.getenv('DB_DATABASE', 'yourdatabase')
+    # Fetch environment variables from .env file or set default values (read in db_pool)
+    app.config['DB_USER'] = DB_USER
+    app.config['DB_PASSWORD'] = DB_PASSWORD
+    app.config['DB_HOST'] = DB_HOST
+    app.config['DB_PORT'] = DB_PORT
+    app.config['DB_DATABASE'] = DB_DATABASE
 
     # Configure Gino PostgreSQL connection string
-    app.config['DB_DSN'] = f"postgresql://{app.config['DB_USER']}:{app.config['DB_PASSWORD']}@{app.config['DB_HOST']}:{app.config['DB_PORT']}/{app.config['DB_DATABASE']}"
+    app.config['DB_DSN'] = database_dsn()
 
-    # Initialize the Gino database with the Quart app
-    db.init_app(app)
+    # Bind the Gino database to a tuned, instrumented asyncpg pool for the life of the worker
+    @app.before_serving
+    async def connect_database():
+        await db.set_bind(app.config['DB_DSN'], **pool_settings())
+        await warm_pool(db)
 
     # Import models here to ensure they're known to the database
     from models import Card  # Import your models here
@@ -32,6 +33,82 @@ def create_app():
     app.register_blueprint(main_blueprint)
     app.register_blueprint(image_gen_blueprint, url_prefix='/api/image_gen')  # Unique prefix
 
+    # Per-route latency histogram, labelled by the URL rule rather than the raw path,
+    # and a trace per request whose span tree is logged when the request is slow
+    from metrics import http_request_duration
+    from tracing import start_trace, end_span, exporter
+
+    @app.before_request
+    async def start_request_timer():
+        g.request_started = time.perf_counter()
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        g.trace_span = start_trace(f"{request.method} {route}", method=request.method, path=request.path)
+
+    @app.after_request
+    async def record_request_duration(response):
+        started = getattr(g, 'request_started', None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule else 'unmatched'
+            http_request_duration.observe(time.perf_counter() - started, request.method, route, str(response.status_code))
+        root = getattr(g, 'trace_span', None)
+        if root is not None:
+            root.set_attribute('status_code', response.status_code)
+            end_span(root)
+            g.trace_span = None
+        return response
+
+    @app.teardown_request
+    async def end_request_trace(exc):
+        # Requests that failed before after_request still close their trace
+        root = getattr(g, 'trace_span', None)
+        if root is not None:
+            end_span(root, exc)
+            g.trace_span = None
+
+    @app.before_serving
+    async def start_trace_exporter():
+        exporter.start()
+
+    app.after_serving(exporter.stop)
+
+    # Release pooled upstream connections when the worker shuts down
+    from http_client import close_http_client
+    app.after_serving(close_http_client)
+
+    # Stop the image derivative encoding processes on shutdown
+    from image_derivatives import shutdown_executor
+    app.after_serving(shutdown_executor)
+
+    # Keep the pre-generated card inventory topped up in the background
+    from card_inventory import INVENTORY_ENABLED, replenisher
+    if INVENTORY_ENABLED:
+        @app.before_serving
+        async def start_inventory_replenisher():
+            replenisher.start()
+
+        app.after_serving(replenisher.stop)
+
+    # Share image request status events across workers when Postgres NOTIFY is enabled
+    from job_events import job_events
+    app.before_serving(job_events.start)
+    app.after_serving(job_events.stop)
+
+    # Drain the durable image generation queue
+    from image_jobs import IMAGE_JOB_ENABLED, worker_pool
+    if IMAGE_JOB_ENABLED:
+        @app.before_serving
+        async def start_image_job_workers():
+            worker_pool.start()
+
+        app.after_serving(worker_pool.stop)
+
+    # Close the pool last, after everything above that may still use it has stopped
+    @app.after_serving
+    async def disconnect_database():
+        engine = db.pop_bind()
+        if engine is not None:
+            await engine.close()
+
     return app
 
 # Create the Quart application instance
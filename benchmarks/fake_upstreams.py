@@ -0,0 +1,222 @@
+"""
+Local stand-ins for the OpenAI chat-completions and image-generation APIs and
+the fal.ai queue API, so the app can be benchmarked without cost or rate limits.
+
+Run on its own with `python -m benchmarks.fake_upstreams --port 8100`, then point
+the app at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1 and
+FAL_QUEUE_BASE_URL=http://127.0.0.1:8100/fal. benchmarks/run.py does this for you.
+"""
+import io
+import re
+import json
+import time
+import random
+import asyncio
+import argparse
+from uuid import uuid4
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Callable
+from quart import Quart, Response, jsonify, request
+from PIL import Image
+
+# Default behaviour of each fake upstream
+DEFAULT_LATENCY = {
+    'chat': 'lognormal:1500:0.4',  # Median 1.5 s, like a short gpt-4 completion
+    'images': 'lognormal:8000:0.3',  # DALL-E 3 at standard quality
+    'fal': 'lognormal:4000:0.3',  # Queue time plus a FLUX dev run
+    'download': 'fixed:20',  # Fetching the generated image from the CDN
+}
+
+CARD_COLORS = ['White', 'Blue', 'Black', 'Red', 'Green', 'Colorless']
+CARD_TYPES = ['Creature — Elf Druid', 'Instant', 'Sorcery', 'Enchantment', 'Artifact', 'Creature — Dragon']
+BATCH_PROMPT = re.compile(r'Create (\d+) distinct cards')
+RARITY_LINE = re.compile(r'^\d+\. (.+)$', re.MULTILINE)
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Build a latency sampler (seconds) from `fixed:<ms>`, `uniform:<min ms>:<max ms>`
+    or `lognormal:<median ms>:<sigma>`.
+    """
+    kind, *values = spec.split(':')
+    numbers = [float(value) for value in values]
+    if kind == 'fixed' and len(numbers) == 1:
+        return lambda: numbers[0] / 1000
+    if kind == 'uniform' and len(numbers) == 2:
+        return lambda: random.uniform(numbers[0], numbers[1]) / 1000
+    if kind == 'lognormal' and len(numbers) == 2:
+        median, sigma = numbers
+        return lambda: median / 1000 * random.lognormvariate(0, sigma)
+    raise ValueError(f"Invalid latency distribution '{spec}'")
+
+@dataclass
+class FakeUpstreamConfig:
+    latency: Dict[str, str] = field(default_factory=lambda: dict(DEFAULT_LATENCY))
+    error_rate: float = 0.0  # Share of calls answered with HTTP 500
+    throttle_rate: float = 0.0  # Share of calls answered with HTTP 429 and Retry-After
+    image_size: str = '1024x1024'
+    image_variants: int = 16  # Distinct images served; the image store deduplicates identical ones
+    seed: int = None
+
+def render_images(size: str, variants: int) -> List[bytes]:
+    """Noise PNGs, which compress about as badly as real artwork."""
+    width, height = (int(value) for value in size.lower().split('x'))
+    images = []
+    for _ in range(variants):
+        image = Image.frombytes('RGB', (width, height), random.randbytes(width * height * 3))
+        buffer = io.BytesIO()
+        image.save(buffer, 'PNG', compress_level=1)
+        images.append(buffer.getvalue())
+    return images
+
+def fake_card(rarity: str) -> Dict[str, Any]:
+    number = random.randint(1, 10 ** 6)
+    return {
+        'name': f"Benchmark Card {number}",
+        'manaCost': f"{{{random.randint(1, 6)}}}",
+        'type': random.choice(CARD_TYPES),
+        'color': random.choice(CARD_COLORS),
+        'abilities': 'Flying. When this enters the battlefield, draw a card.',
+        'flavorText': 'Measured twice, generated once.',
+        'rarity': rarity,
+        'powerToughness': f"{random.randint(0, 8)}/{random.randint(1, 8)}",
+    }
+
+def create_fake_app(config: FakeUpstreamConfig) -> Quart:
+    if config.seed is not None:
+        random.seed(config.seed)
+    app = Quart(__name__)
+    latency = {name: parse_latency(spec) for name, spec in config.latency.items()}
+    images = render_images(config.image_size, config.image_variants)
+    fal_requests: Dict[str, Dict[str, Any]] = {}
+    counters: Dict[str, int] = {}
+
+    def image_url(index: int) -> str:
+        return f"{request.host_url.rstrip('/')}/images/{index}.png"
+
+    async def simulate(upstream: str):
+        """Sleep for the upstream's latency, then maybe fail. Returns an error response or None."""
+        counters[upstream] = counters.get(upstream, 0) + 1
+        await asyncio.sleep(latency[upstream]())
+        roll = random.random()
+        if roll < config.throttle_rate:
+            return jsonify({'error': {'message': 'Rate limit reached', 'type': 'requests'}}), 429, {'Retry-After': '1'}
+        if roll < config.throttle_rate + config.error_rate:
+            return jsonify({'error': {'message': 'The server had an error', 'type': 'server_error'}}), 500
+        return None
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    async def chat_completions():
+        data = await request.get_json()
+        error = await simulate('chat')
+        if error is not None:
+            return error
+
+        prompt = data['messages'][-1]['content']
+        batch = BATCH_PROMPT.search(prompt)
+        if batch:
+            rarities = RARITY_LINE.findall(prompt)[:int(batch.group(1))]
+            content = json.dumps([fake_card(rarity) for rarity in rarities])
+        else:
+            content = json.dumps(fake_card('Common'))
+        return jsonify({
+            'id': f"chatcmpl-{uuid4().hex}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': data.get('model', 'gpt-4'),
+            'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}],
+            'usage': {'prompt_tokens': len(prompt) // 4, 'completion_tokens': len(content) // 4, 'total_tokens': (len(prompt) + len(content)) // 4},
+        })
+
+    @app.route('/v1/images/generations', methods=['POST'])
+    async def image_generations():
+        data = await request.get_json()
+        error = await simulate('images')
+        if error is not None:
+            return error
+        return jsonify({
+            'created': int(time.time()),
+            'data': [{'url': image_url(random.randrange(len(images)))} for _ in range(data.get('n', 1))],
+        })
+
+    @app.route('/fal/<path:model>', methods=['POST'])
+    async def fal_submit(model):
+        data = await request.get_json()
+        counters['fal_submit'] = counters.get('fal_submit', 0) + 1
+        request_id = str(uuid4())
+        base = f"{request.host_url.rstrip('/')}/fal/{model}/requests/{request_id}"
+        fal_requests[request_id] = {
+            'ready_at': time.monotonic() + latency['fal'](),
+            'failed': random.random() < config.error_rate,
+            'num_images': data.get('num_images', 1),
+            'seed': data.get('seed') or random.randint(0, 2 ** 31),
+        }
+        return jsonify({'request_id': request_id, 'status_url': f"{base}/status", 'response_url': base, 'cancel_url': f"{base}/cancel"})
+
+    @app.route('/fal/<path:_model>/requests/<request_id>/status')
+    async def fal_status(_model, request_id):
+        job = fal_requests.get(request_id)
+        if job is None:
+            return jsonify({'detail': 'Request not found'}), 404
+        if time.monotonic() < job['ready_at']:
+            return jsonify({'status': 'IN_PROGRESS'}), 202
+        return jsonify({'status': 'COMPLETED'})
+
+    @app.route('/fal/<path:_model>/requests/<request_id>')
+    async def fal_result(_model, request_id):
+        job = fal_requests.pop(request_id, None)
+        if job is None:
+            return jsonify({'detail': 'Request not found'}), 404
+        if job['failed']:
+            return jsonify({'detail': 'Generation failed'}), 500
+        width, height = (int(value) for value in config.image_size.lower().split('x'))
+        return jsonify({
+            'images': [
+                {'url': image_url(random.randrange(len(images))), 'width': width, 'height': height, 'content_type': 'image/png'}
+                for _ in range(job['num_images'])
+            ],
+            'seed': job['seed'],
+            'has_nsfw_concepts': [False] * job['num_images'],
+        })
+
+    @app.route('/images/<int:index>.png')
+    async def image(index):
+        await asyncio.sleep(latency['download']())
+        body = images[index % len(images)]
+        return Response(body, content_type='image/png', headers={'Content-Length': str(len(body))})
+
+    @app.route('/stats')
+    async def stats():
+        return jsonify({'calls': counters, 'fal_pending': len(fal_requests)})
+
+    return app
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    """Options shared with benchmarks/run.py."""
+    for name, spec in DEFAULT_LATENCY.items():
+        parser.add_argument(f'--{name}-latency', default=spec, help=f"Latency of the fake {name} upstream (default: {spec})")
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Share of upstream calls failing with HTTP 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of upstream calls answered with HTTP 429')
+    parser.add_argument('--image-size', default='1024x1024', help='Size of the generated images, WIDTHxHEIGHT')
+    parser.add_argument('--image-variants', type=int, default=16, help='Number of distinct images served')
+    parser.add_argument('--seed', type=int, help='Seed for reproducible latencies and failures')
+
+def config_from_args(args: argparse.Namespace) -> FakeUpstreamConfig:
+    return FakeUpstreamConfig(
+        latency={name: getattr(args, f'{name}_latency') for name in DEFAULT_LATENCY},
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        image_size=args.image_size,
+        image_variants=args.image_variants,
+        seed=args.seed,
+    )
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Serve fake OpenAI and fal.ai upstreams for benchmarking.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8100)
+    add_arguments(parser)
+    args = parser.parse_args()
+    create_fake_app(config_from_args(args)).run(host=args.host, port=args.port)
+
+if __name__ == '__main__':
+    main()
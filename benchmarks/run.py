@@ -0,0 +1,331 @@
+"""
+Offline load benchmark. Starts the fake upstreams and the app (unless --app-url
+points at one already running), drives each scenario at each concurrency level
+and writes p50/p95/p99 latency and requests per second as JSON.
+
+    python -m benchmarks.run --concurrency 1,8,32 --duration 30 --output bench.json
+    python -m benchmarks.run --baseline bench.json --fail-on-regression
+
+The app still needs its Postgres database (DB_* environment variables), migrated
+to head. Client-side upstream rate budgets are lifted unless --keep-rate-limits
+is given, since the fakes have none; the card inventory is disabled unless
+--inventory is given, so /api/generate_card exercises the upstream path.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+import httpx
+from benchmarks.fake_upstreams import add_arguments
+
+SCENARIOS = ['generate_card', 'open_pack', 'cards_pagination', 'card_image', 'image_gen']
+PERCENTILES = (50, 95, 99)
+IMAGE_SIZES = [None, 'thumb', 'grid', 'full']  # card_image requests rotate through the original and each derivative
+IMAGE_GEN_POLL_INTERVAL = 0.25
+IMAGE_GEN_TIMEOUT = 300
+READY_TIMEOUT = 60
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Recorder:
+    """Latencies and failures per series of one scenario run."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.recording = False
+
+    def record(self, series: str, seconds: float, ok: bool) -> None:
+        if not self.recording:
+            return
+        self.latencies.setdefault(series, [])
+        self.errors.setdefault(series, 0)
+        if ok:
+            self.latencies[series].append(seconds)
+        else:
+            self.errors[series] += 1
+
+    async def timed(self, series: str, request: Awaitable[httpx.Response], expected=(200,)) -> Optional[httpx.Response]:
+        started = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError:
+            self.record(series, time.perf_counter() - started, False)
+            return None
+        self.record(series, time.perf_counter() - started, response.status_code in expected)
+        return response
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    values = sorted(latencies)
+    summary = {
+        'requests': len(values),
+        'errors': errors,
+        'rps': round(len(values) / elapsed, 3) if elapsed else 0,
+        'mean_ms': round(sum(values) / len(values) * 1000, 2) if values else 0,
+        'max_ms': round(values[-1] * 1000, 2) if values else 0,
+    }
+    for pct in PERCENTILES:
+        summary[f'p{pct}_ms'] = round(percentile(values, pct) * 1000, 2)
+    return summary
+
+# Scenarios: each runs one iteration per call, recording one or more series
+class Scenarios:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder):
+        self.client = client
+        self.recorder = recorder
+        self.card_ids: List[int] = []
+        self.image_names: List[str] = []
+
+    async def setup(self) -> None:
+        """Collect existing cards and images to request, generating a pack if the database is empty."""
+        cursor = None
+        while len(self.card_ids) < 500:
+            params = {'per_page': 100, **({'cursor': cursor} if cursor else {})}
+            response = await self.client.get('/api/cards', params=params)
+            response.raise_for_status()
+            data = response.json()
+            for card in data.get('cards', []):
+                self.card_ids.append(card['id'])
+                self.image_names.extend(name for name in (card.get('image_url'), card.get('ai_image_url')) if name)
+            cursor = data.get('next_cursor')
+            if not cursor:
+                break
+        if not self.card_ids:
+            response = await self.client.post('/api/open_pack')
+            response.raise_for_status()
+            for card in response.json():
+                self.card_ids.append(card['id'])
+                if card.get('image_url'):
+                    self.image_names.append(card['image_url'])
+
+    async def generate_card(self, _state: Dict[str, Any]) -> None:
+        await self.recorder.timed('generate_card', self.client.post('/api/generate_card'), expected=(201,))
+
+    async def open_pack(self, _state: Dict[str, Any]) -> None:
+        await self.recorder.timed('open_pack', self.client.post('/api/open_pack'), expected=(201,))
+
+    async def cards_pagination(self, state: Dict[str, Any]) -> None:
+        """Walk the listing page by page, starting over at the end."""
+        params = {'per_page': 24}
+        if state.get('cursor'):
+            params['cursor'] = state['cursor']
+        response = await self.recorder.timed('cards_page', self.client.get('/api/cards', params=params))
+        state['cursor'] = response.json().get('next_cursor') if response is not None and response.status_code == 200 else None
+
+    async def card_image(self, state: Dict[str, Any]) -> None:
+        if not self.image_names:
+            raise RuntimeError('No card images to request')
+        size = IMAGE_SIZES[state.setdefault('count', 0) % len(IMAGE_SIZES)]
+        state['count'] += 1
+        params = {'size': size} if size else {}
+        series = f"card_image_{size or 'original'}"
+        await self.recorder.timed(
+            series,
+            self.client.get(f"/card_image/{random.choice(self.image_names)}", params=params, headers={'Accept': 'image/avif,image/webp,*/*'})
+        )
+
+    async def image_gen(self, _state: Dict[str, Any]) -> None:
+        """Submit an image request, then poll its status until it finishes."""
+        started = time.perf_counter()
+        payload = {'prompt': 'A benchmark dragon over a benchmark city', 'card_id': random.choice(self.card_ids)}
+        response = await self.recorder.timed(
+            'image_gen_submit', self.client.post('/api/image_gen/api/image_gen/generate-image', json=payload), expected=(200, 202)
+        )
+        if response is None or response.status_code not in (200, 202):
+            return
+        request_id = response.json()['request_id']
+        status = response.json().get('status')
+        while status == 'IN_PROGRESS' and time.perf_counter() - started < IMAGE_GEN_TIMEOUT:
+            await asyncio.sleep(IMAGE_GEN_POLL_INTERVAL)
+            response = await self.recorder.timed('image_gen_status', self.client.get(f'/api/image_gen/api/image_gen/request-status/{request_id}'))
+            status = response.json().get('status') if response is not None and response.status_code == 200 else None
+        self.recorder.record('image_gen_complete', time.perf_counter() - started, status == 'COMPLETED')
+
+async def run_scenario(app_url: str, scenario: str, concurrency: int, duration: float, warmup: float) -> Dict[str, Any]:
+    """Closed loop: `concurrency` workers issue iterations back to back for `duration` seconds after a warmup."""
+    recorder = Recorder()
+    limits = httpx.Limits(max_connections=concurrency * 2, max_keepalive_connections=concurrency * 2)
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=IMAGE_GEN_TIMEOUT) as client:
+        scenarios = Scenarios(client, recorder)
+        await scenarios.setup()
+        iteration: Callable[[Dict[str, Any]], Awaitable[None]] = getattr(scenarios, scenario)
+        deadline = time.perf_counter() + warmup + duration
+
+        async def worker() -> None:
+            state: Dict[str, Any] = {}
+            while time.perf_counter() < deadline:
+                await iteration(state)
+
+        workers = asyncio.gather(*(worker() for _ in range(concurrency)))
+        await asyncio.sleep(warmup)
+        recorder.recording = True
+        started = time.perf_counter()
+        await workers
+        elapsed = time.perf_counter() - started
+
+    return {
+        series: summarize(recorder.latencies[series], recorder.errors[series], elapsed)
+        for series in sorted(recorder.latencies)
+    }
+
+def compare(results: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Per series present in both runs: p95 and throughput change, flagged when worse than `tolerance`."""
+    changes = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        p95_change = (current['p95_ms'] - previous['p95_ms']) / previous['p95_ms'] if previous['p95_ms'] else 0.0
+        rps_change = (current['rps'] - previous['rps']) / previous['rps'] if previous['rps'] else 0.0
+        changes.append({
+            'series': key,
+            'p95_change': round(p95_change, 4),
+            'rps_change': round(rps_change, 4),
+            'regression': p95_change > tolerance or rps_change < -tolerance,
+        })
+    return changes
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def wait_until_ready(url: str, process: subprocess.Popen) -> None:
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{' '.join(process.args)} exited with code {process.returncode}")
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} did not become ready within {READY_TIMEOUT}s")
+
+def start_services(args: argparse.Namespace) -> List[subprocess.Popen]:
+    """Start the fake upstreams and the app, wired to each other through the environment."""
+    upstream_url = f"http://127.0.0.1:{args.upstream_port}"
+    upstream_args = [
+        '--port', str(args.upstream_port), '--error-rate', str(args.error_rate), '--throttle-rate', str(args.throttle_rate),
+        '--image-size', args.image_size, '--image-variants', str(args.image_variants),
+        '--chat-latency', args.chat_latency, '--images-latency', args.images_latency,
+        '--fal-latency', args.fal_latency, '--download-latency', args.download_latency,
+    ]
+    if args.seed is not None:
+        upstream_args += ['--seed', str(args.seed)]
+    upstreams = subprocess.Popen([sys.executable, '-m', 'benchmarks.fake_upstreams', *upstream_args], cwd=ROOT)
+    wait_until_ready(f"{upstream_url}/stats", upstreams)
+
+    env = dict(
+        os.environ,
+        OPENAI_API_KEY=os.getenv('OPENAI_API_KEY', 'benchmark'),
+        OPENAI_BASE_URL=f"{upstream_url}/v1",
+        FAL_KEY=os.getenv('FAL_KEY', 'benchmark'),
+        FAL_QUEUE_BASE_URL=f"{upstream_url}/fal",
+    )
+    if not args.keep_rate_limits:
+        env.update(OPENAI_CHAT_RPM='0', OPENAI_CHAT_TPM='0', OPENAI_IMAGES_RPM='0', FAL_RPM='0')
+    if not args.inventory:
+        env['INVENTORY_ENABLED'] = 'false'
+    app = subprocess.Popen(
+        [sys.executable, '-m', 'hypercorn', 'app:app', '--bind', f"127.0.0.1:{args.app_port}", '--workers', str(args.workers)],
+        cwd=ROOT, env=env
+    )
+    try:
+        wait_until_ready(f"http://127.0.0.1:{args.app_port}/metrics", app)
+    except RuntimeError:
+        upstreams.terminate()
+        raise
+    return [app, upstreams]
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Benchmark the app against local fake upstreams.')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument('--concurrency', default='1,8,32', help='Comma-separated concurrency levels')
+    parser.add_argument('--duration', type=float, default=30, help='Measured seconds per scenario and level')
+    parser.add_argument('--warmup', type=float, default=5, help='Unmeasured seconds before each run')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='Earlier JSON report to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Relative p95/throughput change counted as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true', help='Exit with status 1 if any series regressed')
+    parser.add_argument('--app-url', help='Benchmark an app that is already running (and wired to upstreams) instead of starting one')
+    parser.add_argument('--app-port', type=int, default=8000)
+    parser.add_argument('--upstream-port', type=int, default=8100)
+    parser.add_argument('--workers', type=int, default=1, help='Hypercorn worker processes for the app')
+    parser.add_argument('--keep-rate-limits', action='store_true', help='Keep the client-side upstream rate budgets')
+    parser.add_argument('--inventory', action='store_true', help='Keep the pre-generated card inventory enabled')
+    add_arguments(parser)
+    return parser.parse_args()
+
+def main() -> None:
+    args = parse_args()
+    scenarios = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        raise SystemExit(f"Unknown scenario(s): {', '.join(sorted(unknown))}")
+    levels = [int(level) for level in args.concurrency.split(',')]
+
+    processes = [] if args.app_url else start_services(args)
+    app_url = args.app_url or f"http://127.0.0.1:{args.app_port}"
+    report: Dict[str, Any] = {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(),
+            'git_commit': git_commit(),
+            'app_url': app_url,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'upstreams': {
+                'chat_latency': args.chat_latency, 'images_latency': args.images_latency,
+                'fal_latency': args.fal_latency, 'download_latency': args.download_latency,
+                'error_rate': args.error_rate, 'throttle_rate': args.throttle_rate, 'image_size': args.image_size,
+            },
+        },
+        'results': {},
+    }
+    try:
+        for scenario in scenarios:
+            for level in levels:
+                print(f"Running {scenario} at concurrency {level}...", file=sys.stderr)
+                series = asyncio.run(run_scenario(app_url, scenario, level, args.duration, args.warmup))
+                for name, summary in series.items():
+                    report['results'][f"{name}@c{level}"] = {'scenario': scenario, 'concurrency': level, **summary}
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            baseline = json.load(baseline_file)
+        report['comparison'] = compare(report['results'], baseline.get('results', {}), args.tolerance)
+        regressions = [change['series'] for change in report['comparison'] if change['regression']]
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+    if regressions:
+        print(f"Regressed: {', '.join(regressions)}", file=sys.stderr)
+        if args.fail_on_regression:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
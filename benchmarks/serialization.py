@@ -0,0 +1,124 @@
+"""
+Compare the two ways of rendering a gallery page of cards:
+
+- full: whole Card rows, to_dict() per card and json.dumps (the listing before summaries)
+- summary: the grid's columns only (card_json.CARD_SUMMARY_COLUMNS) encoded with orjson
+
+    python -m benchmarks.serialization --per-page 100 --iterations 2000
+    python -m benchmarks.serialization --with-database   # also times the two queries (DB_* settings)
+
+Writes per-page timings and body sizes as JSON.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+import statistics
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Callable
+from extensions import db
+from db_pool import database_dsn
+from models import Card
+from card_json import CARD_SUMMARY_FIELDS, card_summary_query, card_summaries, dumps
+
+# Typical lengths of generated card text
+ABILITIES_TEXT = "Flying, trample. When this creature enters the battlefield, target opponent reveals their hand. " * 3
+FLAVOR_TEXT = "The mountains remember every dragon that ever slept beneath them, and they do not forgive. "
+
+def synthetic_cards(count: int) -> List[Card]:
+    now = datetime.utcnow()
+    cards = []
+    for index in range(count, 0, -1):
+        created_at = now - timedelta(minutes=index)
+        cards.append(Card(
+            id=index, name=f"Benchmark Dragon {index}", mana_cost='{3}{R}{R}', card_type='Creature — Dragon',
+            color='Red', abilities=ABILITIES_TEXT, power_toughness='5/5', flavor_text=FLAVOR_TEXT,
+            rarity=random.choice(['Common', 'Uncommon', 'Rare', 'Mythic Rare']),
+            image_url=f"{random.getrandbits(256):064x}.png", set_name='GEN', card_number=index,
+            ai_image_url=None, ai_request_id=None, ai_image_status='PENDING', created_at=created_at, updated_at=created_at,
+        ))
+    return cards
+
+def render_full(cards: List[Card]) -> bytes:
+    return json.dumps({'cards': [card.to_dict() for card in cards], 'has_more': True}).encode('utf-8')
+
+def render_summary(rows: List[tuple]) -> bytes:
+    return dumps({'cards': card_summaries(rows), 'has_more': True})
+
+def time_calls(function: Callable[[], Any], iterations: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return {
+        'mean_us': round(statistics.fmean(samples) * 1e6, 2),
+        'p50_us': round(samples[len(samples) // 2] * 1e6, 2),
+        'p99_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1e6, 2),
+        'pages_per_second': round(1 / statistics.fmean(samples), 1),
+    }
+
+def benchmark_encoding(per_page: int, iterations: int) -> Dict[str, Any]:
+    cards = synthetic_cards(per_page)
+    # What card_summary_query() returns: one tuple of the summary columns per card
+    rows = [tuple(getattr(card, field) for field in CARD_SUMMARY_FIELDS) for card in cards]
+    results = {
+        'full': dict(time_calls(lambda: render_full(cards), iterations), bytes=len(render_full(cards))),
+        'summary': dict(time_calls(lambda: render_summary(rows), iterations), bytes=len(render_summary(rows))),
+    }
+    results['speedup'] = round(results['full']['mean_us'] / results['summary']['mean_us'], 2)
+    return results
+
+async def benchmark_database(per_page: int, iterations: int) -> Dict[str, Any]:
+    """Query plus encode against the real cards table, newest page first as the gallery does."""
+    await db.set_bind(database_dsn())
+    try:
+        async def full() -> bytes:
+            return render_full(await Card.query.order_by(Card.id.desc()).limit(per_page).gino.all())
+
+        async def summary() -> bytes:
+            return render_summary(await card_summary_query().order_by(Card.id.desc()).limit(per_page).gino.all())
+
+        results = {}
+        for name, render in (('full', full), ('summary', summary)):
+            await render()  # Warm the connection and statement cache
+            samples = []
+            for _ in range(iterations):
+                started = time.perf_counter()
+                body = await render()
+                samples.append(time.perf_counter() - started)
+            samples.sort()
+            results[name] = {
+                'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+                'p50_ms': round(samples[len(samples) // 2] * 1000, 3),
+                'p99_ms': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000, 3),
+                'bytes': len(body),
+            }
+        results['speedup'] = round(results['full']['mean_ms'] / results['summary']['mean_ms'], 2)
+        return results
+    finally:
+        await db.pop_bind().close()
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Compare full and summary card page serialization.')
+    parser.add_argument('--per-page', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=2000)
+    parser.add_argument('--with-database', action='store_true', help='Also time both queries against the database')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    report = {'per_page': args.per_page, 'iterations': args.iterations, 'encoding': benchmark_encoding(args.per_page, args.iterations)}
+    if args.with_database:
+        report['database'] = asyncio.run(benchmark_database(args.per_page, max(1, args.iterations // 10)))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as output_file:
+            output_file.write(output + '\n')
+    else:
+        print(output)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+from typing import Dict, Any, List
+
+# Rarity odds of generated cards and packs
+DEFAULT_RARITY_PROBABILITIES = {
+    'Common': 0.60,
+    'Uncommon': 0.30,
+    'Rare': 0.08,
+    'Mythic Rare': 0.02
+}
+
+def get_default_value_for_field(field: str) -> Any:
+    """Provide default values for missing card fields."""
+    default_values = {
+        'name': 'Unnamed Card',
+        'manaCost': '{0}',
+        'type': 'Unknown Type',
+        'color': 'Colorless',
+        'abilities': 'No abilities',
+        'flavorText': 'No flavor text',
+        'rarity': 'Common',
+        'powerToughness': 'N/A'
+    }
+    return default_values.get(field, 'Unknown')
+
+def standardize_card_data(card_data: Dict[str, Any]) -> List[str]:
+    """
+    Standardizes the card data field names to lowercase and 
+    transfers values from uppercase keys (if they exist).
+    Ensures all required fields are present and returns the ones that had to be defaulted.
+    """
+    mapping = {
+        'Name': 'name',
+        'ManaCost': 'manaCost',
+        'Type': 'type',
+        'Color': 'color',
+        'Abilities': 'abilities',
+        'FlavorText': 'flavorText',
+        'Rarity': 'rarity',
+        'PowerToughness': 'powerToughness'
+    }
+
+    # Transfer uppercase values to lowercase fields if present
+    for old_key, new_key in mapping.items():
+        if old_key in card_data:
+            card_data[new_key] = card_data.pop(old_key)
+
+    # Validate that all required fields are present and set defaults if missing
+    required_fields = ['name', 'manaCost', 'type', 'color', 'abilities', 'flavorText', 'rarity']
+    defaulted_fields = []
+    for field in required_fields:
+        if field not in card_data or not card_data[field]:
+            card_data[field] = get_default_value_for_field(field)
+            defaulted_fields.append(field)
+
+    return defaulted_fields
@@ -2,11 +2,20 @@ import random
 import json
 import logging
 import os
-import requests
-from typing import Dict, Any, List, Tuple
-from tenacity import retry, stop_after_attempt, wait_random_exponential
-from models import Card
-from openai_config import openai_client
+import asyncio
+import weakref
+from typing import Dict, Any, List, Coroutine
+from tenacity import retry, retry_if_not_exception_type, stop_after_attempt, wait_random_exponential
+from openai_config import get_async_openai_client
+from upstream_limits import upstream_limits, estimate_tokens, CircuitOpenError
+from metrics import record_retry
+from tracing import traced
+from image_ingest import ingest_image
+from image_derivatives import schedule_derivatives
+from image_store import IMAGE_SAVE_PATH
+# Card fields and numbering live in modules without the upstream clients, for scripts such as seed_cards
+from card_fields import DEFAULT_RARITY_PROBABILITIES, standardize_card_data
+from card_numbers import DEFAULT_SET_NAME, get_next_set_name_and_number, reserve_card_numbers
 
 # Logging configuration
 logging.basicConfig(
@@ -16,96 +25,61 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # Constants
-DEFAULT_SET_NAME = 'GEN'
-CARD_NUMBER_LIMIT = 999
-DEFAULT_RARITY_PROBABILITIES = {
-    'Common': 0.60,
-    'Uncommon': 0.30,
-    'Rare': 0.08,
-    'Mythic Rare': 0.02
+ESSENTIAL_CARD_FIELDS = ['name', 'type', 'abilities']  # A batched card missing any of these is regenerated
+CARD_MAX_TOKENS = 300  # Completion budget per card
+BATCH_REGENERATION_ATTEMPTS = 2  # Extra batch calls for malformed cards before falling back
+
+# Concurrency caps per upstream, shared by every pack being opened in this process
+UPSTREAM_CONCURRENCY = {
+    'openai_chat': int(os.getenv('OPENAI_CHAT_CONCURRENCY', 10)),
+    'openai_images': int(os.getenv('OPENAI_IMAGES_CONCURRENCY', 5)),
+    'image_download': int(os.getenv('IMAGE_DOWNLOAD_CONCURRENCY', 10)),
 }
-IMAGE_SAVE_PATH = 'card_images'  # Path to save images locally
+_upstream_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncio.Semaphore]]" = weakref.WeakKeyDictionary()
+
+def upstream_semaphore(upstream: str) -> asyncio.Semaphore:
+    """Return the concurrency gate for an upstream, scoped to the running event loop."""
+    loop = asyncio.get_running_loop()
+    semaphores = _upstream_semaphores.get(loop)
+    if semaphores is None:
+        semaphores = {name: asyncio.Semaphore(limit) for name, limit in UPSTREAM_CONCURRENCY.items()}
+        _upstream_semaphores[loop] = semaphores
+    return semaphores[upstream]
+
+def run_sync(coroutine: Coroutine) -> Any:
+    """Run a generator coroutine from synchronous code (scripts, shells). Not for use inside the event loop."""
+    return asyncio.run(coroutine)
 
 # Utility functions
 def safe_get_dict(data: Dict[str, Any], key: str, default: Any = None) -> Any:
     """Safely get a value from a dictionary, providing a default if the key is missing."""
     return data.get(key, default)
 
-def get_default_value_for_field(field: str) -> Any:
-    """Provide default values for missing card fields."""
-    default_values = {
-        'name': 'Unnamed Card',
-        'manaCost': '{0}',
-        'type': 'Unknown Type',
-        'color': 'Colorless',
-        'abilities': 'No abilities',
-        'flavorText': 'No flavor text',
-        'rarity': 'Common',
-        'powerToughness': 'N/A'
-    }
-    return default_values.get(field, 'Unknown')
-
-def standardize_card_data(card_data: Dict[str, Any]) -> None:
+def is_malformed_card_data(card_data: Any) -> bool:
     """
-    Standardizes the card data field names to lowercase and 
-    transfers values from uppercase keys (if they exist).
-    Ensures all required fields are present.
+    Standardize a generated card in place and report whether it is unusable,
+    i.e. not an object or missing one of the fields a card cannot be defaulted on.
     """
-    mapping = {
-        'Name': 'name',
-        'ManaCost': 'manaCost',
-        'Type': 'type',
-        'Color': 'color',
-        'Abilities': 'abilities',
-        'FlavorText': 'flavorText',
-        'Rarity': 'rarity',
-        'PowerToughness': 'powerToughness'
-    }
-
-    # Transfer uppercase values to lowercase fields if present
-    for old_key, new_key in mapping.items():
-        if old_key in card_data:
-            card_data[new_key] = card_data.pop(old_key)
-
-    # Validate that all required fields are present and set defaults if missing
-    required_fields = ['name', 'manaCost', 'type', 'color', 'abilities', 'flavorText', 'rarity']
-    for field in required_fields:
-        if field not in card_data or not card_data[field]:
-            card_data[field] = get_default_value_for_field(field)
-
-# Set and card number handling
-def get_next_set_name_and_number() -> Tuple[str, int]:
-    """Retrieve the next set name and card number for card generation, reset if needed."""
-    last_card = Card.query.order_by(Card.id.desc()).first()
-
-    if not last_card or last_card.card_number >= CARD_NUMBER_LIMIT:
-        last_set = last_card.set_name if last_card else DEFAULT_SET_NAME
-        next_set = increment_set_name(last_set)
-        logger.info(f"New set initialized: {next_set}")
-        return next_set, 1
-
-    return last_card.set_name, last_card.card_number + 1
-
-def increment_set_name(set_name: str) -> str:
-    """Increment the set name alphabetically (e.g., A -> B, Z -> AA, etc.)."""
-    if set_name == 'Z':
-        return 'AA'
-    if len(set_name) == 1 and set_name < 'Z':
-        return chr(ord(set_name) + 1)
-    return set_name
+    if not isinstance(card_data, dict):
+        return True
+    defaulted_fields = standardize_card_data(card_data)
+    return any(field in defaulted_fields for field in ESSENTIAL_CARD_FIELDS)
 
 # Card generation logic
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(3))
-def generate_card(rarity: str = None) -> Dict[str, Any]:
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(3), retry=retry_if_not_exception_type(CircuitOpenError), before_sleep=record_retry)
+async def generate_card_async(rarity: str = None) -> Dict[str, Any]:
     """Generate a card with optional rarity, using fallback data on failure."""
     prompt = generate_card_prompt(rarity)
 
     try:
-        response = openai_client.chat.completions.create(
-            model="gpt-4",
-            messages=[{"role": "user", "content": prompt}],
-            max_tokens=300
-        )
+        async with upstream_limits.call('openai_chat', 'gpt-4', estimate_tokens(prompt, CARD_MAX_TOKENS)) as call, upstream_semaphore('openai_chat'):
+            raw_response = await get_async_openai_client().chat.completions.with_raw_response.create(
+                model="gpt-4",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=CARD_MAX_TOKENS
+            )
+            await call.observe(raw_response.headers)
+        response = raw_response.parse()
         card_data_str = response.choices[0].message.content
         logger.debug(f"Raw card data from GPT: {card_data_str}")
         card_data = json.loads(card_data_str)
@@ -113,32 +87,134 @@ def generate_card(rarity: str = None) -> Dict[str, Any]:
         # Standardize field names and validate card data
         standardize_card_data(card_data)
 
-        # Assign set name and card number
-        set_name, card_number = get_next_set_name_and_number()
-        card_data['set_name'] = set_name
-        card_data['card_number'] = card_number
+    except (json.JSONDecodeError, ValueError, CircuitOpenError) as e:
+        logger.error(f"Error generating card: {e}")
+        card_data = generate_fallback_card(rarity)
 
-        return card_data
+    # Assign set name and card number
+    await assign_set_and_number(card_data)
 
-    except (json.JSONDecodeError, ValueError) as e:
-        logger.error(f"Error generating card: {e}")
-        return generate_fallback_card(rarity)
+    return card_data
+
+def generate_card(rarity: str = None) -> Dict[str, Any]:
+    """Synchronous wrapper around generate_card_async()."""
+    return run_sync(generate_card_async(rarity))
+
+async def assign_set_and_number(card_data: Dict[str, Any]) -> None:
+    """Assign the next set name and card number to a generated card."""
+    set_name, card_number = await get_next_set_name_and_number()
+    card_data['set_name'] = set_name
+    card_data['card_number'] = card_number
+
+# Attribute list shared by the single-card and batch prompts
+CARD_ATTRIBUTES_PROMPT = (
+    "- Name: A creative, thematic name\n"
+    "- ManaCost: Using curly braces (e.g., {{2}}{{W}}{{U}})\n"
+    "- Type: Full type line (e.g., 'Legendary Creature - Elf Warrior')\n"
+    "- Color: White, Blue, Black, Red, Green, or Colorless\n"
+    "- Abilities: List of abilities or rules text\n"
+    "- PowerToughness: For creatures, e.g., '2/3', or null for non-creatures\n"
+    "- FlavorText: A short, thematic description or quote\n"
+)
 
 def generate_card_prompt(rarity: str = None) -> str:
     """Generate the GPT prompt for creating the card."""
     return (
         f"Create a card with the following attributes:\n"
-        "- Name: A creative, thematic name\n"
-        "- ManaCost: Using curly braces (e.g., {{2}}{{W}}{{U}})\n"
-        "- Type: Full type line (e.g., 'Legendary Creature - Elf Warrior')\n"
-        "- Color: White, Blue, Black, Red, Green, or Colorless\n"
-        "- Abilities: List of abilities or rules text\n"
-        "- PowerToughness: For creatures, e.g., '2/3', or null for non-creatures\n"
-        "- FlavorText: A short, thematic description or quote\n"
+        f"{CARD_ATTRIBUTES_PROMPT}"
         f"- Rarity: {rarity if rarity else 'Common, Uncommon, Rare, Mythic Rare'}\n"
         "Return the response as a JSON object."
     )
 
+def generate_batch_card_prompt(rarities: List[str]) -> str:
+    """Generate the GPT prompt for creating several distinct cards in one completion."""
+    rarity_lines = ''.join(f"{index}. {rarity}\n" for index, rarity in enumerate(rarities, start=1))
+    return (
+        f"Create {len(rarities)} distinct cards. Each card has the following attributes:\n"
+        f"{CARD_ATTRIBUTES_PROMPT}"
+        "- Rarity: The rarity assigned to the card below\n"
+        f"Cards to create, in order, by rarity:\n{rarity_lines}"
+        f"Return the response as a JSON array of exactly {len(rarities)} objects, in the same order."
+    )
+
+# Batched card generation logic
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(3), retry=retry_if_not_exception_type(CircuitOpenError), before_sleep=record_retry)
+async def request_card_batch_async(rarities: List[str]) -> List[Any]:
+    """
+    Request several cards in one completion.
+    Returns one entry per requested rarity: the standardized card, or None if that element was malformed.
+    """
+    prompt = generate_batch_card_prompt(rarities)
+
+    try:
+        async with upstream_limits.call('openai_chat', 'gpt-4', estimate_tokens(prompt, CARD_MAX_TOKENS * len(rarities))) as call, upstream_semaphore('openai_chat'):
+            raw_response = await get_async_openai_client().chat.completions.with_raw_response.create(
+                model="gpt-4",
+                messages=[{"role": "user", "content": prompt}],
+                max_tokens=CARD_MAX_TOKENS * len(rarities)
+            )
+            await call.observe(raw_response.headers)
+    except CircuitOpenError as e:
+        # Every slot falls back to placeholder data while OpenAI is unhealthy
+        logger.error(f"Skipping card batch of {len(rarities)}: {e}")
+        return [None] * len(rarities)
+    response = raw_response.parse()
+    batch_str = response.choices[0].message.content
+    logger.debug(f"Raw card batch from GPT: {batch_str}")
+
+    try:
+        batch = json.loads(batch_str)
+    except json.JSONDecodeError as e:
+        logger.error(f"Error decoding card batch of {len(rarities)}: {e}")
+        return [None] * len(rarities)
+
+    # Tolerate a wrapping object such as {"cards": [...]}
+    if isinstance(batch, dict) and len(batch) == 1:
+        batch = next(iter(batch.values()))
+    if not isinstance(batch, list):
+        logger.error(f"Card batch is not a JSON array: {type(batch).__name__}")
+        return [None] * len(rarities)
+
+    cards = []
+    for index, rarity in enumerate(rarities):
+        card_data = batch[index] if index < len(batch) else None
+        if is_malformed_card_data(card_data):
+            cards.append(None)
+            continue
+        card_data['rarity'] = rarity  # The slot decides the rarity, not the model
+        cards.append(card_data)
+    return cards
+
+async def generate_cards_batch_async(rarities: List[str]) -> List[Dict[str, Any]]:
+    """
+    Generate the text of several cards with one completion, in the order of `rarities`.
+    Only malformed elements are requested again; any still missing afterwards use fallback data.
+    """
+    cards = await request_card_batch_async(rarities)
+
+    for attempt in range(BATCH_REGENERATION_ATTEMPTS):
+        malformed = [index for index, card_data in enumerate(cards) if card_data is None]
+        if not malformed:
+            break
+        logger.warning(f"Regenerating {len(malformed)} malformed card(s) of {len(rarities)} (attempt {attempt + 1})")
+        regenerated = await request_card_batch_async([rarities[index] for index in malformed])
+        for index, card_data in zip(malformed, regenerated, strict=True):
+            cards[index] = card_data
+
+    # One allocation round trip numbers the whole batch, fallback cards included
+    numbers = await reserve_card_numbers(len(rarities))
+    for index, (rarity, (set_name, card_number)) in enumerate(zip(rarities, numbers, strict=True)):
+        if cards[index] is None:
+            cards[index] = generate_fallback_card(rarity)
+        cards[index]['set_name'] = set_name
+        cards[index]['card_number'] = card_number
+
+    return cards
+
+def generate_cards_batch(rarities: List[str]) -> List[Dict[str, Any]]:
+    """Synchronous wrapper around generate_cards_batch_async()."""
+    return run_sync(generate_cards_batch_async(rarities))
+
 def generate_fallback_card(rarity: str) -> Dict[str, Any]:
     """Generate a basic fallback card when GPT response is invalid or missing."""
     return {
@@ -154,43 +230,44 @@ def generate_fallback_card(rarity: str) -> Dict[str, Any]:
     }
 
 # Image generation logic
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(3))
-def generate_card_image(card_data: Dict[str, Any], save_path: str = IMAGE_SAVE_PATH) -> str:
-    """Generate fantasy artwork for the card and save the image locally."""
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(3), retry=retry_if_not_exception_type(CircuitOpenError), before_sleep=record_retry)
+async def generate_card_image_async(card_data: Dict[str, Any], save_path: str = IMAGE_SAVE_PATH) -> str:
+    """Generate fantasy artwork for the card and save it in the local image store. Returns the blob name."""
     prompt = generate_image_prompt(card_data)
 
     try:
         # Generate the image using OpenAI's image API
-        response = openai_client.images.generate(
-            model="dall-e-3",
-            prompt=prompt,
-            size="1024x1024",
-            quality="standard",
-            n=1
-        )
+        async with upstream_limits.call('openai_images', 'dall-e-3') as call, upstream_semaphore('openai_images'):
+            raw_response = await get_async_openai_client().images.with_raw_response.generate(
+                model="dall-e-3",
+                prompt=prompt,
+                size="1024x1024",
+                quality="standard",
+                n=1
+            )
+            await call.observe(raw_response.headers)
+        response = raw_response.parse()
         image_url = response.data[0].url
 
-        # Fetch the image content from the URL
-        image_data = requests.get(image_url).content
-
-        # Ensure the save directory exists
-        os.makedirs(save_path, exist_ok=True)
-
-        # Generate a unique filename based on card name and number
-        file_name = f"{card_data['set_name']}_{card_data['card_number']}.png"
-        file_path = os.path.join(save_path, file_name)
+        # Stream the image straight to disk over the pooled connection
+        async with upstream_semaphore('image_download'):
+            file_name = await ingest_image(image_url, save_path)
 
-        # Save the image to the specified directory
-        with open(file_path, 'wb') as image_file:
-            image_file.write(image_data)
+        # Thumbnail, grid and full-size WebP/AVIF versions are encoded in the background
+        schedule_derivatives(save_path, file_name)
 
-        logger.info(f"Image saved locally at: {file_path}")
         return file_name  # Return the file name for serving via Flask
 
+    except CircuitOpenError:
+        raise
     except Exception as e:
         logger.error(f"Error generating or saving card image: {e}")
         raise ValueError(f"Failed to generate or save card image: {e}")
 
+def generate_card_image(card_data: Dict[str, Any], save_path: str = IMAGE_SAVE_PATH) -> str:
+    """Synchronous wrapper around generate_card_image_async()."""
+    return run_sync(generate_card_image_async(card_data, save_path))
+
 def generate_image_prompt(card_data: Dict[str, Any]) -> str:
     """Generate an image generation prompt based on card type and attributes."""
     card_type = card_data.get('type', 'Unknown')
@@ -216,7 +293,8 @@ def generate_image_prompt(card_data: Dict[str, Any]) -> str:
     return prompt
 
 # Flexible card generation with optional JSON input
-def generate_card_with_rarity(rarity: str, json_data: Dict[str, Any] = None) -> Dict[str, Any]:
+@traced('generate_card_with_rarity')
+async def generate_card_with_rarity_async(rarity: str, json_data: Dict[str, Any] = None) -> Dict[str, Any]:
     """
     Generate a card with the specified rarity, or use the provided JSON data if available.
     """
@@ -228,37 +306,84 @@ def generate_card_with_rarity(rarity: str, json_data: Dict[str, Any] = None) ->
             logger.info(f"Using provided JSON data to generate image for card: {card_data['name']}")
         else:
             # Generate a card if no JSON data is provided
-            card_data = generate_card(rarity)
+            card_data = await generate_card_async(rarity)
 
         # Generate the image from the card data
-        card_data['image_url'] = generate_card_image(card_data)  # Store the image file name
+        card_data['image_url'] = await generate_card_image_async(card_data)  # Store the image file name
         return card_data
 
     except Exception as e:
         logger.error(f"Failed to generate card with rarity {rarity}: {e}")
         raise ValueError(f"Failed to generate card with rarity {rarity}: {e}")
 
-# Pack simulation
-def open_pack() -> List[Dict[str, Any]]:
-    """Simulate opening a card pack."""
-    pack = []
+def generate_card_with_rarity(rarity: str, json_data: Dict[str, Any] = None) -> Dict[str, Any]:
+    """Synchronous wrapper around generate_card_with_rarity_async()."""
+    return run_sync(generate_card_with_rarity_async(rarity, json_data))
 
+# Pack simulation
+def get_pack_slots() -> List[str]:
+    """Roll the rarity of every slot in a pack: 1 Rare/Mythic Rare, 3 Uncommon, 6 Common."""
     rarity_probabilities = get_rarity_probabilities()
 
-    # Generate one Rare or Mythic Rare card
+    # One Rare or Mythic Rare card
     rare_or_mythic = random.choices(['Rare', 'Mythic Rare'], weights=[rarity_probabilities['Rare'], rarity_probabilities['Mythic Rare']])[0]
-    pack.append(generate_card_with_rarity(rare_or_mythic))
 
-    # Generate three Uncommon cards
-    for _ in range(3):
-        pack.append(generate_card_with_rarity('Uncommon'))
+    return [rare_or_mythic] + ['Uncommon'] * 3 + ['Common'] * 6
 
-    # Generate six Common cards
-    for _ in range(6):
-        pack.append(generate_card_with_rarity('Common'))
+async def generate_pack_cards_async(rarities: List[str]) -> List[Dict[str, Any]]:
+    """
+    Generate complete cards (text and image) for the given rarities.
+    The text comes from one batched completion, then all images are generated
+    at once; the per-upstream semaphores cap how many calls actually hit
+    OpenAI in parallel. Cards are returned in the order of `rarities`.
+    """
+    cards = await generate_cards_batch_async(rarities)
+    return list(await asyncio.gather(*(
+        generate_card_with_rarity_async(rarity, json_data=card_data)
+        for rarity, card_data in zip(rarities, cards, strict=True)
+    )))
+
+async def open_pack_async(use_stock: bool = True, claimed: List[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Simulate opening a card pack.
+    Slots are filled from the pre-generated inventory first; only the slots
+    whose rarity is out of stock are generated live. Cards are returned in slot order.
+    Cards taken from stock are appended to `claimed` so a failed request can restock them.
+    """
+    from card_inventory import claim_stocked_cards
+
+    slots = get_pack_slots()
+    pack = await claim_stocked_cards(slots, claimed) if use_stock else [None] * len(slots)
+
+    missing = [index for index, card_data in enumerate(pack) if card_data is None]
+    if missing:
+        logger.info(f"Generating {len(missing)} of {len(slots)} pack slot(s) live")
+        live_cards = await generate_pack_cards_async([slots[index] for index in missing])
+        for index, card_data in zip(missing, live_cards, strict=True):
+            pack[index] = card_data
 
     return pack
 
+def open_pack(use_stock: bool = True) -> List[Dict[str, Any]]:
+    """Synchronous wrapper around open_pack_async()."""
+    return run_sync(open_pack_async(use_stock))
+
+async def draw_card_async(rarity: str = None, use_stock: bool = True, claimed: List[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Draw a single complete card, from the inventory when possible, otherwise generated live."""
+    from card_inventory import claim_stocked_cards
+
+    rarity = rarity or roll_rarity()
+    if use_stock:
+        stocked = (await claim_stocked_cards([rarity], claimed))[0]
+        if stocked is not None:
+            return stocked
+    return await generate_card_with_rarity_async(rarity)
+
+def roll_rarity() -> str:
+    """Pick a rarity according to the configured rarity probabilities."""
+    rarity_probabilities = get_rarity_probabilities()
+    return random.choices(list(rarity_probabilities), weights=list(rarity_probabilities.values()))[0]
+
 def get_rarity_probabilities() -> Dict[str, float]:
     """Fetch or configure the rarity probabilities dynamically."""
     return DEFAULT_RARITY_PROBABILITIES
\ No newline at end of file
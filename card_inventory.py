@@ -0,0 +1,222 @@
+import os
+import time
+import asyncio
+import logging
+import contextlib
+import asyncpg
+from collections import Counter, deque
+from typing import Dict, Any, List, Optional
+from extensions import db
+from models import StockedCard
+from card_generator import DEFAULT_RARITY_PROBABILITIES, generate_pack_cards_async
+
+logger = logging.getLogger(__name__)
+
+# Inventory levels per rarity: refill back up to the target once a rarity drops below its low-water mark
+INVENTORY_TARGET_LEVELS = {
+    'Common': int(os.getenv('INVENTORY_TARGET_COMMON', 60)),
+    'Uncommon': int(os.getenv('INVENTORY_TARGET_UNCOMMON', 30)),
+    'Rare': int(os.getenv('INVENTORY_TARGET_RARE', 8)),
+    'Mythic Rare': int(os.getenv('INVENTORY_TARGET_MYTHIC_RARE', 4)),
+}
+INVENTORY_LOW_WATER_RATIO = float(os.getenv('INVENTORY_LOW_WATER_RATIO', 0.5))
+INVENTORY_LOW_WATER_LEVELS = {
+    rarity: int(target * INVENTORY_LOW_WATER_RATIO) for rarity, target in INVENTORY_TARGET_LEVELS.items()
+}
+INVENTORY_ENABLED = os.getenv('INVENTORY_ENABLED', 'true').lower() == 'true'
+INVENTORY_CHECK_INTERVAL = float(os.getenv('INVENTORY_CHECK_INTERVAL', 10))  # Seconds between level checks
+INVENTORY_REFILL_BATCH = int(os.getenv('INVENTORY_REFILL_BATCH', 10))  # Cards generated per batched round trip
+INVENTORY_RATE_WINDOW = 600  # Seconds of history used for the refill rate
+
+# Advisory lock key so only one worker process refills at a time
+INVENTORY_LOCK_KEY = 0x63617264  # 'card'
+
+# Claiming stock
+async def claim_cards(rarity: str, count: int) -> List[Dict[str, Any]]:
+    """
+    Atomically take up to `count` stocked cards of a rarity out of the inventory.
+    Concurrent claimers skip rows locked by each other, so a card is never handed out twice.
+    """
+    if count <= 0:
+        return []
+
+    card_stock = StockedCard.__table__
+    oldest = (
+        db.select([card_stock.c.id])
+        .where(card_stock.c.rarity == rarity)
+        .order_by(card_stock.c.id)
+        .limit(count)
+        .with_for_update(skip_locked=True)
+    )
+    rows = await db.all(
+        card_stock.delete()
+        .where(card_stock.c.id.in_(oldest))
+        .returning(card_stock.c.card_data)
+    )
+    return [row[0] for row in rows]
+
+async def claim_stocked_cards(rarities: List[str], claimed: Optional[List[Dict[str, Any]]] = None) -> List[Optional[Dict[str, Any]]]:
+    """
+    Claim one stocked card per requested rarity, keeping the requested order.
+    Slots whose rarity is out of stock come back as None. Every rarity is claimed
+    in one transaction, so a database error leaves the whole stock untouched.
+    Claimed cards are also appended to `claimed`, for restock_cards() if the caller fails later.
+    """
+    taken = {}
+    try:
+        async with db.transaction():
+            for rarity, count in Counter(rarities).items():
+                taken[rarity] = await claim_cards(rarity, count)
+    except (asyncpg.PostgresError, OSError) as e:
+        # The inventory is an accelerator: a pack is generated live rather than failed when stock is unavailable
+        logger.error(f"Error claiming stocked cards, generating live instead: {e}")
+        taken = {}
+
+    cards = []
+    for rarity in rarities:
+        stock = taken.get(rarity)
+        cards.append(stock.pop() if stock else None)
+    if claimed is not None:
+        claimed.extend(card_data for card_data in cards if card_data is not None)
+    return cards
+
+async def restock_cards(cards: List[Dict[str, Any]]) -> None:
+    """Put claimed cards back into the inventory after the request that claimed them failed."""
+    if not cards:
+        return
+    try:
+        await StockedCard.insert().gino.all([
+            {'rarity': card_data['rarity'], 'card_data': card_data} for card_data in cards
+        ])
+        logger.info(f"Returned {len(cards)} claimed card(s) to the inventory")
+    except Exception as e:
+        logger.error(f"Could not return {len(cards)} claimed card(s) to the inventory: {e}")
+
+async def get_stock_levels() -> Dict[str, int]:
+    """Return the number of stocked cards per rarity."""
+    card_stock = StockedCard.__table__
+    rows = await db.all(
+        db.select([card_stock.c.rarity, db.func.count(card_stock.c.id)])
+        .group_by(card_stock.c.rarity)
+    )
+    levels = dict.fromkeys(INVENTORY_TARGET_LEVELS, 0)
+    levels.update(rows)
+    return levels
+
+# Replenishing stock
+class InventoryReplenisher:
+    """
+    Background task that keeps the card inventory between its low-water and target levels.
+    Refills run in the order of DEFAULT_RARITY_PROBABILITIES so commons, which packs drain fastest, come first.
+    """
+
+    def __init__(self, check_interval: float = INVENTORY_CHECK_INTERVAL, refill_batch: int = INVENTORY_REFILL_BATCH):
+        self.check_interval = check_interval
+        self.refill_batch = refill_batch
+        self.task: Optional[asyncio.Task] = None
+        self.refilled_total = 0
+        self.errors_total = 0
+        self.last_refill_at: Optional[float] = None
+        self.last_levels: Dict[str, int] = {}
+        self._refill_times: deque = deque()
+
+    def start(self) -> None:
+        """Start the replenisher on the running event loop."""
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+            logger.info("Card inventory replenisher started")
+
+    async def stop(self) -> None:
+        """Cancel the replenisher and wait for it to finish."""
+        if self.task is not None:
+            self.task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self.task
+            self.task = None
+            logger.info("Card inventory replenisher stopped")
+
+    async def run(self) -> None:
+        """Check the stock levels forever, refilling whenever a rarity is below its low-water mark."""
+        while True:
+            try:
+                await self.refill_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors_total += 1
+                logger.error(f"Error replenishing card inventory: {e}", exc_info=True)
+            await asyncio.sleep(self.check_interval)
+
+    async def refill_once(self) -> int:
+        """Run one refill pass if no other worker is refilling. Returns the number of cards added."""
+        async with db.acquire() as conn:
+            if not await conn.scalar(db.text('SELECT pg_try_advisory_lock(:key)'), key=INVENTORY_LOCK_KEY):
+                return 0
+            try:
+                added = 0
+                self.last_levels = await get_stock_levels()
+                for rarity in DEFAULT_RARITY_PROBABILITIES:
+                    level = self.last_levels.get(rarity, 0)
+                    if level >= INVENTORY_LOW_WATER_LEVELS[rarity]:
+                        continue
+                    added += await self.refill_rarity(rarity, INVENTORY_TARGET_LEVELS[rarity] - level)
+                return added
+            finally:
+                await conn.scalar(db.text('SELECT pg_advisory_unlock(:key)'), key=INVENTORY_LOCK_KEY)
+
+    async def refill_rarity(self, rarity: str, needed: int) -> int:
+        """Generate and stock `needed` cards of a rarity, one batch at a time."""
+        logger.info(f"Refilling {needed} {rarity} card(s) into the inventory")
+        added = 0
+        while added < needed:
+            count = min(self.refill_batch, needed - added)
+            cards = await generate_pack_cards_async([rarity] * count)
+            await StockedCard.insert().gino.all([
+                {'rarity': rarity, 'card_data': card_data} for card_data in cards
+            ])
+            added += count
+            self.last_levels[rarity] = self.last_levels.get(rarity, 0) + count
+            self._record_refill(count)
+        return added
+
+    def _record_refill(self, count: int) -> None:
+        """Remember when cards were added so the refill rate can be reported."""
+        now = time.monotonic()
+        self.refilled_total += count
+        self.last_refill_at = time.time()
+        self._refill_times.append((now, count))
+        while self._refill_times and self._refill_times[0][0] < now - INVENTORY_RATE_WINDOW:
+            self._refill_times.popleft()
+
+    def refill_rate(self) -> float:
+        """Cards added per minute over the recent rate window."""
+        cutoff = time.monotonic() - INVENTORY_RATE_WINDOW
+        recent = sum(count for added_at, count in self._refill_times if added_at >= cutoff)
+        return recent / (INVENTORY_RATE_WINDOW / 60)
+
+    def stats(self) -> Dict[str, Any]:
+        """Refill statistics for this worker."""
+        return {
+            'running': self.task is not None and not self.task.done(),
+            'refilled_total': self.refilled_total,
+            'refill_rate_per_minute': round(self.refill_rate(), 2),
+            'last_refill_at': self.last_refill_at,
+            'errors_total': self.errors_total,
+        }
+
+replenisher = InventoryReplenisher()
+
+async def get_inventory_status() -> Dict[str, Any]:
+    """Current stock, target and low-water levels per rarity, plus refill statistics."""
+    levels = await get_stock_levels()
+    return {
+        'levels': {
+            rarity: {
+                'stock': levels.get(rarity, 0),
+                'target': INVENTORY_TARGET_LEVELS[rarity],
+                'low_water': INVENTORY_LOW_WATER_LEVELS[rarity],
+            }
+            for rarity in INVENTORY_TARGET_LEVELS
+        },
+        'replenisher': replenisher.stats(),
+    }
@@ -0,0 +1,27 @@
+from typing import Dict, Any, List
+import orjson
+from extensions import db
+from models import Card
+
+# Columns the gallery grid renders. Abilities and flavor text are the bulky ones
+# and are fetched per card from /api/cards/<id> when a tile scrolls into view.
+CARD_SUMMARY_COLUMNS = [
+    Card.id, Card.name, Card.mana_cost, Card.card_type, Card.color, Card.rarity,
+    Card.power_toughness, Card.image_url, Card.set_name, Card.card_number, Card.updated_at,
+]
+CARD_SUMMARY_FIELDS = [str(column.name) for column in CARD_SUMMARY_COLUMNS]  # Plain str: orjson rejects str subclasses as keys
+
+def dumps(value: Any) -> bytes:
+    """
+    Encode a response body with orjson. Naive datetimes come out in the same
+    ISO 8601 form as isoformat(), so no per-field conversion is needed.
+    """
+    return orjson.dumps(value)
+
+def card_summary_query():
+    """SELECT of the summary columns only; filter, order and limit it like Card.query."""
+    return db.select(CARD_SUMMARY_COLUMNS)
+
+def card_summaries(rows) -> List[Dict[str, Any]]:
+    """Summary dicts from card_summary_query() rows."""
+    return [dict(zip(CARD_SUMMARY_FIELDS, row, strict=True)) for row in rows]
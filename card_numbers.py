@@ -0,0 +1,78 @@
+import logging
+from typing import List, Tuple
+from extensions import db
+
+logger = logging.getLogger(__name__)
+
+# Set and card number handling
+DEFAULT_SET_NAME = 'GEN'
+CARD_NUMBER_LIMIT = 999
+CARD_NUMBER_COUNTER_ID = 1  # The single row of card_number_counter
+
+async def reserve_card_numbers(count: int) -> List[Tuple[str, int]]:
+    """
+    Atomically reserve `count` consecutive (set name, card number) pairs.
+    The common case is a single UPDATE ... RETURNING; when the block crosses
+    CARD_NUMBER_LIMIT the counter row is locked and the block continues in the
+    next set from increment_set_name().
+    """
+    if count <= 0:
+        return []
+
+    row = await db.first(
+        db.text(
+            "UPDATE card_number_counter SET next_number = next_number + :count "
+            "WHERE id = :id AND next_number + :count - 1 <= :limit "
+            "RETURNING set_name, next_number - :count AS first_number"
+        ),
+        count=count, id=CARD_NUMBER_COUNTER_ID, limit=CARD_NUMBER_LIMIT
+    )
+    if row is not None:
+        set_name, first_number = row
+        return [(set_name, first_number + offset) for offset in range(count)]
+
+    return await reserve_card_numbers_across_sets(count)
+
+async def reserve_card_numbers_across_sets(count: int) -> List[Tuple[str, int]]:
+    """Reserve a block that rolls over into the next set(s), holding the counter row lock."""
+    async with db.transaction():
+        await db.status(
+            db.text(
+                "INSERT INTO card_number_counter (id, set_name, next_number) VALUES (:id, :set_name, 1) "
+                "ON CONFLICT (id) DO NOTHING"
+            ),
+            id=CARD_NUMBER_COUNTER_ID, set_name=DEFAULT_SET_NAME
+        )
+        set_name, next_number = await db.first(
+            db.text("SELECT set_name, next_number FROM card_number_counter WHERE id = :id FOR UPDATE"),
+            id=CARD_NUMBER_COUNTER_ID
+        )
+
+        reserved = []
+        while len(reserved) < count:
+            if next_number > CARD_NUMBER_LIMIT:
+                set_name = increment_set_name(set_name)
+                next_number = 1
+                logger.info(f"New set initialized: {set_name}")
+            reserved.append((set_name, next_number))
+            next_number += 1
+
+        await db.status(
+            db.text("UPDATE card_number_counter SET set_name = :set_name, next_number = :next_number WHERE id = :id"),
+            set_name=set_name, next_number=next_number, id=CARD_NUMBER_COUNTER_ID
+        )
+    return reserved
+
+async def get_next_set_name_and_number() -> Tuple[str, int]:
+    """Retrieve the next set name and card number for card generation, reset if needed."""
+    return (await reserve_card_numbers(1))[0]
+
+def increment_set_name(set_name: str) -> str:
+    """Increment the set name alphabetically (e.g., A -> B, Z -> AA, GEN -> GEO, AZ -> BA, etc.)."""
+    letters = list(set_name)
+    for index in range(len(letters) - 1, -1, -1):
+        if letters[index] < 'Z':
+            letters[index] = chr(ord(letters[index]) + 1)
+            return ''.join(letters)
+        letters[index] = 'A'
+    return 'A' + ''.join(letters)
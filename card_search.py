@@ -0,0 +1,54 @@
+import logging
+from typing import Dict, Any, List, Optional, Tuple
+from extensions import db
+from models import Card
+
+logger = logging.getLogger(__name__)
+
+# Search settings
+SEARCH_MAX_QUERY_LENGTH = 200
+SEARCH_CONFIG = 'english'  # Text search configuration the search_vector column is built with
+
+# GIN indexes behind the search, by name, as migration d7f9b1c3e5a8 creates them; seed_cards rebuilds them from here
+SEARCH_INDEXES = {
+    'ix_cards_search_vector': "CREATE INDEX ix_cards_search_vector ON cards USING gin (search_vector)",
+    'ix_cards_name_trgm': "CREATE INDEX ix_cards_name_trgm ON cards USING gin (name gin_trgm_ops)",
+}
+
+# Columns returned for each hit; search_vector itself never leaves the database
+CARD_COLUMNS = ', '.join(f"cards.{column.name}" for column in Card.__table__.columns)
+
+# Full-text matches use the GIN index on search_vector; the trigram operator (%)
+# uses the gin_trgm_ops index on name so misspelled names still match.
+# Rank combines cover density over the weighted vector with name similarity.
+SEARCH_SQL = f"""
+SELECT * FROM (
+    SELECT {CARD_COLUMNS},
+           ts_rank_cd(cards.search_vector, query, 32) + similarity(cards.name, :q) AS rank
+    FROM cards, websearch_to_tsquery('{SEARCH_CONFIG}', :q) AS query
+    WHERE cards.search_vector @@ query OR cards.name % :q
+) AS matches
+{{after}}
+ORDER BY rank DESC, id DESC
+LIMIT :limit
+"""
+SEARCH_AFTER_SQL = "WHERE (rank, id) < (CAST(:after_rank AS real), :after_id)"
+
+async def search_cards(q: str, limit: int, after: Optional[Tuple[float, int]] = None) -> List[Tuple[Card, float]]:
+    """
+    Ranked search over name, type line, abilities and flavor text.
+    `after` is the (rank, id) of the last hit already served, for keyset pagination.
+    Returns (card, rank) pairs, best match first.
+    """
+    params: Dict[str, Any] = {'q': q, 'limit': limit}
+    if after is not None:
+        params['after_rank'], params['after_id'] = after
+    sql = SEARCH_SQL.format(after=SEARCH_AFTER_SQL if after is not None else '')
+
+    rows = await db.all(db.text(sql), **params)
+    results = []
+    for row in rows:
+        values = dict(row.items())
+        rank = values.pop('rank')
+        results.append((Card(**values), rank))
+    return results
@@ -0,0 +1,128 @@
+import os
+import logging
+from datetime import datetime
+from typing import Dict, Any, List
+from extensions import db
+from models import Card
+from card_numbers import CARD_NUMBER_COUNTER_ID, CARD_NUMBER_LIMIT, reserve_card_numbers, reserve_card_numbers_across_sets
+
+logger = logging.getLogger(__name__)
+
+# Card lists at least this long are written with COPY instead of INSERT
+BULK_COPY_THRESHOLD = int(os.getenv('BULK_COPY_THRESHOLD', 10000))
+
+# Text columns taken from the cleaned card data, in insert order
+CARD_TEXT_COLUMNS = [
+    'name', 'mana_cost', 'card_type', 'color', 'abilities', 'power_toughness',
+    'flavor_text', 'rarity', 'image_url', 'set_name'
+]
+RETURNED_COLUMNS = CARD_TEXT_COLUMNS + [
+    'id', 'card_number', 'ai_image_url', 'ai_request_id', 'ai_image_status', 'created_at', 'updated_at'
+]
+
+# One statement numbers and inserts a whole list of cards. Cards arrive as parallel
+# arrays; the ones without a card number take consecutive numbers from the counter
+# row, updated in the same statement. The insert is skipped when the block would
+# cross CARD_NUMBER_LIMIT, so the caller can take the rollover path instead.
+BULK_INSERT_SQL = f"""
+WITH incoming AS (
+    SELECT * FROM unnest(
+        {', '.join(f'CAST(:{column} AS text[])' for column in CARD_TEXT_COLUMNS)}, CAST(:card_number AS integer[])
+    ) WITH ORDINALITY AS incoming({', '.join(CARD_TEXT_COLUMNS)}, card_number, position)
+),
+counter AS (
+    UPDATE card_number_counter SET next_number = next_number + :unnumbered
+    WHERE id = :counter_id AND :unnumbered > 0 AND next_number + :unnumbered - 1 <= :limit
+    RETURNING set_name, next_number - :unnumbered AS first_number
+),
+numbered AS (
+    SELECT incoming.*,
+           row_number() OVER (PARTITION BY incoming.card_number IS NULL ORDER BY incoming.position) - 1 AS block_offset
+    FROM incoming
+)
+INSERT INTO cards ({', '.join(CARD_TEXT_COLUMNS)}, card_number, ai_image_status, created_at, updated_at)
+SELECT {', '.join(f'numbered.{column}' for column in CARD_TEXT_COLUMNS if column != 'set_name')},
+       COALESCE(numbered.set_name, counter.set_name),
+       COALESCE(numbered.card_number, counter.first_number + numbered.block_offset),
+       'PENDING', CAST(:now AS timestamp), CAST(:now AS timestamp)
+FROM numbered LEFT JOIN counter ON true
+WHERE :unnumbered = 0 OR EXISTS (SELECT 1 FROM counter)
+ORDER BY numbered.position
+RETURNING {', '.join(RETURNED_COLUMNS)}
+"""
+
+def normalize_numbers(cards: List[Dict[str, Any]]) -> int:
+    """A card without a card number also gives up its set name. Returns how many need numbering."""
+    unnumbered = 0
+    for card in cards:
+        if not card.get('card_number'):
+            card['card_number'] = None
+            card['set_name'] = None
+            unnumbered += 1
+    return unnumbered
+
+async def insert_cards(cards: List[Dict[str, Any]]) -> List[Card]:
+    """
+    Persist cleaned card data (Card column names) with one multi-row INSERT ... RETURNING.
+    Cards lacking a card number are numbered in the same statement.
+    Returns the stored cards in input order.
+    """
+    if not cards:
+        return []
+    cards = [dict(card) for card in cards]
+    unnumbered = normalize_numbers(cards)
+
+    async def run_insert(unnumbered: int):
+        return await db.all(
+            db.text(BULK_INSERT_SQL),
+            card_number=[card['card_number'] for card in cards], unnumbered=unnumbered,
+            counter_id=CARD_NUMBER_COUNTER_ID, limit=CARD_NUMBER_LIMIT, now=datetime.utcnow(),
+            **{column: [card.get(column) for card in cards] for column in CARD_TEXT_COLUMNS}
+        )
+
+    async with db.transaction():
+        rows = await run_insert(unnumbered)
+        if not rows:
+            # The block crosses into the next set; number it with the row lock held, then insert
+            numbers = iter(await reserve_card_numbers_across_sets(unnumbered))
+            for card in cards:
+                if card['card_number'] is None:
+                    card['set_name'], card['card_number'] = next(numbers)
+            rows = await run_insert(0)
+
+    # RETURNING order is not guaranteed, but (set_name, card_number) is unique. Numbers
+    # handed out in the statement ascend in input order, so those cards match up by number.
+    stored = {(row['set_name'], row['card_number']): Card(**dict(row.items())) for row in rows}
+    keys = [(card['set_name'], card['card_number']) for card in cards]
+    assigned = iter(sorted(set(stored) - set(keys), key=lambda key: key[1]))
+    return [stored[key if key[1] is not None else next(assigned)] for key in keys]
+
+async def copy_cards(cards: List[Dict[str, Any]]) -> int:
+    """
+    Persist a large list of cleaned card data with COPY, numbering the cards
+    without a card number as one reserved block. Returns the number of rows written.
+    """
+    if not cards:
+        return 0
+    cards = [dict(card) for card in cards]
+    numbers = iter(await reserve_card_numbers(normalize_numbers(cards)))
+    for card in cards:
+        if card['card_number'] is None:
+            card['set_name'], card['card_number'] = next(numbers)
+
+    now = datetime.utcnow()
+    columns = CARD_TEXT_COLUMNS + ['card_number', 'ai_image_status', 'created_at', 'updated_at']
+    records = [
+        tuple(card.get(column) for column in CARD_TEXT_COLUMNS) + (card['card_number'], 'PENDING', now, now)
+        for card in cards
+    ]
+    async with db.transaction() as tx:
+        await tx.connection.raw_connection.copy_records_to_table('cards', records=records, columns=columns)
+    logger.info(f"Copied {len(records)} card(s) into the cards table")
+    return len(records)
+
+async def persist_cards(cards: List[Dict[str, Any]]) -> int:
+    """Persist any number of cards, switching from INSERT to COPY for bulk imports. Returns the count written."""
+    if len(cards) >= BULK_COPY_THRESHOLD:
+        return await copy_cards(cards)
+    return len(await insert_cards(cards))
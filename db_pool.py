@@ -0,0 +1,158 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, Any, List
+from gino.dialects.asyncpg import Pool as GinoPool
+from metrics import registry, Gauge, Histogram, db_query_duration
+from tracing import record_span
+
+logger = logging.getLogger(__name__)
+
+# Connection settings, from the environment (.env) or these defaults
+DB_USER = os.getenv('DB_USER', 'yourusername')
+DB_PASSWORD = os.getenv('DB_PASSWORD', 'yourpassword')
+DB_HOST = os.getenv('DB_HOST', 'localhost')
+DB_PORT = os.getenv('DB_PORT', 5432)  # Default Postgres port
+DB_DATABASE = os.getenv('DB_DATABASE', 'yourdatabase')
+
+# Pool settings; size the pool so DB_POOL_MAX_SIZE x Hypercorn workers stays under max_connections
+DB_POOL_MIN_SIZE = int(os.getenv('DB_POOL_MIN_SIZE', 5))
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 20))
+DB_POOL_MAX_INACTIVE_LIFETIME = float(os.getenv('DB_POOL_MAX_INACTIVE_LIFETIME', 300))  # Seconds before an idle connection is closed
+DB_STATEMENT_CACHE_SIZE = int(os.getenv('DB_STATEMENT_CACHE_SIZE', 100))  # Prepared statements kept per connection; 0 behind PgBouncer
+DB_CONNECT_TIMEOUT = float(os.getenv('DB_CONNECT_TIMEOUT', 10))
+DB_COMMAND_TIMEOUT = float(os.getenv('DB_COMMAND_TIMEOUT', 30))
+DB_SLOW_QUERY_MS = float(os.getenv('DB_SLOW_QUERY_MS', 250))  # Queries slower than this are logged
+
+# Upper bounds (seconds) of the checkout latency histogram
+CHECKOUT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+def database_dsn() -> str:
+    """Postgres DSN from the DB_* settings; shared by the app and the command-line scripts."""
+    return f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_DATABASE}"
+
+def pool_settings() -> Dict[str, Any]:
+    """Keyword arguments for db.set_bind(), passed through to asyncpg.create_pool()."""
+    return {
+        'min_size': DB_POOL_MIN_SIZE,
+        'max_size': DB_POOL_MAX_SIZE,
+        'max_inactive_connection_lifetime': DB_POOL_MAX_INACTIVE_LIFETIME,
+        'statement_cache_size': DB_STATEMENT_CACHE_SIZE,
+        'timeout': DB_CONNECT_TIMEOUT,
+        'command_timeout': DB_COMMAND_TIMEOUT,
+        'pool_class': InstrumentedPool,
+    }
+
+class PoolStats:
+    """Checkout latency, saturation and slow query counters of the database pool."""
+
+    def __init__(self):
+        self.max_size = DB_POOL_MAX_SIZE
+        self.checkouts = 0
+        self.checkout_seconds = 0.0
+        self.checkout_max_seconds = 0.0
+        self.checkout_buckets: List[int] = [0] * len(CHECKOUT_BUCKETS)
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.waiting = 0
+        self.peak_waiting = 0
+        self.queries = 0
+        self.slow_queries = 0
+
+    def record_checkout(self, seconds: float) -> None:
+        self.checkouts += 1
+        self.checkout_seconds += seconds
+        self.checkout_max_seconds = max(self.checkout_max_seconds, seconds)
+        for index, bound in enumerate(CHECKOUT_BUCKETS):
+            if seconds <= bound:
+                self.checkout_buckets[index] += 1
+                break
+        self.in_use += 1
+        self.peak_in_use = max(self.peak_in_use, self.in_use)
+        db_checkout_duration.observe(seconds)
+
+    def log_query(self, record) -> None:
+        """asyncpg query logger: count every statement, trace it and log the slow ones."""
+        self.queries += 1
+        db_query_duration.observe(record.elapsed)
+        query = ' '.join(record.query.split())
+        # asyncpg schedules the logger with call_soon from the querying task, so the
+        # task's current span is still visible here and the query becomes its child
+        record_span('db.query', record.elapsed, statement=query[:200], error=bool(record.exception))
+        elapsed_ms = record.elapsed * 1000
+        if elapsed_ms >= DB_SLOW_QUERY_MS:
+            self.slow_queries += 1
+            logger.warning(f"Slow query ({elapsed_ms:.0f} ms): {query[:500]}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            'max_size': self.max_size,
+            'in_use': self.in_use,
+            'peak_in_use': self.peak_in_use,
+            'saturation': round(self.in_use / self.max_size, 3) if self.max_size else 0,
+            'waiting': self.waiting,
+            'peak_waiting': self.peak_waiting,
+            'checkouts': self.checkouts,
+            'checkout_timeouts': self.timeouts,
+            'checkout_avg_ms': round(self.checkout_seconds / self.checkouts * 1000, 3) if self.checkouts else 0,
+            'checkout_max_ms': round(self.checkout_max_seconds * 1000, 3),
+            'checkout_histogram': {f"le_{bound}": count for bound, count in zip(CHECKOUT_BUCKETS, self.checkout_buckets, strict=True)},
+            'queries': self.queries,
+            'slow_queries': self.slow_queries,
+        }
+
+pool_stats = PoolStats()
+
+db_checkout_duration = registry.register(Histogram(
+    'db_pool_checkout_seconds', 'Time spent waiting for a pooled database connection.', (), buckets=CHECKOUT_BUCKETS
+))
+registry.register(Gauge(
+    'db_pool_connections', 'Pooled database connections by state.', ('state',),
+    callback=lambda: {('in_use',): pool_stats.in_use, ('waiting',): pool_stats.waiting, ('max',): pool_stats.max_size}
+))
+
+class InstrumentedPool(GinoPool):
+    """Gino's asyncpg pool, timing every checkout and attaching the slow query logger to new connections."""
+
+    def __init__(self, url, loop, init=None, **kwargs):
+        async def init_connection(connection):
+            if init is not None:
+                await init(connection)
+            connection.add_query_logger(pool_stats.log_query)
+
+        pool_stats.max_size = kwargs.get('max_size', pool_stats.max_size)
+        super().__init__(url, loop, init=init_connection, **kwargs)
+
+    async def acquire(self, *, timeout=None):
+        start = time.perf_counter()
+        pool_stats.waiting += 1
+        pool_stats.peak_waiting = max(pool_stats.peak_waiting, pool_stats.waiting)
+        try:
+            connection = await super().acquire(timeout=timeout)
+        except asyncio.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.waiting -= 1
+        checkout_seconds = time.perf_counter() - start
+        pool_stats.record_checkout(checkout_seconds)
+        record_span('db.acquire', checkout_seconds)
+        return connection
+
+    async def release(self, conn):
+        try:
+            await super().release(conn)
+        finally:
+            pool_stats.in_use -= 1
+
+async def warm_pool(db) -> None:
+    """Open DB_POOL_MIN_SIZE connections up front and round-trip each, so the first requests skip connection setup."""
+    async def ping():
+        async with db.acquire(reuse=False) as connection:
+            await connection.scalar('SELECT 1')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(ping() for _ in range(DB_POOL_MIN_SIZE)))
+    logger.info(f"Warmed {DB_POOL_MIN_SIZE} database connection(s) in {(time.perf_counter() - start) * 1000:.0f} ms")
@@ -0,0 +1,40 @@
+import os
+import asyncio
+import logging
+import weakref
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Connection pool settings for outbound HTTP (image downloads, upstream APIs)
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 30))
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 60))
+
+# One pooled client per event loop: httpx connections cannot be shared across loops
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared keep-alive HTTP client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            ),
+            timeout=httpx.Timeout(HTTP_TIMEOUT),
+            follow_redirects=True
+        )
+        _clients[loop] = client
+    return client
+
+async def close_http_client() -> None:
+    """Close the pooled HTTP client bound to the running event loop, if any."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None and not client.is_closed:
+        await client.aclose()
+        logger.info("Closed pooled HTTP client")
@@ -0,0 +1,101 @@
+import os
+import asyncio
+import logging
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Set
+from PIL import Image, features
+from image_store import blob_path, stat_image
+
+logger = logging.getLogger(__name__)
+
+# AVIF support comes with newer Pillow builds or the pillow-avif-plugin package
+with contextlib.suppress(ImportError):
+    import pillow_avif  # noqa: F401
+
+# Derivative sizes (longest edge, in pixels) and output formats
+DERIVATIVE_SIZES: Dict[str, int] = {
+    'thumb': 160,
+    'grid': 400,
+    'full': 1024,
+}
+DERIVATIVE_QUALITY = {'webp': 80, 'avif': 60}
+DERIVATIVE_FORMATS: List[str] = ['webp'] + (['avif'] if features.check('avif') or 'AVIF' in Image.SAVE else [])
+DERIVATIVE_DIR = 'derived'  # Sub-directory of the image folder holding derivatives
+DERIVATIVE_WORKERS = int(os.getenv('DERIVATIVE_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+
+_executor: Optional[ProcessPoolExecutor] = None
+_pending: Set[asyncio.Task] = set()  # Strong references to background encodes
+
+def derivative_path(image_folder: str, file_name: str, size: str, image_format: str) -> str:
+    """Location of one derivative: <image folder>/derived/<size>/<shard>/<stem>.<format>."""
+    stem = os.path.splitext(file_name)[0]
+    return os.path.join(image_folder, DERIVATIVE_DIR, size, stem[:2], f"{stem}.{image_format}")
+
+def render_derivatives(source_path: str, image_folder: str, file_name: str, sizes: List[str], formats: List[str]) -> List[str]:
+    """
+    Encode the requested sizes and formats of one source image. Runs in a worker process.
+    Each file is written to a temp name and renamed so readers never see partial output.
+    """
+    written = []
+    with Image.open(source_path) as source:
+        source = source.convert('RGBA' if source.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        for size in sizes:
+            resized = source.copy()
+            resized.thumbnail((DERIVATIVE_SIZES[size], DERIVATIVE_SIZES[size]), Image.LANCZOS)
+            for image_format in formats:
+                path = derivative_path(image_folder, file_name, size, image_format)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f"{path}.{os.getpid()}.part"
+                resized.save(temp_path, format=image_format.upper(), quality=DERIVATIVE_QUALITY[image_format])
+                os.replace(temp_path, path)
+                written.append(path)
+    return written
+
+def get_executor() -> ProcessPoolExecutor:
+    """Return the shared encoding process pool, starting it on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=DERIVATIVE_WORKERS)
+    return _executor
+
+async def generate_derivatives(source_path: str, image_folder: str, file_name: str, sizes: List[str] = None, formats: List[str] = None) -> List[str]:
+    """Encode derivatives of an image in the process pool, off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        get_executor(), render_derivatives, source_path, image_folder, file_name,
+        sizes or list(DERIVATIVE_SIZES), formats or DERIVATIVE_FORMATS
+    )
+
+def schedule_derivatives(image_folder: str, blob_name: str) -> None:
+    """Start encoding all derivatives of a freshly stored image in the background."""
+    task = asyncio.create_task(generate_derivatives(blob_path(image_folder, blob_name), image_folder, blob_name))
+    _pending.add(task)
+    task.add_done_callback(_finish_background_task)
+
+def _finish_background_task(task: asyncio.Task) -> None:
+    _pending.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Error generating image derivatives: {task.exception()}")
+
+def negotiate_format(accept_header: str) -> Optional[str]:
+    """Pick the best derivative format the client accepts, or None to serve the original."""
+    accept_header = (accept_header or '').lower()
+    for image_format in ('avif', 'webp'):
+        if image_format in DERIVATIVE_FORMATS and f"image/{image_format}" in accept_header:
+            return image_format
+    return None
+
+async def get_derivative(source_path: str, image_folder: str, file_name: str, size: str, image_format: str) -> str:
+    """Return the path of a derivative of an existing image, encoding it lazily if it is missing."""
+    path = derivative_path(image_folder, file_name, size, image_format)
+    if stat_image(path) is None:
+        await generate_derivatives(source_path, image_folder, file_name, sizes=[size], formats=[image_format])
+    return path
+
+def shutdown_executor() -> None:
+    """Stop the encoding process pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
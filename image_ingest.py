@@ -0,0 +1,109 @@
+import os
+import time
+import asyncio
+import hashlib
+import tempfile
+import logging
+from typing import BinaryIO, Dict, Tuple
+from http_client import get_http_client
+from image_store import blob_temp_dir, commit_blob
+from metrics import upstream_call_duration, upstream_errors
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Ingest limits
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 20 * 1024 * 1024))  # Largest upstream image accepted
+IMAGE_CHUNK_SIZE = 64 * 1024  # Bytes read from the socket and written to disk at a time
+
+# Accepted content types, the extension stored for each, and the magic bytes the body must start with
+IMAGE_CONTENT_TYPES: Dict[str, str] = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'image/webp': '.webp',
+}
+IMAGE_SIGNATURES = {
+    '.png': (b'\x89PNG\r\n\x1a\n',),
+    '.jpg': (b'\xff\xd8\xff',),
+    '.webp': (b'RIFF',),
+}
+
+class ImageIngestError(ValueError):
+    """Raised when a remote image is missing, too large or not an accepted image type."""
+
+async def ingest_image(url: str, save_path: str) -> str:
+    """
+    Stream a remote image into the content-addressed store under `save_path`
+    over the pooled HTTP client. The body is hashed, checked for size and type and
+    written chunk by chunk to a temp file on the store's filesystem as it streams in,
+    then renamed into its shard atomically so readers never see a partial file.
+    Disk work runs in worker threads, off the event loop.
+    Returns the blob name (`<sha256>.<ext>`).
+    """
+    started = time.perf_counter()
+    try:
+        with span('image.ingest', kind='client') as current:
+            blob_name, size = await download_image(url, save_path)
+            if current is not None:
+                current.set_attribute('bytes', size)
+    except BaseException as e:
+        upstream_call_duration.observe(time.perf_counter() - started, 'image_download', 'error')
+        upstream_errors.inc(1, 'image_download', type(e).__name__)
+        raise
+    upstream_call_duration.observe(time.perf_counter() - started, 'image_download', 'ok')
+
+    logger.info(f"Ingested {size} byte image as {blob_name}")
+    return blob_name
+
+async def download_image(url: str, save_path: str) -> Tuple[str, int]:
+    """Stream and commit one image for ingest_image(). Returns the blob name and its size."""
+    async with get_http_client().stream('GET', url) as response:
+        if response.status_code != 200:
+            raise ImageIngestError(f"Image download failed with HTTP {response.status_code}: {url}")
+
+        content_type = response.headers.get('content-type', '').split(';')[0].strip().lower()
+        extension = IMAGE_CONTENT_TYPES.get(content_type)
+        if extension is None:
+            raise ImageIngestError(f"Unsupported image content type '{content_type}': {url}")
+
+        declared_length = int(response.headers.get('content-length') or 0)
+        if declared_length > IMAGE_MAX_BYTES:
+            raise ImageIngestError(f"Image of {declared_length} bytes exceeds the {IMAGE_MAX_BYTES} byte limit: {url}")
+
+        temp_file, temp_path = await asyncio.to_thread(open_temp_file, save_path)
+        try:
+            size = 0
+            digest = hashlib.sha256()
+            async for chunk in response.aiter_bytes(IMAGE_CHUNK_SIZE):
+                if size == 0 and not chunk.startswith(IMAGE_SIGNATURES[extension]):
+                    raise ImageIngestError(f"Image body does not match content type '{content_type}': {url}")
+                size += len(chunk)
+                if size > IMAGE_MAX_BYTES:
+                    raise ImageIngestError(f"Image exceeds the {IMAGE_MAX_BYTES} byte limit: {url}")
+                digest.update(chunk)
+                await asyncio.to_thread(temp_file.write, chunk)
+            if size == 0:
+                raise ImageIngestError(f"Image body is empty: {url}")
+
+            blob_name = await asyncio.to_thread(commit_temp_file, save_path, temp_file, temp_path, digest.hexdigest(), extension)
+        except BaseException:
+            await asyncio.to_thread(discard_temp_file, temp_file, temp_path)
+            raise
+    return blob_name, size
+
+# Blocking file steps of download_image(), each run in a worker thread
+def open_temp_file(save_path: str) -> Tuple[BinaryIO, str]:
+    fd, temp_path = tempfile.mkstemp(dir=blob_temp_dir(save_path), prefix='.ingest-', suffix='.part')
+    return os.fdopen(fd, 'wb'), temp_path
+
+def commit_temp_file(save_path: str, temp_file: BinaryIO, temp_path: str, digest: str, extension: str) -> str:
+    """Flush and fsync the finished temp file, then rename it into the store."""
+    temp_file.flush()
+    os.fsync(temp_file.fileno())
+    temp_file.close()
+    return commit_blob(save_path, temp_path, digest, extension)
+
+def discard_temp_file(temp_file: BinaryIO, temp_path: str) -> None:
+    temp_file.close()
+    if os.path.exists(temp_path):
+        os.unlink(temp_path)
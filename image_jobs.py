@@ -0,0 +1,430 @@
+import os
+import json
+import socket
+import asyncio
+import logging
+import contextlib
+from uuid import uuid4
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+import fal_client
+from extensions import db
+from models import Card, ImageJob
+from card_generator import IMAGE_SAVE_PATH, generate_image_prompt
+from http_client import get_http_client
+from image_ingest import ingest_image
+from image_derivatives import schedule_derivatives
+from response_cache import card_cache
+from job_events import job_events
+from image_result_cache import image_result_cache
+from upstream_limits import upstream_limits, CircuitOpenError
+from metrics import registry, Gauge, upstream_retries
+from tracing import TRACE_SLOW_JOB_MS, start_trace, end_span
+
+logger = logging.getLogger(__name__)
+
+# Queue settings
+IMAGE_JOB_WORKERS = int(os.getenv('IMAGE_JOB_WORKERS', 4))  # Concurrent jobs per worker process
+IMAGE_JOB_MAX_RUNNING = int(os.getenv('IMAGE_JOB_MAX_RUNNING', 16))  # Concurrent fal.ai calls across all processes
+IMAGE_JOB_MAX_ATTEMPTS = int(os.getenv('IMAGE_JOB_MAX_ATTEMPTS', 3))
+IMAGE_JOB_VISIBILITY_TIMEOUT = int(os.getenv('IMAGE_JOB_VISIBILITY_TIMEOUT', 300))  # Seconds before a silent job is reclaimed
+IMAGE_JOB_RETRY_BACKOFF = int(os.getenv('IMAGE_JOB_RETRY_BACKOFF', 10))  # Base seconds, doubled per attempt
+IMAGE_JOB_RETRY_BACKOFF_MAX = int(os.getenv('IMAGE_JOB_RETRY_BACKOFF_MAX', 600))
+IMAGE_JOB_POLL_INTERVAL = float(os.getenv('IMAGE_JOB_POLL_INTERVAL', 1))
+IMAGE_BATCH_MAX_CARDS = int(os.getenv('IMAGE_BATCH_MAX_CARDS', 5000))  # Largest batch accepted in one request
+IMAGE_JOB_ENABLED = os.getenv('IMAGE_JOB_ENABLED', 'true').lower() == 'true'
+FAL_MODEL = 'fal-ai/flux/dev'
+FAL_QUEUE_BASE_URL = os.getenv('FAL_QUEUE_BASE_URL')  # Talk to this fal queue API directly (e.g. the benchmark stand-in) instead of fal_client
+FAL_QUEUE_POLL_INTERVAL = float(os.getenv('FAL_QUEUE_POLL_INTERVAL', 0.5))
+
+# Job states: QUEUED -> RUNNING -> COMPLETED, or back to QUEUED for a retry, or DEAD once attempts run out
+JOB_QUEUED = 'QUEUED'
+JOB_RUNNING = 'RUNNING'
+JOB_COMPLETED = 'COMPLETED'
+JOB_DEAD = 'DEAD'
+
+# Job state as reported by the request-status API, which predates the queue
+API_STATUSES = {
+    JOB_QUEUED: 'IN_PROGRESS',
+    JOB_RUNNING: 'IN_PROGRESS',
+    JOB_COMPLETED: 'COMPLETED',
+    JOB_DEAD: 'FAILED',
+}
+
+# Claimers serialize on this transaction-level advisory lock, so the running count
+# CLAIM_JOBS_SQL reads cannot go stale before its UPDATE commits
+CLAIM_JOBS_LOCK_KEY = 0x696d616765  # 'image'
+
+# Timestamps are stored as naive UTC, so the SQL compares against timezone('utc', now())
+CLAIM_JOBS_SQL = """
+WITH running AS (
+    SELECT count(*) AS total FROM image_jobs WHERE status = 'RUNNING' AND locked_until > timezone('utc', now())
+)
+UPDATE image_jobs
+SET status = 'RUNNING',
+    attempts = attempts + 1,
+    locked_by = :worker,
+    locked_until = timezone('utc', now()) + make_interval(secs => :visibility_timeout),
+    updated_at = timezone('utc', now())
+WHERE id IN (
+    SELECT id FROM image_jobs
+    WHERE (status = 'QUEUED' AND run_at <= timezone('utc', now()))
+       OR (status = 'RUNNING' AND locked_until <= timezone('utc', now()))
+    ORDER BY run_at, id
+    LIMIT GREATEST(LEAST(:limit, :max_running - (SELECT total FROM running)), 0)
+    FOR UPDATE SKIP LOCKED
+)
+RETURNING id, request_id, card_id, payload, attempts, max_attempts
+"""
+
+def load_json(value: Any) -> Any:
+    """asyncpg hands JSON columns from textual queries back as strings."""
+    return json.loads(value) if isinstance(value, str) else value
+
+# Producing jobs
+async def enqueue_image_job(card: Card, payload: Dict[str, Any], request_id: str = None) -> ImageJob:
+    """
+    Mark the card IN_PROGRESS and persist its image generation job in one
+    transaction, so neither exists without the other, then wake the local workers.
+    """
+    request_id = request_id or str(uuid4())
+    async with db.transaction():
+        await card.update(ai_request_id=request_id, ai_image_status='IN_PROGRESS').apply()
+        job = await ImageJob.create(
+            request_id=request_id,
+            card_id=card.id,
+            payload=payload,
+            max_attempts=IMAGE_JOB_MAX_ATTEMPTS
+        )
+    worker_pool.notify()
+    await job_events.publish(job.request_id, {"status": "IN_PROGRESS", "image_urls": []})
+    return job
+
+async def complete_from_cache(card: Card, payload: Dict[str, Any], request_id: str) -> Optional[List[str]]:
+    """
+    Finish a seeded request immediately if an identical one was generated before.
+    Returns the cached blob names, or None when the request has to be queued.
+    """
+    image_urls = image_result_cache.get(FAL_MODEL, payload, IMAGE_SAVE_PATH)
+    if not image_urls:
+        return None
+    await card.update(ai_request_id=request_id, ai_image_status='COMPLETED', ai_image_url=image_urls[0]).apply()
+    await card_cache.invalidate()
+    await job_events.publish(request_id, {"status": "COMPLETED", "image_urls": image_urls})
+    return image_urls
+
+async def get_job_status(request_id: str) -> Optional[Dict[str, Any]]:
+    """Status of a job in the shape the request-status API returns, or None if unknown."""
+    job = await ImageJob.query.where(ImageJob.request_id == request_id).gino.first()
+    if job is None:
+        return None
+    result = job.result or {}
+    return {
+        "status": API_STATUSES.get(job.status, job.status),
+        "image_urls": result.get('image_urls', []),
+        "error": job.error,
+        "attempts": job.attempts
+    }
+
+async def enqueue_image_batch(cards: List[Card], params: Dict[str, Any], prompt: str = None) -> str:
+    """
+    Queue one job per card under a shared batch_id and mark every card IN_PROGRESS
+    with a single UPDATE and a single multi-row INSERT. Without a `prompt`, each
+    card gets the prompt generated from its own attributes. Returns the batch_id.
+    """
+    batch_id = str(uuid4())
+    request_ids = [str(uuid4()) for _ in cards]
+    now = datetime.utcnow()
+    jobs = [
+        {
+            'request_id': request_id,
+            'card_id': card.id,
+            'batch_id': batch_id,
+            'status': JOB_QUEUED,
+            'payload': dict(params, prompt=prompt or generate_image_prompt({
+                'name': card.name, 'type': card.card_type, 'color': card.color, 'rarity': card.rarity
+            })),
+            'attempts': 0,
+            'max_attempts': IMAGE_JOB_MAX_ATTEMPTS,
+            'run_at': now,
+            'created_at': now,
+            'updated_at': now,
+        }
+        for card, request_id in zip(cards, request_ids, strict=True)
+    ]
+
+    async with db.transaction():
+        await db.status(
+            db.text(
+                "UPDATE cards SET ai_request_id = batch.request_id, ai_image_status = 'IN_PROGRESS', updated_at = :now "
+                "FROM unnest(CAST(:card_ids AS integer[]), CAST(:request_ids AS text[])) AS batch(card_id, request_id) "
+                "WHERE cards.id = batch.card_id"
+            ),
+            card_ids=[card.id for card in cards], request_ids=request_ids, now=now
+        )
+        await ImageJob.insert().gino.all(jobs)
+    await card_cache.invalidate()
+
+    worker_pool.notify()
+    logger.info(f"Queued image batch {batch_id} with {len(jobs)} job(s)")
+    return batch_id
+
+async def get_batch_status(batch_id: str) -> Optional[Dict[str, Any]]:
+    """Aggregate progress of a batch, or None if no jobs carry the batch_id."""
+    rows = await db.all(
+        db.text("SELECT status, count(*) FROM image_jobs WHERE batch_id = :batch_id GROUP BY status"),
+        batch_id=batch_id
+    )
+    if not rows:
+        return None
+    counts = dict(rows)
+    total = sum(counts.values())
+    finished = counts.get(JOB_COMPLETED, 0) + counts.get(JOB_DEAD, 0)
+    return {
+        "batch_id": batch_id,
+        "status": 'COMPLETED' if finished == total else 'IN_PROGRESS',
+        "total": total,
+        "queued": counts.get(JOB_QUEUED, 0),
+        "running": counts.get(JOB_RUNNING, 0),
+        "completed": counts.get(JOB_COMPLETED, 0),
+        "failed": counts.get(JOB_DEAD, 0),
+        "progress": round(finished / total, 4)
+    }
+
+# Consuming jobs
+async def claim_jobs(worker: str, limit: int) -> List[Dict[str, Any]]:
+    """
+    Claim up to `limit` runnable jobs, skipping rows other workers hold and respecting the global cap.
+    The lock is taken in its own statement first: under READ COMMITTED the claim then counts
+    running jobs from a snapshot that includes every earlier claimer's committed jobs.
+    """
+    async with db.transaction():
+        await db.scalar(db.text("SELECT pg_advisory_xact_lock(:key)"), key=CLAIM_JOBS_LOCK_KEY)
+        rows = await db.all(
+            db.text(CLAIM_JOBS_SQL),
+            worker=worker, limit=limit, max_running=IMAGE_JOB_MAX_RUNNING,
+            visibility_timeout=IMAGE_JOB_VISIBILITY_TIMEOUT
+        )
+    return [
+        {
+            'id': row[0], 'request_id': row[1], 'card_id': row[2], 'payload': load_json(row[3]),
+            'attempts': row[4], 'max_attempts': row[5]
+        }
+        for row in rows
+    ]
+
+async def extend_lease(job_id: int, worker: str) -> None:
+    """Push a running job's visibility timeout out again while it is still being worked on."""
+    await db.status(
+        db.text(
+            "UPDATE image_jobs SET locked_until = timezone('utc', now()) + make_interval(secs => :visibility_timeout) "
+            "WHERE id = :id AND locked_by = :worker AND status = 'RUNNING'"
+        ),
+        id=job_id, worker=worker, visibility_timeout=IMAGE_JOB_VISIBILITY_TIMEOUT
+    )
+
+async def submit_image_request(payload: Dict[str, Any]) -> List[str]:
+    """Run one FLUX generation and store its images locally. Returns the stored blob names."""
+    cached_urls = image_result_cache.get(FAL_MODEL, payload, IMAGE_SAVE_PATH)
+    if cached_urls:
+        return cached_urls
+
+    async with upstream_limits.call('fal', FAL_MODEL):
+        if FAL_QUEUE_BASE_URL:
+            response = await subscribe_fal_queue(FAL_QUEUE_BASE_URL, payload)
+        else:
+            response = await fal_client.subscribe_async(FAL_MODEL, arguments=payload)
+
+    # fal.ai result URLs are temporary, so the images are pulled into local storage
+    remote_urls = [img['url'] for img in response.get('images', [])]
+    image_urls = list(await asyncio.gather(*(
+        ingest_image(url, IMAGE_SAVE_PATH) for url in remote_urls
+    )))
+    for file_name in image_urls:
+        schedule_derivatives(IMAGE_SAVE_PATH, file_name)
+    image_result_cache.set(FAL_MODEL, payload, image_urls)
+    return image_urls
+
+async def subscribe_fal_queue(base_url: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Submit to a fal queue API over the pooled HTTP client and wait for the result, like fal_client.subscribe_async()."""
+    client = get_http_client()
+    headers = {'Authorization': f"Key {os.getenv('FAL_KEY', '')}"}
+    response = await client.post(f"{base_url.rstrip('/')}/{FAL_MODEL}", json=payload, headers=headers)
+    response.raise_for_status()
+    queued = response.json()
+
+    while True:
+        response = await client.get(queued['status_url'], headers=headers)
+        response.raise_for_status()
+        if response.json().get('status') == 'COMPLETED':
+            break
+        await asyncio.sleep(FAL_QUEUE_POLL_INTERVAL)
+
+    response = await client.get(queued['response_url'], headers=headers)
+    response.raise_for_status()
+    return response.json()
+
+async def complete_job(job: Dict[str, Any], worker: str, image_urls: List[str]) -> None:
+    """Record a finished job and point its card at the first generated image."""
+    async with db.transaction():
+        updated = await db.status(
+            db.text(
+                "UPDATE image_jobs SET status = 'COMPLETED', result = CAST(:result AS json), error = NULL, "
+                "locked_by = NULL, locked_until = NULL, updated_at = timezone('utc', now()) "
+                "WHERE id = :id AND locked_by = :worker AND status = 'RUNNING'"
+            ),
+            id=job['id'], worker=worker, result=json.dumps({'image_urls': image_urls})
+        )
+        if updated[0] == 'UPDATE 0':
+            logger.warning(f"Image job {job['request_id']} was reclaimed before it completed; discarding result")
+            return
+        await Card.update.values(
+            ai_request_id=job['request_id'],
+            ai_image_status='COMPLETED',
+            ai_image_url=image_urls[0]  # Assuming we only use the first image
+        ).where(Card.id == job['card_id']).gino.status()
+    await card_cache.invalidate()
+    await job_events.publish(job['request_id'], {"status": "COMPLETED", "image_urls": image_urls})
+
+async def fail_job(job: Dict[str, Any], worker: str, error: str) -> None:
+    """Schedule a retry with exponential backoff, or dead-letter the job once its attempts are used up."""
+    if job['attempts'] < job['max_attempts']:
+        delay = min(IMAGE_JOB_RETRY_BACKOFF * 2 ** (job['attempts'] - 1), IMAGE_JOB_RETRY_BACKOFF_MAX)
+        await db.status(
+            db.text(
+                "UPDATE image_jobs SET status = 'QUEUED', error = :error, locked_by = NULL, locked_until = NULL, "
+                "run_at = timezone('utc', now()) + make_interval(secs => :delay), updated_at = timezone('utc', now()) "
+                "WHERE id = :id AND locked_by = :worker"
+            ),
+            id=job['id'], worker=worker, error=error, delay=delay
+        )
+        upstream_retries.inc(1, 'image_job', 'JobFailed')
+        logger.warning(f"Image job {job['request_id']} failed (attempt {job['attempts']}), retrying in {delay}s: {error}")
+        return
+
+    async with db.transaction():
+        await db.status(
+            db.text(
+                "UPDATE image_jobs SET status = 'DEAD', error = :error, locked_by = NULL, locked_until = NULL, "
+                "updated_at = timezone('utc', now()) WHERE id = :id"
+            ),
+            id=job['id'], error=error
+        )
+        await Card.update.values(ai_image_status='FAILED').where(Card.id == job['card_id']).gino.status()
+    await card_cache.invalidate()
+    await job_events.publish(job['request_id'], {"status": "FAILED", "image_urls": [], "error": error})
+    logger.error(f"Image job {job['request_id']} dead-lettered after {job['attempts']} attempt(s): {error}")
+
+async def defer_job(job: Dict[str, Any], worker: str, delay: float) -> None:
+    """Put a job back without using up an attempt, e.g. while the upstream's circuit is open."""
+    await db.status(
+        db.text(
+            "UPDATE image_jobs SET status = 'QUEUED', attempts = attempts - 1, locked_by = NULL, locked_until = NULL, "
+            "run_at = timezone('utc', now()) + make_interval(secs => :delay), updated_at = timezone('utc', now()) "
+            "WHERE id = :id AND locked_by = :worker"
+        ),
+        id=job['id'], worker=worker, delay=delay
+    )
+
+class ImageJobWorkerPool:
+    """
+    Pool of async workers draining the image_jobs table.
+    Every process runs IMAGE_JOB_WORKERS workers; the claim query additionally caps
+    the jobs RUNNING across all processes at IMAGE_JOB_MAX_RUNNING.
+    """
+
+    def __init__(self, concurrency: int = IMAGE_JOB_WORKERS):
+        self.concurrency = concurrency
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.tasks: List[asyncio.Task] = []
+        self.active = 0
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self) -> None:
+        """Start the workers on the running event loop."""
+        if self.tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self.tasks = [asyncio.create_task(self.run(index)) for index in range(self.concurrency)]
+        logger.info(f"Started {self.concurrency} image job worker(s) as {self.worker_id}")
+
+    async def stop(self) -> None:
+        """Cancel the workers. Jobs they were running become claimable again after the visibility timeout."""
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+        logger.info("Stopped image job workers")
+
+    def notify(self) -> None:
+        """Wake idle workers because a job was just enqueued."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def run(self, index: int) -> None:
+        worker = f"{self.worker_id}:{index}"
+        while True:
+            try:
+                jobs = await claim_jobs(worker, 1)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error claiming image jobs: {e}")
+                jobs = []
+
+            if not jobs:
+                self._wakeup.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=IMAGE_JOB_POLL_INTERVAL)
+                continue
+
+            for job in jobs:
+                await self.process(job, worker)
+
+    async def process(self, job: Dict[str, Any], worker: str) -> None:
+        """Run one claimed job to completion, retry or dead letter."""
+        if job['attempts'] > job['max_attempts']:
+            # Reclaimed after its last attempt timed out
+            await fail_job(job, worker, 'Visibility timeout expired on final attempt')
+            return
+
+        self.active += 1
+        heartbeat = asyncio.create_task(self.heartbeat(job['id'], worker))
+        root = start_trace('image_job', kind='consumer', slow_ms=TRACE_SLOW_JOB_MS, request_id=job['request_id'], attempt=job['attempts'])
+        error = None
+        try:
+            image_urls = await submit_image_request(job['payload'])
+            if image_urls:
+                await complete_job(job, worker, image_urls)
+            else:
+                await fail_job(job, worker, 'No image generated.')
+        except asyncio.CancelledError:
+            raise
+        except CircuitOpenError as e:
+            error = e
+            logger.warning(f"Deferring image job {job['request_id']}: {e}")
+            await defer_job(job, worker, max(e.retry_in, IMAGE_JOB_POLL_INTERVAL))
+        except Exception as e:
+            error = e
+            logger.error(f"Error generating image: {e}")
+            await fail_job(job, worker, str(e))
+        finally:
+            end_span(root, error)
+            heartbeat.cancel()
+            self.active -= 1
+
+    async def heartbeat(self, job_id: int, worker: str) -> None:
+        """Keep the lease on a long-running job alive."""
+        while True:
+            await asyncio.sleep(IMAGE_JOB_VISIBILITY_TIMEOUT / 3)
+            try:
+                await extend_lease(job_id, worker)
+            except Exception as e:
+                logger.warning(f"Could not extend lease on image job {job_id}: {e}")
+
+worker_pool = ImageJobWorkerPool()
+
+registry.register(Gauge(
+    'image_jobs_in_flight', 'Image generation jobs being run by this process.',
+    callback=lambda: {(): worker_pool.active}
+))
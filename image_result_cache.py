@@ -0,0 +1,67 @@
+import os
+import json
+import hashlib
+import logging
+from typing import Dict, Any, List, Optional
+from image_store import blob_path, stat_image
+from response_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Result cache settings
+IMAGE_RESULT_CACHE_SIZE = int(os.getenv('IMAGE_RESULT_CACHE_SIZE', 10000))  # Seeded requests remembered per worker
+IMAGE_RESULT_CACHE_TTL = float(os.getenv('IMAGE_RESULT_CACHE_TTL', 7 * 24 * 3600))
+
+# Request fields that determine the generated image
+CACHE_KEY_FIELDS = ('image_size', 'num_inference_steps', 'seed', 'guidance_scale', 'num_images', 'enable_safety_checker')
+
+class ImageResultCache:
+    """
+    Maps a seeded image request to the blobs it produced.
+    A fixed seed makes FLUX deterministic for the same model, prompt and parameters,
+    so a repeat request can reuse the stored images instead of calling the upstream.
+    Unseeded requests are never cached.
+    """
+
+    def __init__(self, maxsize: int = IMAGE_RESULT_CACHE_SIZE, ttl: float = IMAGE_RESULT_CACHE_TTL):
+        self.entries = LRUCache(maxsize, ttl)
+
+    @staticmethod
+    def make_key(model: str, payload: Dict[str, Any]) -> Optional[str]:
+        """Normalized key of a request, or None if it is not deterministic."""
+        if payload.get('seed') is None:
+            return None
+        normalized = {field: payload.get(field) for field in CACHE_KEY_FIELDS}
+        normalized['model'] = model
+        normalized['prompt'] = ' '.join(str(payload.get('prompt', '')).split())
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, model: str, payload: Dict[str, Any], image_folder: str) -> Optional[List[str]]:
+        """Blob names stored for an identical seeded request, if all of them are still on disk."""
+        key = self.make_key(model, payload)
+        if key is None:
+            return None
+        blob_names = self.entries.get(key)
+        if blob_names is None:
+            return None
+        if not all(stat_image(blob_path(image_folder, blob_name)) for blob_name in blob_names):
+            # The images were removed since; count the lookup as a miss
+            self.entries.pop(key)
+            self.entries.hits -= 1
+            self.entries.misses += 1
+            return None
+        return blob_names
+
+    def set(self, model: str, payload: Dict[str, Any], blob_names: List[str]) -> None:
+        key = self.make_key(model, payload)
+        if key is not None and blob_names:
+            self.entries.set(key, list(blob_names))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self.entries),
+            'hits': self.entries.hits,
+            'misses': self.entries.misses,
+        }
+
+image_result_cache = ImageResultCache()
@@ -0,0 +1,74 @@
+import os
+import mimetypes
+import logging
+from datetime import datetime, timezone
+from quart import current_app, request, Response
+from quart.wrappers.response import FileBody
+from image_store import ImageFileInfo
+from metrics import image_bytes_served
+
+logger = logging.getLogger(__name__)
+
+# Caching policy: content-addressed images never change, legacy filenames could be rewritten
+IMAGE_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+IMAGE_MUTABLE_MAX_AGE = int(os.getenv('IMAGE_MUTABLE_MAX_AGE', 3600))
+IMAGE_BUFFER_SIZE = int(os.getenv('IMAGE_BUFFER_SIZE', 256 * 1024))  # Bytes per read when Python streams the file
+
+# When set (e.g. '/protected_images'), nginx serves the bytes itself via an internal location
+# aliased to the image folder, using its own sendfile; Python only sends headers
+IMAGE_ACCEL_REDIRECT_PREFIX = os.getenv('IMAGE_ACCEL_REDIRECT_PREFIX')
+
+class KnownSizeFileBody(FileBody):
+    """File body that takes its size from cached metadata instead of calling stat() again."""
+
+    def __init__(self, file_path: str, size: int, buffer_size: int = IMAGE_BUFFER_SIZE):
+        # FileBody.__init__ would stat the file, so its attributes are set here directly
+        self.file_path = file_path
+        self.size = size
+        self.begin = 0
+        self.end = size
+        self.buffer_size = buffer_size
+        self.file = None
+        self.file_manager = None
+
+async def serve_image_file(path: str, info: ImageFileInfo, image_folder: str, etag: str, immutable: bool, mimetype: str = None) -> Response:
+    """
+    Build the response for one image file with a strong ETag and long-lived caching.
+    Conditional requests get 304 and Range requests 206; in X-Accel-Redirect mode the
+    reverse proxy handles ranges and streams the file with zero-copy sendfile.
+    """
+    mimetype = mimetype or mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+    if IMAGE_ACCEL_REDIRECT_PREFIX:
+        response = current_app.response_class(b'', mimetype=mimetype)
+        relative_path = os.path.relpath(path, image_folder).replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = f"{IMAGE_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative_path}"
+    else:
+        response = current_app.response_class(KnownSizeFileBody(path, info.size), mimetype=mimetype)
+        response.content_length = info.size
+
+    response.set_etag(etag)
+    response.last_modified = datetime.fromtimestamp(info.mtime, tz=timezone.utc)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_IMMUTABLE_MAX_AGE if immutable else IMAGE_MUTABLE_MAX_AGE
+    if immutable:
+        response.cache_control.immutable = True
+
+    if IMAGE_ACCEL_REDIRECT_PREFIX:
+        # If-None-Match, If-Modified-Since and If-Match are answered here as for direct files;
+        # Range requests pass through to the proxy, which serves them from the file
+        await response.make_conditional(request)
+        if response.status_code == 200:
+            image_bytes_served.inc(info.size, 'accel')
+        else:
+            del response.headers['X-Accel-Redirect']
+    else:
+        await response.make_conditional(request, accept_ranges=True, complete_length=info.size)
+        if response.status_code in (200, 206):
+            image_bytes_served.inc(response.content_length or 0, 'direct')
+    return response
+
+def image_etag(info: ImageFileInfo, content_address: str = None, variant: str = None) -> str:
+    """Strong ETag: the content hash when known, otherwise size and modification time."""
+    base = content_address or f"{info.size:x}-{int(info.mtime * 1000):x}"
+    return f"{base}-{variant}" if variant else base
@@ -0,0 +1,161 @@
+import os
+import re
+import hashlib
+import tempfile
+import logging
+from typing import NamedTuple, Optional
+from extensions import db
+from models import ImageAlias
+from response_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SAVE_PATH = 'card_images'  # Path to save images locally
+
+# Content-addressed blob layout: <image folder>/blobs/ab/cd/<sha256>.<ext>
+BLOB_DIR = 'blobs'
+BLOB_TEMP_DIR = 'tmp'  # Partial writes live on the same filesystem so commits are atomic renames
+BLOB_NAME_PATTERN = re.compile(r'^[0-9a-f]{64}\.(png|jpg|webp)$')
+
+class ImageFileInfo(NamedTuple):
+    size: int
+    mtime: float
+
+# Hot file metadata, so serving an image does not need a stat() per request
+_stat_cache = LRUCache(maxsize=int(os.getenv('IMAGE_STAT_CACHE_SIZE', 65536)), ttl=float(os.getenv('IMAGE_STAT_CACHE_TTL', 300)))
+
+# Legacy filename -> blob lookups are immutable once recorded, so they cache well
+_alias_cache = LRUCache(maxsize=int(os.getenv('IMAGE_ALIAS_CACHE_SIZE', 65536)), ttl=float(os.getenv('IMAGE_ALIAS_CACHE_TTL', 3600)))
+
+# Where each requested name resolves to ('' when nothing is there), so repeated requests
+# for the same legacy or unknown name skip the alias query and directory lookups
+_resolve_cache = LRUCache(maxsize=int(os.getenv('IMAGE_RESOLVE_CACHE_SIZE', 65536)), ttl=float(os.getenv('IMAGE_RESOLVE_CACHE_TTL', 60)))
+
+def stat_image(path: str) -> Optional[ImageFileInfo]:
+    """Size and modification time of an image file, from the metadata cache when possible. None if missing."""
+    info = _stat_cache.get(path)
+    if info is None:
+        try:
+            stat_result = os.stat(path)
+        except FileNotFoundError:
+            return None
+        info = ImageFileInfo(stat_result.st_size, stat_result.st_mtime)
+        _stat_cache.set(path, info)
+    return info
+
+def is_blob_name(name: str) -> bool:
+    """Whether a stored image name is a content address rather than a legacy filename."""
+    return bool(BLOB_NAME_PATTERN.match(name))
+
+def blob_path(image_folder: str, blob_name: str) -> str:
+    """Sharded location of a blob, two directory levels deep to keep directories small."""
+    return os.path.join(image_folder, BLOB_DIR, blob_name[:2], blob_name[2:4], blob_name)
+
+def blob_temp_dir(image_folder: str) -> str:
+    """Directory for in-progress writes, created on demand."""
+    path = os.path.join(image_folder, BLOB_DIR, BLOB_TEMP_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def commit_blob(image_folder: str, temp_path: str, digest: str, extension: str) -> str:
+    """
+    Move a fully written temp file into the store under its content hash.
+    If identical bytes are already stored, the temp file is dropped instead.
+    Returns the blob name.
+    """
+    blob_name = f"{digest}{extension}"
+    path = blob_path(image_folder, blob_name)
+    if os.path.exists(path):
+        os.unlink(temp_path)
+        logger.info(f"Image {blob_name} already stored, deduplicated")
+        return blob_name
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.replace(temp_path, path)
+    _resolve_cache.pop((image_folder, blob_name))
+    return blob_name
+
+def store_bytes(image_folder: str, data: bytes, extension: str) -> str:
+    """
+    Store in-memory image bytes (e.g. an upload) and return the blob name.
+    Blocking: written, fsynced and renamed into place, so call it from a thread
+    on the event loop.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=blob_temp_dir(image_folder), prefix='.store-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        return commit_blob(image_folder, temp_path, hashlib.sha256(data).hexdigest(), extension)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+
+async def lookup_alias(name: str) -> Optional[str]:
+    """Return the blob a legacy filename was imported as, if any."""
+    blob_name = _alias_cache.get(name)
+    if blob_name is None:
+        blob_name = await ImageAlias.select('blob_name').where(ImageAlias.name == name).gino.scalar()
+        if blob_name:
+            _alias_cache.set(name, blob_name)
+    return blob_name
+
+async def resolve_image_path(image_folder: str, name: str) -> Optional[str]:
+    """
+    Find the file behind a stored image name.
+    Content addresses map straight to their shard; legacy `{set_name}_{card_number}.png`
+    style names resolve through the alias table, then the old flat directory.
+    Results, misses included, are cached for IMAGE_RESOLVE_CACHE_TTL seconds.
+    """
+    cached = _resolve_cache.get((image_folder, name))
+    if cached is not None:
+        return cached or None
+
+    path = None
+    if is_blob_name(name):
+        if stat_image(blob_path(image_folder, name)):
+            path = blob_path(image_folder, name)
+    else:
+        blob_name = await lookup_alias(name)
+        if blob_name and stat_image(blob_path(image_folder, blob_name)):
+            path = blob_path(image_folder, blob_name)
+        elif os.path.isfile(os.path.join(image_folder, name)):
+            path = os.path.join(image_folder, name)
+    _resolve_cache.set((image_folder, name), path or '')
+    return path
+
+async def import_legacy_images(image_folder: str) -> int:
+    """
+    Move the flat, name-addressed images of `image_folder` into the blob store and
+    record an alias for each, so existing card rows keep resolving. Returns the number imported.
+    """
+    imported = 0
+    for name in sorted(os.listdir(image_folder)):
+        path = os.path.join(image_folder, name)
+        extension = os.path.splitext(name)[1].lower()
+        if not os.path.isfile(path) or name.startswith('.') or extension not in ('.png', '.jpg', '.jpeg', '.webp'):
+            continue
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as image_file:
+            for chunk in iter(lambda: image_file.read(1024 * 1024), b''):
+                digest.update(chunk)
+
+        # Hard-link into the store first; the flat file is only removed once its alias is recorded
+        temp_path = os.path.join(blob_temp_dir(image_folder), f".import-{name}.part")
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)  # Left behind by an interrupted import
+        os.link(path, temp_path)
+        blob_name = commit_blob(image_folder, temp_path, digest.hexdigest(), '.jpg' if extension == '.jpeg' else extension)
+        await db.status(
+            db.text("INSERT INTO image_aliases (name, blob_name) VALUES (:name, :blob_name) ON CONFLICT (name) DO NOTHING"),
+            name=name, blob_name=blob_name
+        )
+        os.unlink(path)
+        _resolve_cache.pop((image_folder, name))
+        imported += 1
+
+    logger.info(f"Imported {imported} legacy image(s) from {image_folder} into the blob store")
+    return imported
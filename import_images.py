@@ -0,0 +1,32 @@
+"""
+Move the flat, name-addressed card images into the content-addressed blob store.
+
+    python import_images.py
+    python import_images.py --image-folder card_images
+
+Each image is hard-linked into its shard and recorded in image_aliases before
+the flat file is removed, so existing card rows keep resolving throughout and
+an interrupted import can simply be run again.
+"""
+import asyncio
+import logging
+import argparse
+from extensions import db
+from db_pool import database_dsn, pool_settings
+from image_store import IMAGE_SAVE_PATH, import_legacy_images
+
+async def main(args: argparse.Namespace) -> None:
+    await db.set_bind(database_dsn(), **dict(pool_settings(), min_size=1, max_size=1))
+    try:
+        await import_legacy_images(args.image_folder)
+    finally:
+        await db.pop_bind().close()
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Import legacy card images into the content-addressed blob store.')
+    parser.add_argument('--image-folder', default=IMAGE_SAVE_PATH)
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    asyncio.run(main(parse_args()))
@@ -0,0 +1,105 @@
+import os
+import json
+import asyncio
+import logging
+from collections import defaultdict
+from typing import Dict, Any, Optional, Set
+from extensions import db
+from response_cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+# Event settings
+JOB_EVENTS_CHANNEL = 'image_job_events'
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', 1))  # Server worker processes, as read by gunicorn and Hypercorn setups
+# Fan events out to every worker through Postgres; on by default whenever more than one worker runs
+JOB_EVENTS_NOTIFY = os.getenv('JOB_EVENTS_NOTIFY', 'true' if WEB_CONCURRENCY > 1 else 'false').lower() == 'true'
+JOB_EVENTS_QUEUE_SIZE = 16  # Events buffered per subscriber
+JOB_EVENTS_HEARTBEAT = float(os.getenv('JOB_EVENTS_HEARTBEAT', 15))  # Seconds between keep-alives on idle streams
+
+# Statuses after which a request produces no further events
+TERMINAL_STATUSES = {'COMPLETED', 'FAILED'}
+
+class JobEventHub:
+    """
+    In-process pub/sub of image request status events, keyed by request_id.
+    Subscribers get a bounded queue per request; the last event of each request
+    is remembered briefly so a client that subscribes just after an event still sees it.
+    With JOB_EVENTS_NOTIFY set, publish() goes through Postgres NOTIFY and every
+    worker's LISTEN connection feeds its own subscribers, so a job finished on one
+    worker reaches clients streaming from another.
+    """
+
+    def __init__(self):
+        self.subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+        self.recent = LRUCache(maxsize=4096, ttl=300)
+        self._listener = None
+
+    def subscribe(self, request_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=JOB_EVENTS_QUEUE_SIZE)
+        self.subscribers[request_id].add(queue)
+        return queue
+
+    def unsubscribe(self, request_id: str, queue: asyncio.Queue) -> None:
+        queues = self.subscribers.get(request_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self.subscribers[request_id]
+
+    def last_event(self, request_id: str) -> Optional[Dict[str, Any]]:
+        return self.recent.get(request_id)
+
+    async def publish(self, request_id: str, event: Dict[str, Any]) -> None:
+        """Publish a status event for a request to every subscriber."""
+        event = dict(event, request_id=request_id)
+        if JOB_EVENTS_NOTIFY and self._listener is not None:
+            try:
+                await db.status(db.text("SELECT pg_notify(:channel, :payload)"), channel=JOB_EVENTS_CHANNEL, payload=json.dumps(event))
+                return
+            except Exception as e:
+                logger.warning(f"Job event NOTIFY failed, delivering locally only: {e}")
+        self.dispatch(event)
+
+    def dispatch(self, event: Dict[str, Any]) -> None:
+        """Hand an event to the local subscribers of its request."""
+        request_id = event['request_id']
+        self.recent.set(request_id, event)
+        for queue in list(self.subscribers.get(request_id, ())):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning(f"Dropping job event for slow subscriber of {request_id}")
+
+    def _on_notify(self, _connection, _pid, _channel, payload) -> None:
+        try:
+            self.dispatch(json.loads(payload))
+        except (ValueError, KeyError) as e:
+            logger.warning(f"Ignoring malformed job event: {e}")
+
+    async def start(self) -> None:
+        """Start listening for events published by other workers."""
+        if not JOB_EVENTS_NOTIFY or self._listener is not None:
+            return
+        self._listener = await db.acquire(reusable=False)
+        await self._listener.raw_connection.add_listener(JOB_EVENTS_CHANNEL, self._on_notify)
+        logger.info(f"Listening for job events on {JOB_EVENTS_CHANNEL}")
+
+    async def stop(self) -> None:
+        if self._listener is None:
+            return
+        try:
+            await self._listener.raw_connection.remove_listener(JOB_EVENTS_CHANNEL, self._on_notify)
+        finally:
+            await self._listener.release()
+            self._listener = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'requests': len(self.subscribers),
+            'subscribers': sum(len(queues) for queues in self.subscribers.values()),
+            'notify': self._listener is not None,
+        }
+
+job_events = JobEventHub()
@@ -0,0 +1,181 @@
+import os
+import time
+import logging
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+
+# Latency buckets in seconds, from a cache hit up to a slow DALL-E call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelValues = Tuple[str, ...]
+
+def format_labels(names: Iterable[str], values: Iterable[str]) -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values, strict=True)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def escape_label(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """
+    Base of the in-process metric types. Recording is a dict lookup and an
+    add on the event loop thread, so it stays cheap enough to leave on.
+    """
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, *labels: str) -> None:
+        if METRICS_ENABLED:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return self.header() + [
+            f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+            for labels, value in sorted(self.values.items())
+        ]
+
+class Gauge(Metric):
+    """Gauge set directly, or read from `callback` (returning {label values: value}) at scrape time."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), callback: Optional[Callable[[], Dict[LabelValues, float]]] = None):
+        super().__init__(name, documentation, labels)
+        self.values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+    def render(self) -> List[str]:
+        values = self.values
+        if self.callback is not None:
+            try:
+                values = self.callback()
+            except Exception as e:
+                logger.warning(f"Could not collect {self.name}: {e}")
+                values = {}
+        return self.header() + [
+            f"{self.name}{format_labels(self.label_names, labels)} {format_value(value)}"
+            for labels, value in sorted(values.items())
+        ]
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[LabelValues, list] = {}  # labels -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def time(self, *labels: str) -> "Timer":
+        return Timer(self, labels)
+
+    def render(self) -> List[str]:
+        lines = self.header()
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            # Bucket counts, +Inf last; the series' final entry is the running sum
+            for bound, count in zip(self.buckets + (float('inf'),), series[:-1], strict=True):
+                cumulative += count
+                bucket_labels = format_labels(self.label_names + ('le',), labels + (format_value(float(bound)),))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_text} {format_value(series[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+class Timer:
+    """Context manager observing the elapsed time of its block into a histogram."""
+
+    def __init__(self, histogram: Histogram, labels: LabelValues):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> "Timer":
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> bool:
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+class Registry:
+    def __init__(self):
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+registry = Registry()
+
+# Request and upstream metrics
+http_request_duration = registry.register(Histogram(
+    'http_request_duration_seconds', 'Time to produce a response, per route.', ('method', 'route', 'status')
+))
+upstream_call_duration = registry.register(Histogram(
+    'upstream_call_duration_seconds', 'Latency of calls to external services.', ('upstream', 'outcome')
+))
+upstream_retries = registry.register(Counter(
+    'upstream_retries_total', 'Retries scheduled by tenacity, per function and exception.', ('function', 'exception')
+))
+upstream_errors = registry.register(Counter(
+    'upstream_errors_total', 'Failed calls to external services.', ('upstream', 'exception')
+))
+image_bytes_served = registry.register(Counter(
+    'image_bytes_served_total', 'Image bytes sent by card_image (X-Accel-Redirect bytes are sent by the proxy).', ('mode',)
+))
+db_query_duration = registry.register(Histogram(
+    'db_query_duration_seconds', 'Duration of database statements.', (),
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+))
+
+def record_retry(retry_state) -> None:
+    """tenacity before_sleep hook counting each retry of a decorated upstream call."""
+    exception = retry_state.outcome.exception() if retry_state.outcome else None
+    upstream_retries.inc(1, retry_state.fn.__name__, type(exception).__name__ if exception else 'None')
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    return registry.render()
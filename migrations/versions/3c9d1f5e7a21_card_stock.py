@@ -0,0 +1,35 @@
+"""add card_stock inventory table
+
+Revision ID: 3c9d1f5e7a21
+Revises: aef83076e576
+Create Date: 2026-10-17 09:12:44.118204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9d1f5e7a21'
+down_revision = 'aef83076e576'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('card_stock',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rarity', sa.String(length=20), nullable=False),
+    sa.Column('card_data', sa.JSON(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('card_stock', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_card_stock_rarity'), ['rarity'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('card_stock', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_card_stock_rarity'))
+
+    op.drop_table('card_stock')
@@ -0,0 +1,29 @@
+"""add image_aliases for legacy image filenames
+
+Revision ID: 5f7a9c1e3b24
+Revises: 8b2e4a6d0f13
+Create Date: 2026-10-17 11:41:09.372615
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f7a9c1e3b24'
+down_revision = '8b2e4a6d0f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_aliases',
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('blob_name', sa.String(length=80), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('image_aliases')
@@ -0,0 +1,37 @@
+"""add card_number_counter allocator row
+
+Revision ID: 8b2e4a6d0f13
+Revises: 3c9d1f5e7a21
+Create Date: 2026-10-17 10:03:27.540912
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8b2e4a6d0f13'
+down_revision = '3c9d1f5e7a21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('card_number_counter',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('set_name', sa.String(length=3), nullable=False),
+    sa.Column('next_number', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Continue numbering after the most recently created card, or start the default set
+    op.execute(
+        "INSERT INTO card_number_counter (id, set_name, next_number) "
+        "SELECT 1, COALESCE(last_card.set_name, 'GEN'), COALESCE(last_card.card_number, 0) + 1 "
+        "FROM (SELECT 1) AS seed "
+        "LEFT JOIN (SELECT set_name, card_number FROM cards ORDER BY id DESC LIMIT 1) AS last_card ON TRUE"
+    )
+
+
+def downgrade():
+    op.drop_table('card_number_counter')
@@ -0,0 +1,54 @@
+"""add image_jobs queue table
+
+Revision ID: a1d3f5b7c9e2
+Revises: 5f7a9c1e3b24
+Create Date: 2026-10-17 13:26:51.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1d3f5b7c9e2'
+down_revision = '5f7a9c1e3b24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('image_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('request_id', sa.String(length=100), nullable=False),
+    sa.Column('card_id', sa.Integer(), nullable=False),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=False),
+    sa.Column('result', sa.JSON(), nullable=True),
+    sa.Column('error', sa.Text(), nullable=True),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('locked_by', sa.String(length=100), nullable=True),
+    sa.Column('locked_until', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['card_id'], ['cards.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('request_id')
+    )
+    with op.batch_alter_table('image_jobs', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_image_jobs_card_id'), ['card_id'], unique=False)
+
+    # Claim scans only touch jobs that are waiting or running
+    op.execute(
+        "CREATE INDEX ix_image_jobs_claimable ON image_jobs (run_at, id) "
+        "WHERE status IN ('QUEUED', 'RUNNING')"
+    )
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_image_jobs_claimable")
+    with op.batch_alter_table('image_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_jobs_card_id'))
+
+    op.drop_table('image_jobs')
@@ -0,0 +1,28 @@
+"""add batch_id to image_jobs
+
+Revision ID: c4e6a8b0d2f5
+Revises: a1d3f5b7c9e2
+Create Date: 2026-10-17 15:02:11.377190
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e6a8b0d2f5'
+down_revision = 'a1d3f5b7c9e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('image_jobs', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('batch_id', sa.String(length=36), nullable=True))
+        batch_op.create_index(batch_op.f('ix_image_jobs_batch_id'), ['batch_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('image_jobs', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_image_jobs_batch_id'))
+        batch_op.drop_column('batch_id')
@@ -0,0 +1,39 @@
+"""add full-text and trigram search over cards
+
+Revision ID: d7f9b1c3e5a8
+Revises: c4e6a8b0d2f5
+Create Date: 2026-10-17 16:40:27.118604
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7f9b1c3e5a8'
+down_revision = 'c4e6a8b0d2f5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+
+    # Postgres keeps the generated column current on every insert and update.
+    # Weights rank name matches above type line, abilities and flavor text.
+    op.execute(
+        "ALTER TABLE cards ADD COLUMN search_vector tsvector GENERATED ALWAYS AS ("
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(card_type, '')), 'B') || "
+        "setweight(to_tsvector('english', coalesce(abilities, '')), 'C') || "
+        "setweight(to_tsvector('english', coalesce(flavor_text, '')), 'D')"
+        ") STORED"
+    )
+    op.execute("CREATE INDEX ix_cards_search_vector ON cards USING gin (search_vector)")
+    op.execute("CREATE INDEX ix_cards_name_trgm ON cards USING gin (name gin_trgm_ops)")
+
+
+def downgrade():
+    op.execute("DROP INDEX IF EXISTS ix_cards_name_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_cards_search_vector")
+    with op.batch_alter_table('cards', schema=None) as batch_op:
+        batch_op.drop_column('search_vector')
@@ -0,0 +1,120 @@
+"""add facet filter indexes and trigger-maintained facet counts
+
+Revision ID: e2a4c6e8f0b1
+Revises: d7f9b1c3e5a8
+Create Date: 2026-10-17 17:21:09.540263
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a4c6e8f0b1'
+down_revision = 'd7f9b1c3e5a8'
+branch_labels = None
+depends_on = None
+
+# Facet values of a set of card rows, one (facet, value) pair per row and facet
+FACET_VALUES = (
+    "LATERAL (VALUES ('color', rows.color), ('rarity', rows.rarity), "
+    "('set', rows.set_name), ('type', card_primary_type(rows.card_type))) AS facets(facet, value)"
+)
+UPSERT_COUNTS = (
+    "ON CONFLICT (facet, value) DO UPDATE SET count = card_facet_counts.count + EXCLUDED.count"
+)
+
+
+def upgrade():
+    # Core type of a type line, e.g. 'Legendary Creature - Elf Warrior' -> 'Creature'
+    op.execute("""
+        CREATE FUNCTION card_primary_type(type_line text) RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE AS $$
+            SELECT coalesce(
+                (SELECT core FROM unnest(ARRAY['Creature', 'Planeswalker', 'Artifact', 'Enchantment', 'Land', 'Instant', 'Sorcery'])
+                    WITH ORDINALITY AS types(core, position)
+                 WHERE type_line ILIKE '%' || core || '%' ORDER BY position LIMIT 1),
+                'Other')
+        $$
+    """)
+
+    with op.batch_alter_table('cards', schema=None) as batch_op:
+        batch_op.create_index('ix_cards_set_name_rarity_id', ['set_name', 'rarity', 'id'], unique=False)
+        batch_op.create_index('ix_cards_rarity_id', ['rarity', 'id'], unique=False)
+        batch_op.create_index('ix_cards_color_id', ['color', 'id'], unique=False)
+    op.execute("CREATE INDEX ix_cards_primary_type_id ON cards (card_primary_type(card_type), id)")
+
+    op.create_table('card_facet_counts',
+    sa.Column('facet', sa.String(length=20), nullable=False),
+    sa.Column('value', sa.String(length=100), nullable=False),
+    sa.Column('count', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('facet', 'value')
+    )
+    op.execute(
+        f"INSERT INTO card_facet_counts (facet, value, count) "
+        f"SELECT facet, value, count(*) FROM cards AS rows, {FACET_VALUES} GROUP BY facet, value"
+    )
+
+    # Statement-level triggers with transition tables: one upsert per touched facet
+    # value per statement, so a bulk insert or COPY does not update a counter per row.
+    # Updates only write when a facet value actually changed. Every upsert locks its
+    # counter rows in (facet, value) order, so concurrent statements cannot deadlock.
+    op.execute(f"""
+        CREATE FUNCTION card_facet_counts_apply() RETURNS trigger
+        LANGUAGE plpgsql AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO card_facet_counts (facet, value, count)
+                SELECT facet, value, count(*) FROM new_rows AS rows, {FACET_VALUES}
+                GROUP BY facet, value
+                ORDER BY facet, value
+                {UPSERT_COUNTS};
+            ELSIF TG_OP = 'DELETE' THEN
+                INSERT INTO card_facet_counts (facet, value, count)
+                SELECT facet, value, -count(*) FROM old_rows AS rows, {FACET_VALUES}
+                GROUP BY facet, value
+                ORDER BY facet, value
+                {UPSERT_COUNTS};
+            ELSE
+                INSERT INTO card_facet_counts (facet, value, count)
+                SELECT facet, value, sum(delta) FROM (
+                    SELECT facet, value, -1 AS delta FROM old_rows AS rows, {FACET_VALUES}
+                    UNION ALL
+                    SELECT facet, value, 1 AS delta FROM new_rows AS rows, {FACET_VALUES}
+                ) AS changes
+                GROUP BY facet, value
+                HAVING sum(delta) <> 0
+                ORDER BY facet, value
+                {UPSERT_COUNTS};
+            END IF;
+            RETURN NULL;
+        END
+        $$
+    """)
+    op.execute(
+        "CREATE TRIGGER cards_facet_counts_insert AFTER INSERT ON cards "
+        "REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION card_facet_counts_apply()"
+    )
+    op.execute(
+        "CREATE TRIGGER cards_facet_counts_update AFTER UPDATE ON cards "
+        "REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT EXECUTE FUNCTION card_facet_counts_apply()"
+    )
+    op.execute(
+        "CREATE TRIGGER cards_facet_counts_delete AFTER DELETE ON cards "
+        "REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT EXECUTE FUNCTION card_facet_counts_apply()"
+    )
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS cards_facet_counts_delete ON cards")
+    op.execute("DROP TRIGGER IF EXISTS cards_facet_counts_update ON cards")
+    op.execute("DROP TRIGGER IF EXISTS cards_facet_counts_insert ON cards")
+    op.execute("DROP FUNCTION IF EXISTS card_facet_counts_apply()")
+    op.drop_table('card_facet_counts')
+
+    op.execute("DROP INDEX IF EXISTS ix_cards_primary_type_id")
+    with op.batch_alter_table('cards', schema=None) as batch_op:
+        batch_op.drop_index('ix_cards_color_id')
+        batch_op.drop_index('ix_cards_rarity_id')
+        batch_op.drop_index('ix_cards_set_name_rarity_id')
+    op.execute("DROP FUNCTION IF EXISTS card_primary_type(text)")
@@ -1,9 +1,6 @@
 import os
 from datetime import datetime
-from gino import Gino
-
-# Initialize the Gino database instance
-db = Gino()
+from extensions import db  # Shared Gino instance, bound to the pool in app.create_app()
 
 class Card(db.Model):
     __tablename__ = 'cards'
@@ -90,4 +87,83 @@ class Card(db.Model):
         self.ai_image_status = status
         if ai_image_url:
             self.ai_image_url = os.path.basename(ai_image_url)
-        await self.update(ai_image_status=self.ai_image_status).apply()
\ No newline at end of file
+        await self.update(ai_image_status=self.ai_image_status).apply()
+
+
+class StockedCard(db.Model):
+    """A fully generated card (text plus image on disk) waiting in the inventory to be claimed."""
+    __tablename__ = 'card_stock'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    rarity = db.Column(db.String(20), nullable=False, index=True)
+    card_data = db.Column(db.JSON(), nullable=False)  # Generator output, including set_name, card_number and image_url
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<StockedCard {self.rarity} (ID: {self.id})>"
+
+
+class CardNumberCounter(db.Model):
+    """Single-row counter holding the current set and the next free card number in it."""
+    __tablename__ = 'card_number_counter'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    set_name = db.Column(db.String(3), nullable=False, default='GEN')
+    next_number = db.Column(db.Integer(), nullable=False, default=1)
+
+    def __repr__(self):
+        return f"<CardNumberCounter {self.set_name}-{self.next_number}>"
+
+
+class ImageAlias(db.Model):
+    """Maps a legacy, name-addressed image file to the content-addressed blob it was imported as."""
+    __tablename__ = 'image_aliases'
+
+    name = db.Column(db.String(255), primary_key=True)  # Old filename, e.g. GEN_1.png
+    blob_name = db.Column(db.String(80), nullable=False)  # <sha256>.<ext> in the blob store
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ImageAlias {self.name} -> {self.blob_name}>"
+
+
+class ImageJob(db.Model):
+    """
+    A durable AI image generation request, claimed by workers with SELECT ... FOR UPDATE SKIP LOCKED.
+    Status: QUEUED, RUNNING, COMPLETED or DEAD (attempts exhausted).
+    """
+    __tablename__ = 'image_jobs'
+
+    id = db.Column(db.Integer(), primary_key=True)
+    request_id = db.Column(db.String(100), nullable=False, unique=True)
+    card_id = db.Column(db.Integer(), db.ForeignKey('cards.id', ondelete='CASCADE'), nullable=False, index=True)
+    batch_id = db.Column(db.String(36), nullable=True, index=True)  # Set when queued as part of a batch
+    status = db.Column(db.String(20), nullable=False, default='QUEUED')
+    payload = db.Column(db.JSON(), nullable=False)  # Arguments for the FLUX request
+    result = db.Column(db.JSON(), nullable=True)  # {"image_urls": [...]} once completed
+    error = db.Column(db.Text(), nullable=True)
+    attempts = db.Column(db.Integer(), nullable=False, default=0)
+    max_attempts = db.Column(db.Integer(), nullable=False, default=3)
+    run_at = db.Column(db.DateTime(), nullable=False, default=datetime.utcnow)  # Not claimable before this time
+    locked_by = db.Column(db.String(100), nullable=True)
+    locked_until = db.Column(db.DateTime(), nullable=True)  # Visibility timeout of a RUNNING job
+    created_at = db.Column(db.DateTime(), default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime(), default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f"<ImageJob {self.request_id} {self.status}>"
+
+
+class CardFacetCount(db.Model):
+    """
+    Number of cards per facet value (color, rarity, set, type), kept current by
+    statement-level triggers on cards so the gallery never runs a GROUP BY.
+    """
+    __tablename__ = 'card_facet_counts'
+
+    facet = db.Column(db.String(20), primary_key=True)
+    value = db.Column(db.String(100), primary_key=True)
+    count = db.Column(db.BigInteger(), nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<CardFacetCount {self.facet}={self.value}: {self.count}>"
@@ -1,6 +1,9 @@
 import os
+import asyncio
+import weakref
 from dotenv import load_dotenv
 import openai
+from http_client import get_http_client
 
 # Load the .env file
 load_dotenv()
@@ -15,4 +18,17 @@ if not api_key:
 openai.api_key = api_key
 
 # Optionally, if you want to use openai.Client explicitly
-openai_client = openai
\ No newline at end of file
+openai_client = openai
+
+# Async clients are cached per event loop and share the pooled HTTP client
+_async_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, openai.AsyncOpenAI]" = weakref.WeakKeyDictionary()
+
+def get_async_openai_client() -> openai.AsyncOpenAI:
+    """Return the async OpenAI client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None or client.is_closed():
+        # Retries are handled by tenacity in card_generator, not by the SDK
+        client = openai.AsyncOpenAI(api_key=api_key, http_client=get_http_client(), max_retries=0)
+        _async_clients[loop] = client
+    return client
@@ -0,0 +1,27 @@
+import json
+import base64
+from typing import Dict, Any
+
+# Keyset pagination helpers: cursors are opaque to clients but carry the sort key of the last row served
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 100
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    """Encode the sort key of the last row on a page into an opaque cursor string."""
+    payload = json.dumps(position, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    """Decode a cursor produced by encode_cursor(). Raises ValueError if it was tampered with or truncated."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        position = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, UnicodeError) as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+    if not isinstance(position, dict):
+        raise ValueError("Invalid cursor: not an object")
+    return position
+
+def clamp_per_page(per_page: int) -> int:
+    """Keep the requested page size within sane bounds."""
+    return max(1, min(per_page or DEFAULT_PER_PAGE, MAX_PER_PAGE))
@@ -0,0 +1,190 @@
+import os
+import time
+import json
+import base64
+import hashlib
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Awaitable, NamedTuple, Optional
+from quart import request, Response
+
+logger = logging.getLogger(__name__)
+
+# Cache settings
+RESPONSE_CACHE_MAXSIZE = int(os.getenv('RESPONSE_CACHE_MAXSIZE', 2048))  # Entries kept per worker
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL', 300))  # Seconds an entry stays valid
+RESPONSE_CACHE_REDIS_URL = os.getenv('RESPONSE_CACHE_REDIS_URL')  # Optional shared layer across workers
+RESPONSE_CACHE_GENERATION_REFRESH = float(os.getenv('RESPONSE_CACHE_GENERATION_REFRESH', 1))  # Seconds between shared invalidation checks
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    content_type: str
+    etag: str
+    last_modified: Optional[datetime]
+
+class LRUCache:
+    """Small in-process LRU cache whose entries also expire after a TTL."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Any, tuple]" = OrderedDict()
+
+    def get(self, key: Any) -> Any:
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Any, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def pop(self, key: Any) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class ResponseCache:
+    """
+    Cache of rendered card responses.
+    Keys are namespaced by a generation number; invalidate() bumps the
+    generation so every cached listing and detail page is dropped at once.
+    With RESPONSE_CACHE_REDIS_URL set, entries and the generation are shared
+    through Redis so a write on one worker invalidates all of them.
+    """
+
+    def __init__(self, maxsize: int = RESPONSE_CACHE_MAXSIZE, ttl: float = RESPONSE_CACHE_TTL, redis_url: Optional[str] = RESPONSE_CACHE_REDIS_URL):
+        self.local = LRUCache(maxsize, ttl)
+        self.ttl = ttl
+        self.generation = 0
+        self._generation_checked_at = 0.0
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis  # Optional dependency, only needed for the shared layer
+            self._redis = redis.from_url(redis_url)
+
+    async def _current_generation(self) -> int:
+        """Return the cache generation, re-reading the shared one at most once per refresh interval."""
+        if self._redis is None:
+            return self.generation
+        now = time.monotonic()
+        if now - self._generation_checked_at >= RESPONSE_CACHE_GENERATION_REFRESH:
+            try:
+                self.generation = int(await self._redis.get('response_cache:generation') or 0)
+                self._generation_checked_at = now
+            except Exception as e:
+                logger.warning(f"Response cache generation unavailable from Redis: {e}")
+        return self.generation
+
+    async def get(self, key: str) -> Optional[CachedResponse]:
+        generation = await self._current_generation()
+        namespaced_key = f"{generation}:{key}"
+        entry = self.local.get(namespaced_key)
+        if entry is not None or self._redis is None:
+            return entry
+
+        try:
+            raw = await self._redis.get(f"response_cache:{namespaced_key}")
+        except Exception as e:
+            logger.warning(f"Response cache read from Redis failed: {e}")
+            return None
+        if raw is None:
+            return None
+        entry = decode_entry(raw)
+        self.local.set(namespaced_key, entry)
+        return entry
+
+    async def set(self, key: str, entry: CachedResponse) -> None:
+        generation = await self._current_generation()
+        namespaced_key = f"{generation}:{key}"
+        self.local.set(namespaced_key, entry)
+        if self._redis is not None:
+            try:
+                await self._redis.set(f"response_cache:{namespaced_key}", encode_entry(entry), ex=int(self.ttl))
+            except Exception as e:
+                logger.warning(f"Response cache write to Redis failed: {e}")
+
+    async def invalidate(self) -> None:
+        """Drop every cached card response, on all workers when Redis is configured."""
+        self.local.clear()
+        self.generation += 1
+        if self._redis is not None:
+            try:
+                self.generation = int(await self._redis.incr('response_cache:generation'))
+                self._generation_checked_at = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Response cache invalidation in Redis failed: {e}")
+
+    def stats(self) -> dict:
+        return {
+            'entries': len(self.local),
+            'hits': self.local.hits,
+            'misses': self.local.misses,
+            'generation': self.generation,
+            'shared': self._redis is not None,
+        }
+
+def encode_entry(entry: CachedResponse) -> bytes:
+    return json.dumps({
+        'body': base64.b64encode(entry.body).decode('ascii'),
+        'content_type': entry.content_type,
+        'etag': entry.etag,
+        'last_modified': entry.last_modified.isoformat() if entry.last_modified else None,
+    }).encode('utf-8')
+
+def decode_entry(raw: bytes) -> CachedResponse:
+    data = json.loads(raw)
+    return CachedResponse(
+        body=base64.b64decode(data['body']),
+        content_type=data['content_type'],
+        etag=data['etag'],
+        last_modified=datetime.fromisoformat(data['last_modified']) if data['last_modified'] else None,
+    )
+
+def build_entry(body: bytes, content_type: str, last_modified: Optional[datetime] = None) -> CachedResponse:
+    """Wrap a rendered body with a strong ETag derived from its bytes."""
+    etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+    if last_modified is not None and last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=timezone.utc)  # Card timestamps are stored as naive UTC
+    return CachedResponse(body, content_type, etag, last_modified)
+
+def make_conditional_response(entry: CachedResponse) -> Response:
+    """Build the response for a cache entry, answering 304 when the client's copy is current."""
+    not_modified = False
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(entry.etag)
+    elif request.if_modified_since and entry.last_modified:
+        not_modified = entry.last_modified.replace(microsecond=0) <= request.if_modified_since
+
+    response = Response(b'' if not_modified else entry.body, status=304 if not_modified else 200, content_type=entry.content_type)
+    response.set_etag(entry.etag)
+    if entry.last_modified:
+        response.last_modified = entry.last_modified
+    response.cache_control.no_cache = True  # Always revalidate; the ETag makes that a cheap 304
+    return response
+
+async def cached(key: str, render: Callable[[], Awaitable[CachedResponse]]) -> Response:
+    """Serve `key` from the cache, rendering and storing it on a miss."""
+    entry = await card_cache.get(key)
+    if entry is None:
+        entry = await render()
+        await card_cache.set(key, entry)
+    return make_conditional_response(entry)
+
+# Shared cache for card listings and card detail pages
+card_cache = ResponseCache()
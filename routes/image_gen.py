@@ -1,13 +1,16 @@
 import os
+import json
 import asyncio
 import logging
-from quart import Blueprint, jsonify, request
+from quart import Blueprint, jsonify, request, websocket, make_response
 from dotenv import load_dotenv
 from uuid import uuid4
 from models import Card
 from extensions import db
+from response_cache import card_cache
+from image_jobs import enqueue_image_job, complete_from_cache, get_job_status, enqueue_image_batch, get_batch_status, IMAGE_BATCH_MAX_CARDS
+from job_events import job_events, JOB_EVENTS_HEARTBEAT, TERMINAL_STATUSES
 from werkzeug.utils import secure_filename
-import fal_client
 
 # Load environment variables
 load_dotenv()
@@ -22,9 +25,6 @@ if not FAL_KEY:
     logger.error("FAL_KEY is not set in the environment variables.")
     raise ValueError("FAL_KEY is not set in the environment variables.")
 
-# In-memory storage for tracking image generation requests
-image_requests = {}
-
 # Directory to store uploaded images
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
@@ -67,6 +67,7 @@ async def create_card():
         )
         db.session.add(new_card)
         await db.session.commit()
+        await card_cache.invalidate()
 
         return jsonify({"id": new_card.id, "message": "Card created successfully."}), 201
     except Exception as e:
@@ -101,81 +102,162 @@ async def generate_image():
     # Generate a unique request_id
     request_id = str(uuid4())
 
-    async def submit_image_request():
-        try:
-            # Subscribe to the FLUX API to generate the image
-            response = await fal_client.subscribe_async(
-                "fal-ai/flux/dev",
-                arguments={
-                    "prompt": prompt,
-                    "image_size": image_size,
-                    "num_inference_steps": num_inference_steps,
-                    "seed": seed,
-                    "guidance_scale": guidance_scale,
-                    "num_images": num_images,
-                    "enable_safety_checker": enable_safety_checker
-                }
-            )
-
-            # Extract image URLs from the response
-            image_urls = [img['url'] for img in response.get('images', [])]
-
-            # Update the Card instance with AI image details
-            if image_urls:
-                card.ai_request_id = request_id
-                card.ai_image_status = 'COMPLETED'
-                card.ai_image_url = image_urls[0]  # Assuming we only use the first image
-                await db.session.commit()
-                return {"status": "COMPLETED", "image_urls": image_urls}
-            else:
-                card.ai_image_status = 'FAILED'
-                await db.session.commit()
-                return {"status": "FAILED", "error": "No image generated."}
-
-        except Exception as e:
-            logger.error(f"Error generating image: {e}")
-            card.ai_image_status = 'FAILED'
-            await db.session.commit()
-            return {"status": "FAILED", "error": str(e)}
-
-    # Set the card status to IN_PROGRESS and commit
-    card.ai_request_id = request_id
-    card.ai_image_status = 'IN_PROGRESS'
-    await db.session.commit()
-
-    # Create and run the asyncio task
-    task = asyncio.create_task(submit_image_request())
-    image_requests[request_id] = task
-
-    # Return the initial request_id, and let the async task complete in the background
+    payload = {
+        "prompt": prompt,
+        "image_size": image_size,
+        "num_inference_steps": num_inference_steps,
+        "seed": seed,
+        "guidance_scale": guidance_scale,
+        "num_images": num_images,
+        "enable_safety_checker": enable_safety_checker
+    }
+
+    # A seeded request identical to an earlier one reuses its stored images
+    image_urls = await complete_from_cache(card, payload, request_id)
+    if image_urls:
+        return jsonify({"request_id": request_id, "status": "COMPLETED", "image_urls": image_urls}), 200
+
+    # Set the card status to IN_PROGRESS and queue the job in one transaction; a worker submits it to FLUX
+    await enqueue_image_job(card, payload, request_id=request_id)
+
+    # Return the initial request_id, and let the queued job complete in the background
     return jsonify({"request_id": request_id, "status": "IN_PROGRESS"}), 202
 
 
+@image_gen.route('/generate-images', methods=['POST'])
+async def generate_images():
+    """
+    Asynchronous endpoint to queue AI images for many cards at once, given
+    `card_ids` or a `set_name`. Returns a batch_id to follow aggregate progress.
+    """
+    data = await request.get_json()
+    if not data or not (data.get('card_ids') or data.get('set_name')):
+        return jsonify({"error": "card_ids or set_name is required."}), 400
+
+    params = {
+        "image_size": data.get('image_size', 'landscape_4_3'),
+        "num_inference_steps": data.get('num_inference_steps', 28),
+        "seed": data.get('seed'),
+        "guidance_scale": data.get('guidance_scale', 3.5),
+        "num_images": data.get('num_images', 1),
+        "enable_safety_checker": data.get('enable_safety_checker', True)
+    }
+
+    # Load every card in one query
+    query = Card.query
+    if data.get('card_ids'):
+        try:
+            card_ids = {int(card_id) for card_id in data['card_ids']}
+        except (TypeError, ValueError):
+            return jsonify({"error": "card_ids must be a list of integers."}), 400
+        query = query.where(Card.id.in_(card_ids))
+    if data.get('set_name'):
+        query = query.where(Card.set_name == data['set_name'])
+    cards = await query.order_by(Card.id).limit(IMAGE_BATCH_MAX_CARDS + 1).gino.all()
+
+    if not cards:
+        return jsonify({"error": "No matching cards found."}), 404
+    if len(cards) > IMAGE_BATCH_MAX_CARDS:
+        return jsonify({"error": f"Batches are limited to {IMAGE_BATCH_MAX_CARDS} cards."}), 400
+
+    batch_id = await enqueue_image_batch(cards, params, prompt=data.get('prompt'))
+    return jsonify(await get_batch_status(batch_id)), 202
+
+
+@image_gen.route('/batches/<batch_id>', methods=['GET'])
+async def batch_status(batch_id):
+    """Aggregate progress of an image generation batch."""
+    status = await get_batch_status(batch_id)
+    if status is None:
+        return jsonify({"error": "Invalid batch_id."}), 404
+    return jsonify(status), 200
+
+
 @image_gen.route('/api/image_gen/request-status/<request_id>', methods=['GET'])
 async def request_status(request_id):
     """
     Asynchronous endpoint to check the status of an image generation request.
     Returns the status and image URLs if completed.
     """
-    task = image_requests.get(request_id)
-    if not task:
-        # Check if the request exists in the database
-        card = await Card.query.filter_by(ai_request_id=request_id).first()
-        if not card:
-            return jsonify({"error": "Invalid request_id."}), 404
-        else:
-            return jsonify({
-                "status": card.ai_image_status,
-                "image_urls": [card.ai_image_url] if card.ai_image_url else []
-            }), 200
-
-    if task.done():
-        result = await task
-        del image_requests[request_id]  # Remove task from in-memory storage
-        return jsonify({
-            "status": result['status'],
-            "image_urls": result.get('image_urls', []),
-            "error": result.get('error', None)
-        }), 200
-    else:
-        return jsonify({"status": "IN_PROGRESS"}), 200
\ No newline at end of file
+    status = await get_request_status(request_id)
+    if status is None:
+        return jsonify({"error": "Invalid request_id."}), 404
+    return jsonify(status), 200
+
+
+async def get_request_status(request_id):
+    """Current status of an image generation request, or None if the request is unknown."""
+    job_status = await get_job_status(request_id)
+    if job_status is not None:
+        return job_status
+
+    # Requests made before the job queue existed are only recorded on the card
+    card = await Card.query.filter_by(ai_request_id=request_id).first()
+    if not card:
+        return None
+    return {
+        "status": card.ai_image_status,
+        "image_urls": [card.ai_image_url] if card.ai_image_url else []
+    }
+
+
+async def request_status_events(request_id):
+    """
+    Yield each status of a request once, ending after COMPLETED or FAILED.
+    Updates come from the event hub; whenever it stays quiet for a heartbeat the
+    database is read again, since the job may be finishing in another worker
+    whose events never reach this one. Yields None when a keep-alive is due.
+    """
+    queue = job_events.subscribe(request_id)
+    try:
+        event = job_events.last_event(request_id) or await get_request_status(request_id)
+        if event is None:
+            yield {"request_id": request_id, "status": "FAILED", "error": "Invalid request_id."}
+            return
+
+        sent = set()
+        while True:
+            if event is not None and event['status'] not in sent:
+                sent.add(event['status'])
+                yield dict(event, request_id=request_id)
+                if event['status'] in TERMINAL_STATUSES:
+                    return
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=JOB_EVENTS_HEARTBEAT)
+            except asyncio.TimeoutError:
+                event = await get_request_status(request_id)
+                if event is None or event['status'] in sent:
+                    event = None
+                    yield None
+    finally:
+        job_events.unsubscribe(request_id, queue)
+
+
+@image_gen.route('/request-events/<request_id>', methods=['GET'])
+async def request_events(request_id):
+    """
+    Server-Sent Events stream of an image generation request's status.
+    Pushes IN_PROGRESS, COMPLETED and FAILED once each, then closes.
+    """
+    async def stream():
+        async for event in request_status_events(request_id):
+            if event is None:
+                yield b": keep-alive\n\n"
+            else:
+                yield f"event: status\ndata: {json.dumps(event)}\n\n".encode('utf-8')
+
+    response = await make_response(stream(), {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Stop nginx from buffering the stream
+    })
+    response.timeout = None  # Streams stay open until the job finishes
+    return response
+
+
+@image_gen.websocket('/ws/request-status/<request_id>')
+async def request_status_socket(request_id):
+    """WebSocket variant of the status stream, sending each status as a JSON message."""
+    async for event in request_status_events(request_id):
+        if event is not None:
+            await websocket.send(json.dumps(event))
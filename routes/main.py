@@ -1,11 +1,23 @@
 import os
 import base64
-import json
 import logging
-from quart import Blueprint, render_template, jsonify, request, send_from_directory, url_for
+from quart import Blueprint, Response, abort, render_template, jsonify, request, url_for
 from extensions import db
-from models import Card
-from card_generator import generate_card, generate_card_image, open_pack
+from models import Card, CardFacetCount
+from card_generator import IMAGE_SAVE_PATH, generate_card_async, generate_card_image_async, open_pack_async, draw_card_async
+from card_inventory import get_inventory_status, restock_cards
+from card_store import insert_cards
+from card_search import search_cards, SEARCH_MAX_QUERY_LENGTH
+from card_json import card_summary_query, card_summaries, dumps
+from pagination import DEFAULT_PER_PAGE, clamp_per_page, encode_cursor, decode_cursor
+from response_cache import cached, build_entry, card_cache
+from image_result_cache import image_result_cache
+from upstream_limits import upstream_limits
+from db_pool import pool_stats
+from metrics import render_metrics
+from image_derivatives import DERIVATIVE_SIZES, negotiate_format, get_derivative
+from image_store import resolve_image_path, is_blob_name, stat_image
+from image_serving import serve_image_file, image_etag
 
 # Setup blueprint and logger
 main = Blueprint('main', __name__)
@@ -14,13 +26,41 @@ logger = logging.getLogger(__name__)
 # Utility function to serve images from local storage
 @main.route('/card_image/<filename>')
 async def card_image(filename):
-    image_folder = 'card_images'
-    try:
-        return await send_from_directory(image_folder, filename)
-    except FileNotFoundError:
+    """
+    Serve a card image from the content-addressed store; legacy filenames resolve
+    through the alias table or the old flat directory. `?size=thumb|grid|full`
+    serves a resized derivative in the best format the client's Accept header
+    allows (AVIF, then WebP), encoding it on first request if it does not exist
+    yet; otherwise the original is served. Responses carry strong ETags and
+    long-lived Cache-Control, and honour conditional and Range requests.
+    """
+    image_folder = IMAGE_SAVE_PATH
+    source_path = None if filename.startswith('.') else await resolve_image_path(image_folder, filename)
+    if source_path is None:
         logger.error(f"Image file {filename} not found")
         return jsonify({"error": "Image not found"}), 404
 
+    # Content-addressed names are write-once: the hash is the ETag and clients may cache forever
+    immutable = is_blob_name(filename)
+    content_address = os.path.splitext(filename)[0] if immutable else None
+
+    size = request.args.get('size')
+    image_format = negotiate_format(request.headers.get('Accept')) if size in DERIVATIVE_SIZES else None
+    if image_format:
+        path = await get_derivative(source_path, image_folder, filename, size, image_format)
+        info = stat_image(path)
+        response = await serve_image_file(
+            path, info, image_folder, image_etag(info, content_address, f"{size}.{image_format}"),
+            immutable, mimetype=f"image/{image_format}"
+        )
+    else:
+        info = stat_image(source_path)
+        response = await serve_image_file(source_path, info, image_folder, image_etag(info, content_address), immutable)
+
+    if size in DERIVATIVE_SIZES:
+        response.vary.add('Accept')
+    return response
+
 # Homepage route - Landing page
 @main.route('/')
 async def landing_page():
@@ -38,11 +78,14 @@ async def card_builder():
 # Card detail view
 @main.route('/card/<int:card_id>')
 async def card_detail(card_id):
+    return await cached(f"card:{card_id}", lambda: render_card_detail(card_id))
+
+async def render_card_detail(card_id):
     card = await Card.query.get_or_404(card_id)
 
     # Ensure card.image_url uses only the filename
     card.image_url = os.path.basename(card.image_url)
-    card.full_image_url = url_for('main.card_image', filename=card.image_url)
+    card.full_image_url = url_for('main.card_image', filename=card.image_url, size='full')
 
     # Prepare card data including all fields used in the template
     card_data = {
@@ -64,7 +107,8 @@ async def card_detail(card_id):
         if card_data[field] is None:
             logger.warning(f"Card field {field} is not set for card ID {card_id}")
 
-    return await render_template('card_detail.html', card=card_data)
+    html = await render_template('card_detail.html', card=card_data)
+    return build_entry(html.encode('utf-8'), 'text/html; charset=utf-8', card.updated_at)
 
 # Route to generate a card and render it on the page
 @main.route('/generate_card/<int:card_id>')
@@ -72,11 +116,12 @@ async def generate_card_view(card_id):
     card = await Card.query.get_or_404(card_id)
 
     if not card:
-        card_data = generate_card()  # Use your generate_card logic
+        card_data = await generate_card_async()  # Use your generate_card logic
         card = Card(**card_data)
-        card.image_url = generate_card_image(card_data)
+        card.image_url = await generate_card_image_async(card_data)
         db.session.add(card)
         await db.session.commit()
+        await card_cache.invalidate()
 
     # Ensure card image URL uses the correct path
     card.image_url = os.path.basename(card.image_url)
@@ -87,58 +132,226 @@ async def generate_card_view(card_id):
 # API route for paginated cards
 @main.route('/api/cards')
 async def get_cards():
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 20, type=int)
+    """
+    Keyset-paginated card listing, newest first.
+    Pass the returned `next_cursor` back as `cursor` to get the following page.
+    `page` is still accepted for older clients but costs an OFFSET scan.
+    `total=estimate` adds a cheap row estimate, `total=exact` a full COUNT(*).
+    `color`, `rarity`, `set` and `type` filter the listing (comma-separate
+    several values); `facets=1` adds the card count of every facet value.
+    Cards carry the summary fields the grid shows; `fields=full` returns whole
+    cards, and /api/cards/<id> returns one on demand.
+    """
+    per_page = clamp_per_page(request.args.get('per_page', DEFAULT_PER_PAGE, type=int))
+    cursor = request.args.get('cursor')
+    page = request.args.get('page', type=int)
+    total_mode = request.args.get('total')
+    filters = {
+        facet: [value.strip() for value in request.args[facet].split(',') if value.strip()]
+        for facet in CARD_FACETS if request.args.get(facet)
+    }
+    with_facets = request.args.get('facets') in ('1', 'true')
+    full = request.args.get('fields') == 'full'
 
-    cards = await Card.query.order_by(Card.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    card_data = [card.to_dict() for card in cards.items]
+    last_id = None
+    if cursor:
+        try:
+            last_id = int(decode_cursor(cursor)['id'])
+        except (ValueError, KeyError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400
 
-    return jsonify({
-        'cards': card_data,
-        'total': cards.total,
-        'pages': cards.pages,
-        'current_page': page
-    })
+    return await cached(
+        f"cards:{request.query_string.decode()}",
+        lambda: render_cards_page(per_page, last_id, page, total_mode, filters, with_facets, full)
+    )
+
+async def render_cards_page(per_page, last_id, page, total_mode, filters=None, with_facets=False, full=False):
+    # Each filter narrows an (<facet>, id) composite index scan, still in id order
+    query = (Card.query if full else card_summary_query()).order_by(Card.id.desc())
+    for facet, values in (filters or {}).items():
+        query = query.where(facet_column(facet).in_(values))
+    if last_id is not None:
+        query = query.where(Card.id < last_id)
+    elif page and page > 1:
+        query = query.offset((page - 1) * per_page)
+
+    # Fetch one extra row to learn whether another page exists without counting
+    rows = await query.limit(per_page + 1).gino.all()
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    cards = [card.to_dict() for card in rows] if full else card_summaries(rows)
+
+    response = {
+        'cards': cards,
+        'next_cursor': encode_cursor({'id': cards[-1]['id']}) if has_more else None,
+        'has_more': has_more,
+        'per_page': per_page
+    }
+
+    if with_facets:
+        response['facets'] = await get_facet_counts()
+
+    if total_mode in ('estimate', 'exact') or page:
+        total = await count_cards(exact=(total_mode == 'exact'), filters=filters)
+        response['total'] = total
+        response['total_is_estimate'] = total_mode != 'exact'
+        response['pages'] = -(-total // per_page)
+        if page:
+            response['current_page'] = page
+
+    last_modified = max((row.updated_at for row in rows if row.updated_at), default=None)
+    return build_entry(dumps(response), 'application/json', last_modified)
+
+# API route for one full card, loaded by gallery tiles as they come into view
+@main.route('/api/cards/<int:card_id>')
+async def api_card(card_id):
+    return await cached(f"card-json:{card_id}", lambda: render_card_json(card_id))
+
+async def render_card_json(card_id):
+    card = await Card.get(card_id)
+    if card is None:
+        abort(404)  # Raised before anything is cached
+    return build_entry(dumps(card.to_dict()), 'application/json', card.updated_at)
+
+# Gallery facets, each backed by an (<column>, id) index and counted in card_facet_counts
+CARD_FACETS = ('color', 'rarity', 'set', 'type')
+
+def facet_column(facet):
+    """Expression a facet filters on; `type` is the core type derived from the type line."""
+    if facet == 'type':
+        return db.func.card_primary_type(Card.card_type)
+    return Card.set_name if facet == 'set' else getattr(Card, facet)
+
+async def get_facet_counts():
+    """Card count per facet value, read from the trigger-maintained aggregate table."""
+    rows = await CardFacetCount.query.where(CardFacetCount.count > 0).gino.all()
+    counts = {facet: {} for facet in CARD_FACETS}
+    for row in rows:
+        counts.setdefault(row.facet, {})[row.value] = row.count
+    return counts
+
+# API route for ranked card search
+@main.route('/api/cards/search')
+async def api_search_cards():
+    """
+    Full-text search over name, type line, abilities and flavor text, tolerant
+    of misspelled names. Results are ranked best first and keyset-paginated:
+    pass the returned `next_cursor` back as `cursor`.
+    """
+    q = ' '.join(request.args.get('q', '').split())
+    if not q:
+        return jsonify({"error": "Query parameter q is required"}), 400
+    if len(q) > SEARCH_MAX_QUERY_LENGTH:
+        return jsonify({"error": f"Query is limited to {SEARCH_MAX_QUERY_LENGTH} characters"}), 400
+
+    per_page = clamp_per_page(request.args.get('per_page', DEFAULT_PER_PAGE, type=int))
+    cursor = request.args.get('cursor')
+    after = None
+    if cursor:
+        try:
+            position = decode_cursor(cursor)
+            after = (float(position['rank']), int(position['id']))
+        except (ValueError, KeyError, TypeError):
+            return jsonify({"error": "Invalid cursor"}), 400
+
+    return await cached(
+        f"search:{request.query_string.decode()}",
+        lambda: render_search_page(q, per_page, after)
+    )
+
+async def render_search_page(q, per_page, after):
+    # Fetch one extra hit to learn whether another page exists
+    results = await search_cards(q, per_page + 1, after)
+    has_more = len(results) > per_page
+    results = results[:per_page]
+
+    last_card, last_rank = results[-1] if results else (None, None)
+    response = {
+        'cards': [dict(card.to_dict(), rank=round(rank, 6)) for card, rank in results],
+        'next_cursor': encode_cursor({'rank': last_rank, 'id': last_card.id}) if has_more else None,
+        'has_more': has_more,
+        'per_page': per_page,
+        'query': q
+    }
+    return build_entry(dumps(response), 'application/json')
+
+async def count_cards(exact: bool = False, filters=None) -> int:
+    """
+    Count the cards, either exactly or without a table scan: from the planner
+    statistics, or for a single-facet filter from the facet count table.
+    """
+    if exact or (filters and len(filters) > 1):
+        query = db.select([db.func.count(Card.id)])
+        for facet, values in (filters or {}).items():
+            query = query.where(facet_column(facet).in_(values))
+        return await query.gino.scalar()
+    if filters:
+        (facet, values), = filters.items()
+        counts = await get_facet_counts()
+        return sum(counts.get(facet, {}).get(value, 0) for value in values)
+    estimate = await db.scalar(db.text("SELECT reltuples::bigint FROM pg_class WHERE oid = 'cards'::regclass"))
+    return max(int(estimate or 0), 0)
 
 # API route to generate a single card
 @main.route('/api/generate_card', methods=['POST'])
 async def api_generate_card():
+    claimed = []
     try:
-        card_data = generate_card()
-        cleaned_card_data = clean_card_data(card_data)
-        image_filename = generate_card_image(cleaned_card_data)
-        cleaned_card_data['image_url'] = image_filename
-
-        new_card = Card(**cleaned_card_data)
-        db.session.add(new_card)
-        await db.session.commit()
+        # Comes from the pre-generated inventory when stocked, with its image already on disk
+        card_data = await draw_card_async(claimed=claimed)
+        new_card = (await insert_cards([clean_card_data(card_data)]))[0]
+        await card_cache.invalidate()
 
         return jsonify(new_card.to_dict()), 201
     except Exception as e:
         logger.error(f"Error generating card: {str(e)}", exc_info=True)
-        await db.session.rollback()
+        await restock_cards(claimed)  # A stocked card that never got saved goes back to the inventory
         return jsonify({"error": "Failed to generate card"}), 500
 
 # API route to open a pack of cards
 @main.route('/api/open_pack', methods=['POST'])
 async def api_open_pack():
+    claimed = []
     try:
-        pack = open_pack()
-        card_objects = []
+        pack = await open_pack_async(claimed=claimed)
 
-        for card_data in pack:
-            cleaned_card_data = clean_card_data(card_data)
-            new_card = Card(**clean_card_data)
-            db.session.add(new_card)
-            card_objects.append(new_card)
-
-        await db.session.commit()
+        # The whole pack is written with one INSERT ... RETURNING
+        card_objects = await insert_cards([clean_card_data(card_data) for card_data in pack])
+        await card_cache.invalidate()
         return jsonify([card.to_dict() for card in card_objects]), 201
     except Exception as e:
         logger.error(f"Error opening pack: {str(e)}", exc_info=True)
-        await db.session.rollback()
+        await restock_cards(claimed)  # Stocked cards of a pack that never got saved go back to the inventory
         return jsonify({"error": "Failed to open pack"}), 500
 
+# API route exposing upstream rate budgets and circuit states
+@main.route('/api/upstreams')
+async def api_upstreams():
+    return jsonify(upstream_limits.stats())
+
+# Prometheus scrape endpoint
+@main.route('/metrics')
+async def metrics():
+    return Response(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+# API route exposing database pool checkout latency, saturation and slow queries
+@main.route('/api/db-pool')
+async def api_db_pool():
+    return jsonify(pool_stats.snapshot())
+
+# API route exposing the pre-generated card inventory
+@main.route('/api/inventory')
+async def api_inventory():
+    return jsonify(await get_inventory_status())
+
+# API route exposing response and image result cache statistics
+@main.route('/api/cache')
+async def api_cache():
+    return jsonify({
+        'responses': card_cache.stats(),
+        'image_results': image_result_cache.stats()
+    })
+
 # Error handlers
 @main.errorhandler(404)
 async def not_found_error(error):
@@ -160,8 +373,8 @@ def clean_card_data(card_data):
         'power_toughness': card_data.get('powerToughness', ''),
         'flavor_text': card_data.get('flavorText', 'No flavor text'),
         'rarity': card_data.get('rarity', 'Common'),
-        'set_name': card_data.get('set_name', 'GEN'),
-        'card_number': card_data.get('card_number', 0),
+        'set_name': card_data.get('set_name'),
+        'card_number': card_data.get('card_number'),  # Numbered on insert when missing
         'image_url': card_data.get('image_url', None)
     }
 
@@ -0,0 +1,204 @@
+"""
+Seed the cards table with synthetic cards for scale testing, without any network calls.
+
+    python seed_cards.py --count 2000000 --images 5000 --defer-search-indexes
+
+Rows are built in worker processes from the same defaults and rarity odds as
+generated cards, numbered through the card number counter (so unique_card_in_set
+holds and later cards continue after them) and loaded with COPY over several
+pooled connections at once.
+"""
+import io
+import time
+import random
+import asyncio
+import logging
+import argparse
+from datetime import datetime, timedelta
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from PIL import Image, ImageDraw
+from extensions import db
+from db_pool import database_dsn, pool_settings
+from card_fields import DEFAULT_RARITY_PROBABILITIES, standardize_card_data
+from card_numbers import reserve_card_numbers
+from card_store import CARD_TEXT_COLUMNS
+from card_search import SEARCH_INDEXES
+from image_store import IMAGE_SAVE_PATH, store_bytes
+
+logger = logging.getLogger(__name__)
+
+# Seeding defaults
+SEED_CHUNK_SIZE = 50000  # Rows built and copied per COPY statement
+SEED_CREATED_SPAN_DAYS = 365  # created_at is spread over this many days before now
+PLACEHOLDER_SIZE = (488, 680)  # Card proportions, small enough to render thousands quickly
+
+COPY_COLUMNS = CARD_TEXT_COLUMNS + ['card_number', 'ai_image_status', 'created_at', 'updated_at']
+
+# Vocabulary for plausible card text
+NAME_ADJECTIVES = ['Ancient', 'Blazing', 'Crimson', 'Silent', 'Verdant', 'Shattered', 'Gilded', 'Hollow', 'Storm', 'Eternal', 'Feral', 'Radiant']
+NAME_NOUNS = ['Wyrm', 'Sentinel', 'Oracle', 'Golem', 'Wanderer', 'Phoenix', 'Revenant', 'Colossus', 'Druid', 'Sphinx', 'Marauder', 'Seraph']
+NAME_PLACES = ['the Ashen Wastes', 'Moonfall', 'the Deep Grove', 'Ironspire', 'the Tidal Court', 'Emberhold']
+COLORS = {
+    'White': ('W', (235, 228, 205)),
+    'Blue': ('U', (70, 120, 190)),
+    'Black': ('B', (60, 55, 65)),
+    'Red': ('R', (195, 70, 55)),
+    'Green': ('G', (70, 140, 80)),
+    'Colorless': ('', (160, 160, 165)),
+}
+CARD_TYPES = [
+    'Creature — Elf Druid', 'Creature — Dragon', 'Creature — Human Soldier', 'Creature — Spirit',
+    'Instant', 'Sorcery', 'Enchantment', 'Artifact', 'Artifact Creature — Golem', 'Land',
+]
+ABILITIES = [
+    'Flying', 'Trample', 'Haste', 'Vigilance', 'Deathtouch', 'Lifelink',
+    'When this enters the battlefield, draw a card', 'Tap: Add one mana of any color',
+    'Other creatures you control get +1/+1', 'Destroy target artifact',
+]
+FLAVOR_TEXTS = [
+    'The old roads remember every traveler.', 'Even stone dreams of the sky.',
+    'It was the last light in the valley.', 'Hunger is patient; so is the forest.',
+]
+
+def synthetic_card(rng: random.Random, rarity: str) -> dict:
+    """One card in the shape the generator produces; omitted fields take standardize_card_data's defaults."""
+    color = rng.choice(list(COLORS))
+    card_type = rng.choice(CARD_TYPES)
+    card = {
+        'name': f"{rng.choice(NAME_ADJECTIVES)} {rng.choice(NAME_NOUNS)}" + (f" of {rng.choice(NAME_PLACES)}" if rng.random() < 0.3 else ''),
+        'manaCost': f"{{{rng.randint(0, 6)}}}" + f"{{{COLORS[color][0]}}}" * rng.randint(0, 2) if COLORS[color][0] else f"{{{rng.randint(1, 8)}}}",
+        'type': card_type,
+        'color': color,
+        'abilities': ', '.join(rng.sample(ABILITIES, rng.randint(1, 2))),
+        'rarity': rarity,
+    }
+    if rng.random() < 0.8:
+        card['flavorText'] = rng.choice(FLAVOR_TEXTS)
+    if 'Creature' in card_type:
+        card['powerToughness'] = f"{rng.randint(0, 8)}/{rng.randint(1, 8)}"
+    standardize_card_data(card)
+    return card
+
+def build_records(numbers: List[Tuple[str, int]], image_names: List[Optional[str]], seed: int, now: datetime) -> List[tuple]:
+    """COPY records for one chunk: a card per reserved (set name, card number), in COPY_COLUMNS order."""
+    rng = random.Random(seed)
+    rarities = rng.choices(list(DEFAULT_RARITY_PROBABILITIES), weights=list(DEFAULT_RARITY_PROBABILITIES.values()), k=len(numbers))
+    span_seconds = SEED_CREATED_SPAN_DAYS * 86400
+    records = []
+    for (set_name, card_number), rarity, image_name in zip(numbers, rarities, image_names, strict=True):
+        card = synthetic_card(rng, rarity)
+        created_at = now - timedelta(seconds=rng.randrange(span_seconds))
+        records.append((
+            card['name'], card['manaCost'], card['type'], card['color'], card['abilities'],
+            card.get('powerToughness', ''), card['flavorText'], card['rarity'], image_name, set_name,
+            card_number, 'PENDING', created_at, created_at,
+        ))
+    return records
+
+def render_placeholder(image_folder: str, index: int) -> str:
+    """Draw and store one numbered placeholder card image. Returns its blob name."""
+    color = list(COLORS)[index % len(COLORS)]
+    image = Image.new('RGB', PLACEHOLDER_SIZE, COLORS[color][1])
+    draw = ImageDraw.Draw(image)
+    width, height = PLACEHOLDER_SIZE
+    draw.rectangle((16, 16, width - 16, height - 16), outline=(20, 20, 20), width=8)
+    draw.rectangle((40, 90, width - 40, height // 2), fill=tuple(channel // 2 for channel in COLORS[color][1]))
+    draw.text((48, 44), f"Seed card #{index}", fill=(20, 20, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG')
+    return store_bytes(image_folder, buffer.getvalue(), '.png')
+
+def render_placeholder_range(image_folder: str, start: int, stop: int) -> List[str]:
+    return [render_placeholder(image_folder, index) for index in range(start, stop)]
+
+async def render_placeholders(executor: ProcessPoolExecutor, image_folder: str, count: int, jobs: int) -> List[str]:
+    """Render `count` distinct placeholder images, split into a few ranges per worker process."""
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    step = max(1, -(-count // (jobs * 4)))
+    ranges = await asyncio.gather(*(
+        loop.run_in_executor(executor, render_placeholder_range, image_folder, start, min(start + step, count))
+        for start in range(0, count, step)
+    ))
+    logger.info(f"Rendered {count} placeholder image(s) in {time.perf_counter() - started:.1f}s")
+    return [name for names in ranges for name in names]
+
+# The search indexes make up most of the cost of loading rows; rebuilding them once afterwards is far cheaper
+async def drop_search_indexes() -> None:
+    for name in SEARCH_INDEXES:
+        await db.status(db.text(f"DROP INDEX IF EXISTS {name}"))
+    logger.info("Dropped the search indexes for the load")
+
+async def create_search_indexes() -> None:
+    started = time.perf_counter()
+    for statement in SEARCH_INDEXES.values():
+        await db.status(db.text(statement))
+    logger.info(f"Rebuilt the search indexes in {time.perf_counter() - started:.1f}s")
+
+async def seed_cards(count: int, chunk_size: int = SEED_CHUNK_SIZE, jobs: int = 4, images: int = 0,
+                     image_folder: str = IMAGE_SAVE_PATH, defer_search_indexes: bool = False, seed: int = None) -> int:
+    """
+    Insert `count` synthetic cards with COPY, `jobs` chunks at a time. With `images`,
+    that many placeholder images are stored first and assigned to the cards in turn.
+    Returns the number of cards written.
+    """
+    loop = asyncio.get_running_loop()
+    seed = seed if seed is not None else random.randrange(2 ** 32)
+    now = datetime.utcnow()
+    copied = 0
+
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        image_names = await render_placeholders(executor, image_folder, images, jobs) if images else []
+
+        if defer_search_indexes:
+            await drop_search_indexes()
+        semaphore = asyncio.Semaphore(jobs)
+        started = time.perf_counter()
+
+        async def load_chunk(index: int) -> None:
+            nonlocal copied
+            first = index * chunk_size
+            size = min(chunk_size, count - first)
+            async with semaphore:
+                numbers = await reserve_card_numbers(size)
+                chunk_images = [image_names[(first + offset) % len(image_names)] for offset in range(size)] if image_names else [None] * size
+                records = await loop.run_in_executor(executor, build_records, numbers, chunk_images, seed + index, now)
+                async with db.acquire() as connection:
+                    await connection.raw_connection.copy_records_to_table('cards', records=records, columns=COPY_COLUMNS)
+            copied += size
+            elapsed = time.perf_counter() - started
+            logger.info(f"Copied {copied}/{count} cards ({copied / elapsed:,.0f} rows/s)")
+
+        try:
+            await asyncio.gather(*(load_chunk(index) for index in range(-(-count // chunk_size))))
+        finally:
+            if defer_search_indexes:
+                await create_search_indexes()
+
+    elapsed = time.perf_counter() - started
+    logger.info(f"Seeded {copied} cards in {elapsed:.1f}s ({copied / elapsed:,.0f} rows/s including index rebuilds)")
+    return copied
+
+async def main(args: argparse.Namespace) -> None:
+    settings = dict(pool_settings(), min_size=1, max_size=args.jobs + 1)
+    await db.set_bind(database_dsn(), **settings)
+    try:
+        await seed_cards(args.count, args.chunk_size, args.jobs, args.images, args.image_folder, args.defer_search_indexes, args.seed)
+    finally:
+        await db.pop_bind().close()
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Seed the cards table with synthetic cards for scale testing.')
+    parser.add_argument('--count', type=int, required=True, help='Number of cards to insert')
+    parser.add_argument('--chunk-size', type=int, default=SEED_CHUNK_SIZE, help='Cards per COPY statement')
+    parser.add_argument('--jobs', type=int, default=4, help='Worker processes and concurrent COPY connections')
+    parser.add_argument('--images', type=int, default=0, help='Distinct placeholder images to store and assign (0 for none)')
+    parser.add_argument('--image-folder', default=IMAGE_SAVE_PATH)
+    parser.add_argument('--defer-search-indexes', action='store_true', help='Drop the search GIN indexes during the load and rebuild them afterwards')
+    parser.add_argument('--seed', type=int, help='Seed for reproducible card text')
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    logging.basicConfig(format='%(asctime)s - %(levelname)s - %(message)s', level=logging.INFO)
+    asyncio.run(main(parse_args()))
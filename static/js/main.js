@@ -3,10 +3,12 @@ class CardManager {
         this.cardGrid = document.getElementById('card-grid');
         this.generateCardButton = document.getElementById('generate-card');
         this.openPackButton = document.getElementById('open-pack');
-        this.page = 1;
+        this.nextCursor = null;
+        this.hasMore = true;
         this.cardsPerPage = 20;
         this.isLoading = false;
         this.loadingSpinner = this.createLoadingSpinner();
+        this.detailObserver = this.createDetailObserver();
 
         this.verifyElements();
         this.initEvents();
@@ -41,6 +43,31 @@ class CardManager {
         return spinner;
     }
 
+    // Listing pages carry card summaries; abilities and flavor text load when a tile nears the viewport
+    createDetailObserver() {
+        if (!('IntersectionObserver' in window)) return null;
+        return new IntersectionObserver(entries => {
+            entries.forEach(entry => {
+                if (!entry.isIntersecting) return;
+                this.detailObserver.unobserve(entry.target);
+                this.loadCardText(entry.target);
+            });
+        }, { rootMargin: '200px' });
+    }
+
+    // Fills in a tile's card text from the full card
+    async loadCardText(cardElement) {
+        try {
+            const response = await fetch(`/api/cards/${cardElement.dataset.cardId}`);
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            const card = await response.json();
+            cardElement.querySelector('.card-abilities').textContent = card.abilities || '';
+            cardElement.querySelector('.card-flavor').textContent = card.flavor_text || '';
+        } catch (error) {
+            console.error(`Error loading card ${cardElement.dataset.cardId}:`, error);
+        }
+    }
+
     // Handles generating a new card
     async handleGenerateCard() {
         this.toggleLoading(true);
@@ -92,15 +119,17 @@ class CardManager {
 
     // Load cards via API
     async loadCards(append = false) {
-        if (this.isLoading) return;
+        if (this.isLoading || (append && !this.hasMore)) return;
         this.isLoading = true;
         this.toggleLoading(true);
 
         try {
-            const cards = await this.fetchCardsFromAPI();
+            if (!append) this.nextCursor = null;
+            const data = await this.fetchCardsFromAPI();
             if (!append) this.cardGrid.innerHTML = '';
-            cards.forEach(card => this.cardGrid.appendChild(this.createCardElement(card)));
-            this.page++;
+            data.cards.forEach(card => this.cardGrid.appendChild(this.createCardElement(card)));
+            this.nextCursor = data.next_cursor;
+            this.hasMore = Boolean(data.next_cursor);
         } catch (error) {
             console.error('Error loading cards:', error);
             alert(`Error loading cards: ${error.message}`);
@@ -110,15 +139,16 @@ class CardManager {
         }
     }
 
-    // Fetch cards from API with pagination
+    // Fetch cards from API with cursor pagination
     async fetchCardsFromAPI() {
-        const response = await fetch(`/api/cards?page=${this.page}&per_page=${this.cardsPerPage}`);
+        const params = new URLSearchParams({ per_page: this.cardsPerPage });
+        if (this.nextCursor) params.set('cursor', this.nextCursor);
+        const response = await fetch(`/api/cards?${params}`);
         if (!response.ok) {
             const errorData = await response.json();
             throw new Error(errorData.error || 'Failed to fetch cards');
         }
-        const data = await response.json();
-        return data.cards;
+        return await response.json();
     }
 
     // Toggle the loading spinner visibility
@@ -173,6 +203,8 @@ class CardManager {
         console.log('Card Image URL:', card.image_url); // Debugging
 
         const cardElement = document.createElement('div');
+        cardElement.dataset.cardId = card.id;
+        const hasText = card.abilities !== undefined;  // Full cards (new cards, packs) already carry their text
         const cardColor = this.determineCardColor(card.mana_cost);
         cardElement.className = 'mtg-card w-[250px] h-[350px] relative text-black rounded-[12px] shadow-lg overflow-hidden transition-transform duration-300 hover:scale-105';
         cardElement.style.background = `linear-gradient(165deg, ${cardColor} 60%, #171314)`;
@@ -183,11 +215,11 @@ class CardManager {
                     <h2 class="card-name text-sm font-bold text-shadow">${card.name}</h2>
                     <div class="mana-cost flex text-xs">${this.createManaSymbols(card.mana_cost)}</div>
                 </div>
-                <img src="${cardImageBaseUrl}${card.image_url || 'placeholder.png'}" alt="${card.name}" loading="lazy" class="w-full h-[140px] object-cover object-center rounded mb-1">
+                <img src="${cardImageBaseUrl}${card.image_url || 'placeholder.png'}?size=grid" alt="${card.name}" loading="lazy" class="w-full h-[140px] object-cover object-center rounded mb-1">
                 <div class="card-type bg-gradient-to-r from-gray-200 to-gray-100 p-1 text-xs border-b border-black border-opacity-20 mb-1">${card.card_type}</div>
                 <div class="card-text bg-gray-100 bg-opacity-90 p-2 rounded flex-grow overflow-y-auto text-xs leading-tight">
-                    <p>${card.abilities}</p>
-                    <p class="mt-1 italic">${card.flavor_text}</p>
+                    <p class="card-abilities">${hasText ? card.abilities : ''}</p>
+                    <p class="card-flavor mt-1 italic">${hasText ? card.flavor_text : ''}</p>
                 </div>
                 <div class="card-footer flex justify-between text-white text-xs mt-1">
                     <span>${card.rarity} (${card.set_name}-${card.card_number})</span>
@@ -198,6 +230,11 @@ class CardManager {
 
         cardElement.addEventListener('click', () => window.location.href = `/card/${card.id}`);
 
+        if (!hasText) {
+            if (this.detailObserver) this.detailObserver.observe(cardElement);
+            else this.loadCardText(cardElement);
+        }
+
         if (card.rarity === 'Rare' || card.rarity === 'Mythic Rare') {
             new MTGCard3DTiltEffect(cardElement);
         }
@@ -206,7 +243,7 @@ class CardManager {
     }
 
     async handleInfiniteScroll() {
-        if ((window.innerHeight + window.scrollY) >= document.body.offsetHeight - 500 && !this.isLoading) {
+        if ((window.innerHeight + window.scrollY) >= document.body.offsetHeight - 500 && !this.isLoading && this.hasMore) {
             this.loadCards(true);
         }
     }
@@ -728,6 +728,9 @@ document.addEventListener('DOMContentLoaded', () => {
                     aiGeneratedImage.src = `/uploads/${cardData.aiImage}`; // Adjust the path as per your setup
                     aiImagePreview.classList.remove('hidden');
                     saveAIImageStatus(requestId);
+                } else if (requestId) {
+                    // Generation runs in the background; wait for the status stream
+                    saveAIImageStatus(requestId);
                 } else {
                     alert('No image URLs returned.');
                 }
@@ -745,29 +748,62 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    // Poll AI Image Status
+    // Watch AI Image Status
+    function handleAIImageStatus(data) {
+        if (data.status === 'COMPLETED') {
+            if (data.image_urls && data.image_urls.length > 0) {
+                cardData.aiImage = data.image_urls[0];
+                aiGeneratedImage.src = `/card_image/${cardData.aiImage}`; // Stored locally by the backend
+                aiImagePreview.classList.remove('hidden');
+                alert('AI Generated Image has been received.');
+            } else {
+                alert('No image URLs returned.');
+            }
+            return true;
+        } else if (data.status === 'FAILED') {
+            alert(`Image generation failed: ${data.error || 'Unknown error.'}`);
+            return true;
+        }
+        // PENDING or IN_PROGRESS, keep waiting
+        return false;
+    }
+
     function saveAIImageStatus(requestId) {
+        if (!requestId) {
+            return;
+        }
+        if (!window.EventSource) {
+            pollAIImageStatus(requestId);
+            return;
+        }
+
+        // The server pushes each status once, so there is nothing to poll
+        const events = new EventSource(`/api/image_gen/request-events/${requestId}`);
+        let finished = false;
+        events.addEventListener('status', (event) => {
+            if (handleAIImageStatus(JSON.parse(event.data))) {
+                finished = true;
+                events.close();
+            }
+        });
+        events.onerror = () => {
+            events.close();
+            if (!finished) {
+                // Stream unavailable (e.g. a proxy that buffers); fall back to polling
+                pollAIImageStatus(requestId);
+            }
+        };
+    }
+
+    // Poll AI Image Status
+    function pollAIImageStatus(requestId) {
         const pollInterval = setInterval(async () => {
             try {
                 const response = await fetch(`/api/image_gen/request-status/${requestId}`);
                 const data = await response.json();
-
-                if (data.status === 'COMPLETED') {
-                    clearInterval(pollInterval);
-                    if (data.image_urls && data.image_urls.length > 0) {
-                        cardData.aiImage = data.image_urls[0];
-                        aiGeneratedImage.src = `/uploads/${cardData.aiImage}`; // Adjust the path as per your setup
-                        aiImagePreview.classList.remove('hidden');
-                        saveAIImageStatus(null); // Stop polling
-                        alert('AI Generated Image has been received.');
-                    } else {
-                        alert('No image URLs returned.');
-                    }
-                } else if (data.status === 'FAILED') {
+                if (handleAIImageStatus(data)) {
                     clearInterval(pollInterval);
-                    alert(`Image generation failed: ${data.error || 'Unknown error.'}`);
                 }
-                // If status is PENDING or IN_PROGRESS, continue polling
             } catch (error) {
                 console.error('Error polling AI image status:', error);
                 clearInterval(pollInterval);
@@ -0,0 +1,93 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import card_generator
+from card_generator import BATCH_REGENERATION_ATTEMPTS
+
+
+def card(name, rarity='Common'):
+    return {'name': name, 'manaCost': '{1}', 'type': 'Creature', 'color': 'Red', 'abilities': 'Haste', 'flavorText': 'Fast.', 'rarity': rarity}
+
+
+class FakeCompletions:
+    """Stands in for chat.completions.with_raw_response, answering with queued message contents."""
+
+    def __init__(self, contents):
+        self.contents = list(contents)
+        self.prompts = []
+
+    async def create(self, **kwargs):
+        self.prompts.append(kwargs['messages'][0]['content'])
+        message = SimpleNamespace(content=self.contents.pop(0))
+        response = SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        return SimpleNamespace(headers={}, parse=lambda: response)
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    """Queue completion contents with completions.contents; prompts sent are in completions.prompts."""
+    fake = FakeCompletions([])
+    client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(with_raw_response=fake)))
+    monkeypatch.setattr(card_generator, 'get_async_openai_client', lambda: client)
+
+    async def reserve_card_numbers(count):
+        return [('TST', number) for number in range(1, count + 1)]
+
+    monkeypatch.setattr(card_generator, 'reserve_card_numbers', reserve_card_numbers)
+    return fake
+
+
+def test_wrapping_object_is_unwrapped_and_slot_decides_rarity(completions):
+    completions.contents.append(json.dumps({'cards': [card('Ember Imp', 'Rare'), card('Tide Sprite')]}))
+    cards = asyncio.run(card_generator.request_card_batch_async(['Common', 'Mythic Rare']))
+    assert [card_data['name'] for card_data in cards] == ['Ember Imp', 'Tide Sprite']
+    assert [card_data['rarity'] for card_data in cards] == ['Common', 'Mythic Rare']
+
+
+def test_short_array_leaves_missing_slots_empty(completions):
+    completions.contents.append(json.dumps([card('Only One')]))
+    cards = asyncio.run(card_generator.request_card_batch_async(['Common', 'Uncommon', 'Rare']))
+    assert cards[0]['name'] == 'Only One'
+    assert cards[1:] == [None, None]
+
+
+def test_long_array_is_cut_to_the_requested_slots(completions):
+    completions.contents.append(json.dumps([card('First'), card('Second'), card('Extra')]))
+    cards = asyncio.run(card_generator.request_card_batch_async(['Common', 'Common']))
+    assert [card_data['name'] for card_data in cards] == ['First', 'Second']
+
+
+@pytest.mark.parametrize('content', ['not json', json.dumps({'name': 'A lone card', 'type': 'Land'})])
+def test_unusable_response_marks_every_slot_malformed(completions, content):
+    completions.contents.append(content)
+    assert asyncio.run(card_generator.request_card_batch_async(['Common', 'Rare'])) == [None, None]
+
+
+def test_only_malformed_elements_are_requested_again(completions):
+    malformed = {'manaCost': '{2}', 'color': 'Blue'}  # No name, type or abilities
+    completions.contents.append(json.dumps([card('Kept'), malformed, card('Also Kept')]))
+    completions.contents.append(json.dumps([card('Regenerated')]))
+
+    cards = asyncio.run(card_generator.generate_cards_batch_async(['Common', 'Rare', 'Uncommon']))
+
+    assert [card_data['name'] for card_data in cards] == ['Kept', 'Regenerated', 'Also Kept']
+    assert [card_data['rarity'] for card_data in cards] == ['Common', 'Rare', 'Uncommon']
+    assert [(card_data['set_name'], card_data['card_number']) for card_data in cards] == [('TST', 1), ('TST', 2), ('TST', 3)]
+    assert len(completions.prompts) == 2
+    assert 'Create 1 distinct cards' in completions.prompts[1]
+    assert '1. Rare\n' in completions.prompts[1]
+
+
+def test_fallback_card_after_regeneration_attempts_run_out(completions):
+    completions.contents.append(json.dumps([card('Good'), 'not an object']))
+    completions.contents.extend(['[]'] * BATCH_REGENERATION_ATTEMPTS)
+
+    cards = asyncio.run(card_generator.generate_cards_batch_async(['Common', 'Mythic Rare']))
+
+    assert len(completions.prompts) == 1 + BATCH_REGENERATION_ATTEMPTS
+    assert cards[0]['name'] == 'Good'
+    fallback = card_generator.generate_fallback_card('Mythic Rare')
+    assert cards[1] == dict(fallback, set_name='TST', card_number=2)
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+import orjson
+
+from card_json import CARD_SUMMARY_FIELDS, card_summaries, dumps
+
+
+def test_summary_fields_are_plain_strings():
+    assert all(type(field) is str for field in CARD_SUMMARY_FIELDS)
+    assert 'abilities' not in CARD_SUMMARY_FIELDS
+    assert 'flavor_text' not in CARD_SUMMARY_FIELDS
+
+
+def test_card_summaries_key_rows_by_field():
+    row = tuple(range(len(CARD_SUMMARY_FIELDS)))
+    summaries = card_summaries([row, row])
+    assert summaries == [dict(zip(CARD_SUMMARY_FIELDS, row, strict=True))] * 2
+
+
+def test_dumps_matches_isoformat_for_naive_datetimes():
+    updated_at = datetime(2026, 10, 17, 12, 30, 45, 123456)
+    body = dumps({'cards': card_summaries([]), 'updated_at': updated_at})
+    assert isinstance(body, bytes)
+    assert orjson.loads(body) == {'cards': [], 'updated_at': updated_at.isoformat()}
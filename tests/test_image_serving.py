@@ -0,0 +1,43 @@
+import asyncio
+import os
+from pathlib import Path
+
+from quart import Quart
+
+from image_serving import image_etag, serve_image_file
+from image_store import stat_image
+
+
+def test_cache_hit_serves_image_without_stat(tmp_path, monkeypatch):
+    path = str(tmp_path / 'card.png')
+    with open(path, 'wb') as image_file:
+        image_file.write(b'\x89PNG\r\n\x1a\n' + b'x' * 100)
+    stat_image(path)  # Warm the metadata cache
+
+    stat_calls = []
+    real_os_stat, real_path_stat = os.stat, Path.stat
+
+    def os_stat(target, *args, **kwargs):
+        stat_calls.append(str(target))
+        return real_os_stat(target, *args, **kwargs)
+
+    def path_stat(self, *args, **kwargs):
+        stat_calls.append(str(self))
+        return real_path_stat(self, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'stat', os_stat)
+    monkeypatch.setattr(Path, 'stat', path_stat)
+
+    async def serve():
+        app = Quart(__name__)
+        async with app.test_request_context('/images/card.png'):
+            info = stat_image(path)
+            response = await serve_image_file(path, info, str(tmp_path), image_etag(info), immutable=False)
+            body = await response.get_data()
+        return response, info, body
+
+    response, info, body = asyncio.run(serve())
+    assert path not in stat_calls
+    assert response.status_code == 200
+    assert response.content_length == info.size == 108
+    assert body.startswith(b'\x89PNG')
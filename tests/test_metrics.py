@@ -0,0 +1,46 @@
+from metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_counter_renders_labelled_series():
+    counter = Counter('demo_total', 'Demo counter.', ('kind',))
+    counter.inc(1, 'a')
+    counter.inc(2, 'a')
+    counter.inc(1, 'quote"d')
+    assert counter.render() == [
+        '# HELP demo_total Demo counter.',
+        '# TYPE demo_total counter',
+        'demo_total{kind="a"} 3',
+        'demo_total{kind="quote\\"d"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('demo_seconds', 'Demo histogram.', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, '/x')
+    lines = histogram.render()[2:]
+    assert lines == [
+        'demo_seconds_bucket{route="/x",le="0.1"} 1',
+        'demo_seconds_bucket{route="/x",le="1.0"} 3',
+        'demo_seconds_bucket{route="/x",le="+Inf"} 4',
+        'demo_seconds_sum{route="/x"} 6.05',
+        'demo_seconds_count{route="/x"} 4',
+    ]
+
+
+def test_gauge_callback_failure_renders_no_samples():
+    def broken():
+        raise RuntimeError('pool gone')
+
+    gauge = Gauge('demo_gauge', 'Demo gauge.', callback=broken)
+    assert gauge.render() == ['# HELP demo_gauge Demo gauge.', '# TYPE demo_gauge gauge']
+
+
+def test_registry_renders_every_metric():
+    registry = Registry()
+    registry.register(Counter('one_total', 'One.')).inc()
+    registry.register(Gauge('two', 'Two.')).set(2.5)
+    text = registry.render()
+    assert 'one_total 1\n' in text
+    assert 'two 2.5\n' in text
+    assert text.endswith('\n')
@@ -0,0 +1,34 @@
+import pytest
+
+from pagination import (
+    DEFAULT_PER_PAGE,
+    MAX_PER_PAGE,
+    clamp_per_page,
+    decode_cursor,
+    encode_cursor,
+)
+
+
+def test_cursor_round_trip():
+    position = {'id': 1234, 'created_at': '2026-10-17T12:00:00'}
+    cursor = encode_cursor(position)
+    assert '=' not in cursor  # Padding is stripped so cursors are URL-safe as they are
+    assert decode_cursor(cursor) == position
+
+
+@pytest.mark.parametrize('cursor', ['not-base64!', encode_cursor({'id': 1})[:-3], 'WzEsMl0'])
+def test_invalid_cursor_raises_value_error(cursor):
+    # 'WzEsMl0' decodes to the JSON array [1,2], which is not a cursor object
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+@pytest.mark.parametrize('per_page, expected', [
+    (0, DEFAULT_PER_PAGE),
+    (None, DEFAULT_PER_PAGE),
+    (-5, 1),
+    (50, 50),
+    (10_000, MAX_PER_PAGE),
+])
+def test_clamp_per_page(per_page, expected):
+    assert clamp_per_page(per_page) == expected
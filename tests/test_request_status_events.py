@@ -0,0 +1,58 @@
+import asyncio
+
+from job_events import JobEventHub
+from routes import image_gen
+
+
+def collect(request_id, limit=10):
+    async def run():
+        events = []
+        async for event in image_gen.request_status_events(request_id):
+            events.append(event)
+            if len(events) >= limit:
+                break
+        return events
+    return asyncio.run(run())
+
+
+def test_job_finished_in_another_worker_reaches_subscriber(monkeypatch):
+    # This worker's hub never sees the events: the job runs in the other worker,
+    # which only updates the database
+    monkeypatch.setattr(image_gen, 'job_events', JobEventHub())
+    monkeypatch.setattr(image_gen, 'JOB_EVENTS_HEARTBEAT', 0.01)
+    statuses = iter([
+        {'status': 'IN_PROGRESS', 'image_urls': []},
+        {'status': 'IN_PROGRESS', 'image_urls': []},
+        {'status': 'COMPLETED', 'image_urls': ['abc.png']},
+    ])
+
+    async def get_request_status(_request_id):
+        return next(statuses)
+
+    monkeypatch.setattr(image_gen, 'get_request_status', get_request_status)
+
+    events = collect('req-1')
+    assert events[0]['status'] == 'IN_PROGRESS'
+    assert events[1] is None  # Keep-alive while the status is unchanged
+    assert events[-1] == {'status': 'COMPLETED', 'image_urls': ['abc.png'], 'request_id': 'req-1'}
+
+
+def test_event_from_local_hub_is_delivered(monkeypatch):
+    hub = JobEventHub()
+    monkeypatch.setattr(image_gen, 'job_events', hub)
+
+    async def get_request_status(_request_id):
+        return {'status': 'IN_PROGRESS', 'image_urls': []}
+
+    monkeypatch.setattr(image_gen, 'get_request_status', get_request_status)
+
+    async def run():
+        events = []
+        async for event in image_gen.request_status_events('req-2'):
+            events.append(event)
+            if event['status'] == 'IN_PROGRESS':
+                hub.dispatch({'status': 'FAILED', 'error': 'boom', 'request_id': 'req-2'})
+        return events
+
+    events = asyncio.run(run())
+    assert [event['status'] for event in events] == ['IN_PROGRESS', 'FAILED']
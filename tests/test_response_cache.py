@@ -0,0 +1,59 @@
+import asyncio
+from datetime import datetime, timezone
+
+from response_cache import (
+    LRUCache,
+    ResponseCache,
+    build_entry,
+    decode_entry,
+    encode_entry,
+)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(maxsize=2, ttl=60)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    assert cache.get('a') == 1  # 'b' is now the least recently used
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert (cache.hits, cache.misses) == (3, 1)
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(maxsize=10, ttl=-1)  # Every entry is already past its TTL
+    cache.set('a', 1)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_build_entry_etag_follows_body():
+    first = build_entry(b'{"cards":[]}', 'application/json')
+    assert build_entry(b'{"cards":[]}', 'application/json').etag == first.etag
+    assert build_entry(b'{"cards":[1]}', 'application/json').etag != first.etag
+
+
+def test_build_entry_treats_naive_timestamps_as_utc():
+    entry = build_entry(b'x', 'text/plain', datetime(2026, 10, 17, 12, 0))
+    assert entry.last_modified == datetime(2026, 10, 17, 12, 0, tzinfo=timezone.utc)
+
+
+def test_entry_survives_encoding_for_redis():
+    entry = build_entry(b'\x00binary body', 'application/json', datetime(2026, 10, 17, 12, 0))
+    assert decode_entry(encode_entry(entry)) == entry
+
+
+def test_invalidate_drops_cached_responses():
+    async def run():
+        cache = ResponseCache(maxsize=10, ttl=60, redis_url=None)
+        entry = build_entry(b'page', 'text/html')
+        await cache.set('cards:1', entry)
+        assert await cache.get('cards:1') == entry
+        await cache.invalidate()
+        return await cache.get('cards:1'), cache.stats()
+
+    entry, stats = asyncio.run(run())
+    assert entry is None
+    assert stats['generation'] == 1
+    assert stats['entries'] == 0
@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+import pytest
+
+from upstream_limits import (
+    CircuitBreaker,
+    CircuitOpenError,
+    UpstreamLimits,
+    parse_duration,
+)
+
+
+def open_breaker(reset_timeout=30.0):
+    breaker = CircuitBreaker('demo', failure_threshold=2, reset_timeout=reset_timeout)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_circuit_opens_after_consecutive_failures():
+    breaker = CircuitBreaker('demo', failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.before_call()
+    assert 0 < raised.value.retry_in <= 30
+
+
+def test_success_resets_failure_count():
+    breaker = CircuitBreaker('demo', failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+
+
+def test_half_open_lets_one_trial_through():
+    breaker = open_breaker(reset_timeout=0)
+    assert breaker.state == 'half-open'
+    assert breaker.before_call() is True
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()  # Only one trial at a time
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.before_call() is False
+
+
+def test_failed_trial_reopens_circuit():
+    breaker = open_breaker(reset_timeout=0)
+    breaker.before_call()
+    breaker.reset_timeout = 30
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert breaker.trial_in_flight is False
+
+
+def test_trial_cancelled_while_waiting_for_budget_is_released():
+    limits = UpstreamLimits(rate_limits={}, redis_url=None)
+    breaker = limits.breakers['demo'] = open_breaker()
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout  # Due for a trial
+
+    async def slow_acquire(*_args):
+        await asyncio.sleep(10)
+
+    limits.acquire = slow_acquire
+
+    async def run():
+        task = asyncio.ensure_future(limits.call('demo', 'model').__aenter__())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(run())
+    assert breaker.trial_in_flight is False
+    assert breaker.before_call() is True  # The next caller gets the trial
+
+
+@pytest.mark.parametrize('value, seconds', [('1s', 1), ('6m0s', 360), ('20ms', 0.02), ('2.5', 2.5)])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == pytest.approx(seconds)
+
+
+@pytest.mark.parametrize('value', ['', None, 'soon'])
+def test_parse_duration_rejects_unknown_values(value):
+    assert parse_duration(value) is None
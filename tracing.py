@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import functools
+from contextlib import contextmanager, suppress
+from contextvars import ContextVar
+from typing import Dict, Any, List, Optional
+
+logger = logging.getLogger(__name__)
+slow_request_logger = logging.getLogger('slow_requests')
+
+# Tracing settings
+TRACE_ENABLED = os.getenv('TRACE_ENABLED', 'true').lower() == 'true'
+TRACE_SLOW_REQUEST_MS = float(os.getenv('TRACE_SLOW_REQUEST_MS', 2000))  # Requests slower than this log their span tree
+TRACE_SLOW_JOB_MS = float(os.getenv('TRACE_SLOW_JOB_MS', 60000))  # The same for background jobs such as image generation
+TRACE_SLOW_LOG_FILE = os.getenv('TRACE_SLOW_LOG_FILE')  # Optional file for the slow-request log
+TRACE_SAMPLE_RATE = float(os.getenv('TRACE_SAMPLE_RATE', 0.1))  # Share of normal traces exported; slow ones always are
+TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE')  # OTLP/JSON, one export request per line
+TRACE_OTLP_ENDPOINT = os.getenv('TRACE_OTLP_ENDPOINT')  # e.g. http://localhost:4318 for an OpenTelemetry collector
+TRACE_EXPORT_INTERVAL = float(os.getenv('TRACE_EXPORT_INTERVAL', 5))
+TRACE_MAX_SPANS = 2000  # Spans kept per trace, so a runaway loop cannot grow one without bound
+SERVICE_NAME = os.getenv('SERVICE_NAME', 'aitradingcards')
+
+# OTLP span kinds and status codes
+SPAN_KINDS = {'internal': 1, 'server': 2, 'client': 3, 'producer': 4, 'consumer': 5}
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar('current_span', default=None)
+
+if TRACE_SLOW_LOG_FILE:
+    slow_request_logger.addHandler(logging.FileHandler(TRACE_SLOW_LOG_FILE))
+
+class Trace:
+    """All spans of one request or background job."""
+
+    def __init__(self, slow_ms: float):
+        self.trace_id = f"{random.getrandbits(128):032x}"
+        self.slow_ms = slow_ms
+        self.spans: List["Span"] = []
+
+class Span:
+    def __init__(self, name: str, trace: Trace, parent: Optional["Span"], kind: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.trace = trace
+        self.parent = parent
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.kind = kind
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        self._token = None
+        if len(trace.spans) < TRACE_MAX_SPANS:
+            trace.spans.append(self)
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent.span_id if self.parent else '',
+            'name': self.name,
+            'kind': SPAN_KINDS.get(self.kind, 1),
+            'startTimeUnixNano': str(self.start_ns),
+            'endTimeUnixNano': str(self.end_ns or self.start_ns),
+            'attributes': [otlp_attribute(key, value) for key, value in self.attributes.items()],
+            'status': {'code': STATUS_ERROR, 'message': self.error} if self.error else {'code': STATUS_OK},
+        }
+        return span
+
+def otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+# Recording spans
+def start_trace(name: str, kind: str = 'server', slow_ms: float = TRACE_SLOW_REQUEST_MS, **attributes) -> Optional[Span]:
+    """Start the root span of a new trace and make it current. Its tree is logged if it takes `slow_ms` or longer."""
+    if not TRACE_ENABLED:
+        return None
+    root = Span(name, Trace(slow_ms), None, kind, attributes)
+    root._token = _current_span.set(root)
+    return root
+
+def start_span(name: str, kind: str = 'internal', **attributes) -> Optional[Span]:
+    """Start a child of the current span and make it current. No-op (None) outside a trace."""
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    child = Span(name, parent.trace, parent, kind, attributes)
+    child._token = _current_span.set(child)
+    return child
+
+def end_span(span: Optional[Span], error: BaseException = None) -> None:
+    if span is None:
+        return
+    span.end_ns = time.time_ns()
+    if error is not None:
+        span.error = f"{type(error).__name__}: {error}"
+    if span._token is not None:
+        # Ended from another task's context (ValueError): the current span there is left alone
+        with suppress(ValueError):
+            _current_span.reset(span._token)
+        span._token = None
+    if span.parent is None:
+        finish_trace(span)
+
+@contextmanager
+def span(name: str, kind: str = 'internal', **attributes):
+    """Record the enclosed block as a child span of the current one."""
+    current = start_span(name, kind, **attributes)
+    try:
+        yield current
+    except BaseException as e:
+        end_span(current, e)
+        raise
+    else:
+        end_span(current)
+
+def traced(name: str = None):
+    """Decorator recording each call of a coroutine function as a span."""
+    def decorator(function):
+        @functools.wraps(function)
+        async def wrapper(*args, **kwargs):
+            with span(name or function.__name__):
+                return await function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def record_span(name: str, duration: float, kind: str = 'client', **attributes) -> None:
+    """Add an already finished child span (e.g. a query timed by the driver) ending now."""
+    parent = _current_span.get()
+    if parent is None:
+        return
+    child = Span(name, parent.trace, parent, kind, attributes)
+    child.end_ns = time.time_ns()
+    child.start_ns = child.end_ns - int(duration * 1e9)
+
+# Finished traces
+def finish_trace(root: Span) -> None:
+    slow = root.duration_ms >= root.trace.slow_ms
+    if slow:
+        slow_request_logger.warning(
+            f"Slow {'request' if root.kind == 'server' else 'job'} {root.name} took {root.duration_ms:.0f} ms (trace {root.trace.trace_id})\n{format_span_tree(root)}"
+        )
+    if exporter.enabled and (slow or random.random() < TRACE_SAMPLE_RATE):
+        exporter.add(root.trace)
+
+def format_span_tree(root: Span) -> str:
+    """Indented span tree with each span's offset from the start of the request and its duration."""
+    children: Dict[str, List[Span]] = {}
+    for item in root.trace.spans:
+        if item.parent is not None:
+            children.setdefault(item.parent.span_id, []).append(item)
+
+    lines = []
+    def walk(item: Span, depth: int) -> None:
+        offset_ms = (item.start_ns - root.start_ns) / 1e6
+        attributes = ' '.join(f"{key}={value}" for key, value in item.attributes.items())
+        error = f" ERROR {item.error}" if item.error else ''
+        lines.append(f"{'  ' * depth}{item.name} +{offset_ms:.0f}ms {item.duration_ms:.1f}ms {attributes}{error}".rstrip())
+        for child in sorted(children.get(item.span_id, []), key=lambda child: child.start_ns):
+            walk(child, depth + 1)
+    walk(root, 0)
+    return '\n'.join(lines)
+
+class TraceExporter:
+    """Buffers finished traces and periodically writes them as OTLP/JSON to a file and/or a collector."""
+
+    def __init__(self, file_path: Optional[str] = TRACE_EXPORT_FILE, endpoint: Optional[str] = TRACE_OTLP_ENDPOINT):
+        self.file_path = file_path
+        self.endpoint = endpoint.rstrip('/') + '/v1/traces' if endpoint else None
+        self.pending: List[Trace] = []
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.file_path or self.endpoint)
+
+    def add(self, trace: Trace) -> None:
+        self.pending.append(trace)
+
+    def build_request(self, traces: List[Trace]) -> Dict[str, Any]:
+        return {
+            'resourceSpans': [{
+                'resource': {'attributes': [otlp_attribute('service.name', SERVICE_NAME)]},
+                'scopeSpans': [{
+                    'scope': {'name': 'aitradingcards.tracing'},
+                    'spans': [item.to_otlp() for trace in traces for item in trace.spans if item.end_ns is not None],
+                }],
+            }]
+        }
+
+    async def flush(self) -> None:
+        if not self.pending:
+            return
+        traces, self.pending = self.pending, []
+        payload = json.dumps(self.build_request(traces))
+        if self.file_path:
+            await asyncio.to_thread(self._append, payload)
+        if self.endpoint:
+            from http_client import get_http_client
+            try:
+                response = await get_http_client().post(self.endpoint, content=payload, headers={'Content-Type': 'application/json'})
+                response.raise_for_status()
+            except Exception as e:
+                logger.warning(f"Exporting {len(traces)} trace(s) to {self.endpoint} failed: {e}")
+
+    def _append(self, payload: str) -> None:
+        with open(self.file_path, 'a', encoding='utf-8') as export_file:
+            export_file.write(payload + '\n')
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(TRACE_EXPORT_INTERVAL)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"Trace export failed: {e}")
+
+    def start(self) -> None:
+        if self.enabled and self.task is None:
+            self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        await self.flush()
+
+exporter = TraceExporter()
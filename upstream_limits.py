@@ -0,0 +1,335 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, Optional, Tuple, Mapping
+
+from metrics import upstream_call_duration, upstream_errors
+from tracing import span, start_span, end_span
+
+logger = logging.getLogger(__name__)
+
+# Client-side budgets per upstream and model: (requests per minute, tokens per minute). 0 disables a limit.
+UPSTREAM_RATE_LIMITS: Dict[Tuple[str, str], Tuple[int, int]] = {
+    ('openai_chat', 'gpt-4'): (int(os.getenv('OPENAI_CHAT_RPM', 500)), int(os.getenv('OPENAI_CHAT_TPM', 30000))),
+    ('openai_images', 'dall-e-3'): (int(os.getenv('OPENAI_IMAGES_RPM', 7)), 0),
+    ('fal', 'fal-ai/flux/dev'): (int(os.getenv('FAL_RPM', 60)), 0),
+}
+UPSTREAM_LIMITER_REDIS_URL = os.getenv('UPSTREAM_LIMITER_REDIS_URL')  # Optional; shares budgets across workers
+
+# Circuit breaker settings
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))  # Consecutive failures that open the circuit
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', 30))  # Seconds before a trial call is let through
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+# Atomic token bucket. Tokens may go negative: a caller reserves its share and sleeps
+# for the returned number of seconds, so waiters are served in arrival order.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local amount = tonumber(ARGV[4])
+local paused_until = tonumber(redis.call('HGET', KEYS[1], 'paused_until') or 0)
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens') or capacity)
+local updated = tonumber(redis.call('HGET', KEYS[1], 'updated') or now)
+tokens = math.min(capacity, tokens + math.max(now - updated, 0) * rate) - amount
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], 300)
+local wait = 0
+if tokens < 0 then wait = -tokens / rate end
+return tostring(math.max(wait, paused_until - now))
+"""
+
+# Pushes a bucket's shared pause out, never back, in one atomic step
+PAUSE_SCRIPT = """
+local paused_until = tonumber(ARGV[1])
+local current = tonumber(redis.call('HGET', KEYS[1], 'paused_until') or 0)
+if paused_until > current then
+    redis.call('HSET', KEYS[1], 'paused_until', paused_until)
+    redis.call('EXPIRE', KEYS[1], 300)
+end
+return 0
+"""
+
+class CircuitOpenError(RuntimeError):
+    """Raised instead of calling an upstream that is failing; `retry_in` is the remaining cooldown."""
+
+    def __init__(self, upstream: str, retry_in: float):
+        super().__init__(f"Circuit for {upstream} is open, retry in {retry_in:.0f}s")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+def estimate_tokens(prompt: str, max_tokens: int) -> int:
+    """Rough token cost of a completion: about four characters per prompt token, plus the completion budget."""
+    return len(prompt) // 4 + max_tokens
+
+def parse_duration(value: Optional[str]) -> Optional[float]:
+    """Seconds in a rate-limit reset value such as '1s', '6m0s', '20ms' or '2.5'."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds requested by a Retry-After (or retry-after-ms) header, in either of its formats."""
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    seconds = parse_duration(value)
+    if seconds is not None:
+        return seconds
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """
+    Token bucket refilling `limit` tokens per minute.
+    Buckets are kept in Redis when a client is given, so every worker draws
+    from one budget; otherwise the bucket is local to this process.
+    """
+
+    def __init__(self, name: str, limit: int, redis_client=None):
+        self.name = name
+        self.redis = redis_client
+        self.set_limit(limit)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def set_limit(self, limit: int) -> None:
+        self.limit = limit
+        self.capacity = max(limit, 1)
+        self.rate = self.capacity / 60.0
+
+    async def reserve(self, amount: float) -> float:
+        """Take `amount` tokens and return how many seconds to wait before using them."""
+        amount = min(amount, self.capacity)  # A single oversized call waits for a full bucket, not forever
+        if self.redis is not None:
+            try:
+                wait = await self.redis.eval(TOKEN_BUCKET_SCRIPT, 1, f"upstream_limits:{self.name}", self.capacity, self.rate, time.time(), amount)
+                return float(wait)
+            except Exception as e:
+                logger.warning(f"Shared rate limiter unavailable for {self.name}, using local budget: {e}")
+
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate) - amount
+        self.updated = now
+        wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        return max(wait, self.paused_until - now)
+
+    async def pause(self, seconds: float) -> None:
+        """Hold back every caller of this bucket for `seconds`, e.g. after a 429."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        if self.redis is not None:
+            try:
+                await self.redis.eval(PAUSE_SCRIPT, 1, f"upstream_limits:{self.name}", time.time() + seconds)
+            except Exception as e:
+                logger.warning(f"Could not share pause of {self.name}: {e}")
+
+class CircuitBreaker:
+    """
+    Per-upstream circuit breaker. After CIRCUIT_FAILURE_THRESHOLD consecutive
+    failures the circuit opens and calls fail fast with CircuitOpenError; after
+    CIRCUIT_RESET_TIMEOUT one trial call is let through (half-open) and its
+    outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, upstream: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.upstream = upstream
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError if the call may not go through; returns True when it is the half-open trial."""
+        state = self.state
+        if state == 'open' or (state == 'half-open' and self.trial_in_flight):
+            retry_in = max(self.reset_timeout - (time.monotonic() - self.opened_at), 0)
+            raise CircuitOpenError(self.upstream, retry_in)
+        if state == 'half-open':
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def release_trial(self) -> None:
+        """Give up a trial call that never reached the upstream, so the next caller can make it."""
+        self.trial_in_flight = False
+
+    def record_success(self) -> None:
+        if self.opened_at is not None:
+            logger.info(f"Circuit for {self.upstream} closed")
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            if self.opened_at is None:
+                logger.warning(f"Circuit for {self.upstream} opened after {self.failures} consecutive failures")
+            self.opened_at = time.monotonic()
+
+class UpstreamCall:
+    """
+    One guarded upstream call: `async with limits.call(upstream, model, tokens) as call:`.
+    Entering checks the circuit and waits for the rate budget; exiting records
+    the outcome. Pass response headers to observe() so the budget follows the upstream's own.
+    """
+
+    def __init__(self, limits: "UpstreamLimits", upstream: str, model: str, tokens: int):
+        self.limits = limits
+        self.upstream = upstream
+        self.model = model
+        self.tokens = tokens
+
+    async def __aenter__(self) -> "UpstreamCall":
+        breaker = self.limits.breaker(self.upstream)
+        trial = breaker.before_call()
+        try:
+            with span('upstream.rate_limit_wait', upstream=self.upstream, tokens=self.tokens):
+                await self.limits.acquire(self.upstream, self.model, self.tokens)
+        except BaseException:
+            # Cancelled or failed while waiting for the budget: the trial, if this was one, never happened
+            if trial:
+                breaker.release_trial()
+            raise
+        self.started = time.perf_counter()  # Latency excludes time spent waiting for the rate budget
+        self.span = start_span(f"upstream.{self.upstream}", kind='client', model=self.model)
+        return self
+
+    async def __aexit__(self, exc_type, exc, traceback) -> bool:
+        breaker = self.limits.breaker(self.upstream)
+        upstream_call_duration.observe(time.perf_counter() - self.started, self.upstream, 'ok' if exc is None else 'error')
+        end_span(self.span, exc)
+        if exc is None:
+            breaker.record_success()
+            return False
+        upstream_errors.inc(1, self.upstream, type(exc).__name__)
+
+        response = getattr(exc, 'response', None)
+        status_code = getattr(response, 'status_code', None)
+        if response is not None and getattr(response, 'headers', None) is not None:
+            await self.observe(response.headers, status_code)
+        # Client errors other than 429 say nothing about the upstream's health
+        if status_code is None or status_code == 429 or status_code >= 500:
+            breaker.record_failure()
+        return False
+
+    async def observe(self, headers: Mapping[str, str], status_code: int = None) -> None:
+        await self.limits.observe(self.upstream, self.model, headers, status_code)
+
+class UpstreamLimits:
+    """Rate budgets and circuit breakers for every upstream the app calls."""
+
+    def __init__(self, rate_limits: Dict[Tuple[str, str], Tuple[int, int]] = UPSTREAM_RATE_LIMITS, redis_url: Optional[str] = UPSTREAM_LIMITER_REDIS_URL):
+        self.rate_limits = rate_limits
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._redis = None
+        if redis_url:
+            import redis.asyncio as redis  # Optional dependency, only needed to share budgets
+            self._redis = redis.from_url(redis_url)
+
+    def bucket(self, upstream: str, model: str, kind: str) -> Optional[TokenBucket]:
+        """The requests ('rpm') or tokens ('tpm') bucket of a model, or None if that limit is disabled."""
+        name = f"{upstream}:{model}:{kind}"
+        bucket = self.buckets.get(name)
+        if bucket is None:
+            rpm, tpm = self.rate_limits.get((upstream, model), (0, 0))
+            limit = rpm if kind == 'rpm' else tpm
+            if not limit:
+                return None
+            bucket = self.buckets[name] = TokenBucket(name, limit, self._redis)
+        return bucket
+
+    def breaker(self, upstream: str) -> CircuitBreaker:
+        breaker = self.breakers.get(upstream)
+        if breaker is None:
+            breaker = self.breakers[upstream] = CircuitBreaker(upstream)
+        return breaker
+
+    def call(self, upstream: str, model: str, tokens: int = 0) -> UpstreamCall:
+        return UpstreamCall(self, upstream, model, tokens)
+
+    async def acquire(self, upstream: str, model: str, tokens: int = 0) -> None:
+        """Wait until one request and `tokens` tokens fit in the model's budget."""
+        wait = 0.0
+        requests_bucket = self.bucket(upstream, model, 'rpm')
+        if requests_bucket is not None:
+            wait = max(wait, await requests_bucket.reserve(1))
+        tokens_bucket = self.bucket(upstream, model, 'tpm')
+        if tokens_bucket is not None and tokens:
+            wait = max(wait, await tokens_bucket.reserve(tokens))
+        if wait > 0:
+            logger.debug(f"Rate limiting {upstream}/{model} for {wait:.2f}s")
+            await asyncio.sleep(wait)
+
+    async def observe(self, upstream: str, model: str, headers: Mapping[str, str], status_code: int = None) -> None:
+        """
+        Adjust the budget from the upstream's response headers: honour Retry-After,
+        pause a bucket whose x-ratelimit-remaining-* hit zero until its reset, and
+        follow the x-ratelimit-limit-* the upstream actually grants.
+        """
+        retry_after = parse_retry_after(headers)
+        if retry_after is None and status_code == 429:
+            retry_after = 1.0
+        if retry_after:
+            for kind in ('rpm', 'tpm'):
+                bucket = self.bucket(upstream, model, kind)
+                if bucket is not None:
+                    await bucket.pause(retry_after)
+            logger.warning(f"{upstream}/{model} asked to back off for {retry_after:.1f}s")
+
+        for kind, suffix in (('rpm', 'requests'), ('tpm', 'tokens')):
+            bucket = self.bucket(upstream, model, kind)
+            if bucket is None:
+                continue
+            try:
+                limit = int(headers.get(f'x-ratelimit-limit-{suffix}') or 0)
+                remaining = headers.get(f'x-ratelimit-remaining-{suffix}')
+            except ValueError:
+                continue
+            if limit and limit < bucket.limit:
+                logger.info(f"Lowering {bucket.name} budget from {bucket.limit} to the upstream's {limit}")
+                bucket.set_limit(limit)
+            if remaining is not None and remaining.isdigit() and int(remaining) == 0:
+                reset = parse_duration(headers.get(f'x-ratelimit-reset-{suffix}'))
+                if reset:
+                    await bucket.pause(reset)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'buckets': {name: {'limit': bucket.limit, 'tokens': round(bucket.tokens, 2)} for name, bucket in self.buckets.items()},
+            'circuits': {name: {'state': breaker.state, 'failures': breaker.failures} for name, breaker in self.breakers.items()},
+            'shared': self._redis is not None,
+        }
+
+upstream_limits = UpstreamLimits()